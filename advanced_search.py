@@ -9,15 +9,44 @@
 """
 
 import os
-import time
 import argparse
-from selenium import webdriver
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from driver_pool import DRIVER_CACHE_PATH, DriverPool, configure as configure_driver
+import pipeline_metrics
+from keyword_matcher import KeywordMatcher
+from link_index import LinkIndex
+
+# 并发验证视频详情页面的浏览器数量
+SELENIUM_DRIVERS = 3
+
+# 等待搜索结果出现、滚动后等待新结果出现、等待详情页面加载的超时（秒）
+RESULTS_TIMEOUT = 15
+SCROLL_TIMEOUT = 5
+PAGE_TIMEOUT = 15
+
+# 最多滚动次数，以及搜索结果达到 max_results 的多少倍后停止滚动
+MAX_SCROLLS = 5
+CANDIDATE_FACTOR = 3
+
+VIDEO_TITLE_XPATH = "//a[@id='video-title']"
+
+# 从搜索结果页一次取回所有视频的链接、标题和简介
+COLLECT_RESULTS_JS = """
+return Array.from(document.querySelectorAll('ytd-video-renderer')).map(function (item) {
+    var link = item.querySelector('a#video-title');
+    var snippet = item.querySelector('.metadata-snippet-text, #description-text');
+    return {
+        href: link ? link.href : null,
+        title: link ? (link.getAttribute('title') || link.textContent) : '',
+        description: snippet ? snippet.textContent : ''
+    };
+});
+"""
 
 def read_keywords_config(file_path):
     """
@@ -61,34 +90,72 @@ def read_keywords_config(file_path):
         
     return keywords, limit
 
-def read_existing_links(file_path):
-    """读取现有的YouTube链接"""
-    existing_links = set()
-    
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                line = line.strip()
-                if line and line.startswith('http'):
-                    existing_links.add(line)
-    
-    return existing_links
-
-def save_links(file_path, links):
-    """保存链接到文件"""
-    mode = 'a' if os.path.exists(file_path) else 'w'
+def _load_candidates(driver, search_url, wanted):
+    """
+    打开搜索结果页，滚动加载到至少 wanted 个结果或不再有新结果为止
+    
+    Returns:
+        按搜索结果顺序排列的 (链接, 标题, 简介) 列表
+    """
+    driver.get(search_url)
     
-    with open(file_path, mode, encoding='utf-8') as file:
-        for link in links:
-            file.write(f"{link}\n")
+    # 等待第一批搜索结果出现
+    WebDriverWait(driver, RESULTS_TIMEOUT).until(
+        EC.presence_of_element_located((By.XPATH, VIDEO_TITLE_XPATH))
+    )
+    
+    # 滚动页面以加载更多结果，每次等到新结果出现，不再出现时停止
+    count = len(driver.find_elements(By.XPATH, VIDEO_TITLE_XPATH))
+    for _ in range(MAX_SCROLLS):
+        if count >= wanted:
+            break
+        driver.execute_script("window.scrollTo(0, document.documentElement.scrollHeight);")
+        try:
+            WebDriverWait(driver, SCROLL_TIMEOUT).until(
+                lambda d: len(d.find_elements(By.XPATH, VIDEO_TITLE_XPATH)) > count
+            )
+        except TimeoutException:
+            break
+        count = len(driver.find_elements(By.XPATH, VIDEO_TITLE_XPATH))
+    
+    # 一次取回所有结果的链接、标题和简介
+    candidate_videos = []
+    seen = set()
+    for item in driver.execute_script(COLLECT_RESULTS_JS):
+        href = item.get('href')
+        if href and "watch?v=" in href and href not in seen:
+            seen.add(href)
+            candidate_videos.append((href, item.get('title') or '', item.get('description') or ''))
+    return candidate_videos
+
+def _page_contains_keywords(pool, href, matcher):
+    """借用一个浏览器打开视频详情页面，检查是否包含所有关键词"""
+    try:
+        with pool.driver() as driver:
+            driver.get(href)
+            WebDriverWait(driver, PAGE_TIMEOUT).until(
+                lambda d: d.execute_script("return document.readyState") != 'loading'
+            )
+            return matcher.contains_all(driver.page_source)
+    except WebDriverException as e:
+        print(f"打开视频页面出错，跳过 {href}: {e.msg}")
+        return False
 
-def search_youtube_with_selenium(keywords, max_results=20):
+@pipeline_metrics.timed('search')
+def search_youtube_with_selenium(keywords, max_results=20, pool=None, drivers=SELENIUM_DRIVERS, on_match=None):
     """
     使用Selenium搜索YouTube视频
     
+    搜索结果页中标题和简介已经包含所有关键词的视频直接采用，不再打开详情页面；
+    其余视频由浏览器池中的多个浏览器并发打开详情页面验证。
+    结果按搜索结果的顺序判定，找到足够的视频后不再验证剩余的候选。
+    
     Args:
         keywords: 搜索关键词列表
         max_results: 最多返回的结果数量
+        pool: DriverPool实例，传入时复用其中的浏览器且不会关闭它们
+        drivers: 未传入pool时新建浏览器池的大小
+        on_match: 每确认一个符合条件的视频就立即调用的回调函数，参数为视频链接
         
     Returns:
         包含视频链接的列表
@@ -97,77 +164,92 @@ def search_youtube_with_selenium(keywords, max_results=20):
     combined_keyword = ' '.join(keywords)
     print(f"正在使用Selenium搜索同时包含关键词 '{combined_keyword}' 的YouTube视频...")
     
-    # 配置Chrome选项
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # 无头模式，不显示浏览器
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
+    own_pool = pool is None
+    if own_pool:
+        pool = DriverPool(drivers)
     
+    # 已经确认并交给 on_match 的视频，出错时也要返回
+    filtered_videos = []
     try:
-        # 初始化浏览器
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        
         # 构建搜索URL
         search_url = f"https://www.youtube.com/results?search_query={'+'.join(combined_keyword.split())}"
-        driver.get(search_url)
-        
-        # 等待页面加载
-        time.sleep(3)
-        
-        # 滚动页面以加载更多结果
-        for _ in range(5):
-            driver.execute_script("window.scrollTo(0, document.documentElement.scrollHeight);")
-            time.sleep(1)
-        
-        # 查找视频链接和标题
-        video_elements = driver.find_elements(By.XPATH, "//a[@id='video-title']")
-        
-        # 收集所有视频链接和标题
-        candidate_videos = []
-        for element in video_elements:
-            href = element.get_attribute('href')
-            title = element.get_attribute('title')
-            if href and "watch?v=" in href:
-                candidate_videos.append((href, title))
+        with pool.driver() as driver:
+            candidate_videos = _load_candidates(driver, search_url, max_results * CANDIDATE_FACTOR)
         
         # 筛选同时包含所有关键词的视频
-        filtered_videos = []
+        matcher = KeywordMatcher(keywords)
         print(f"正在验证视频是否包含所有关键词...")
         
-        for href, title in candidate_videos:
-            if len(filtered_videos) >= max_results:
-                break
-            
-            # 检查视频详情页面是否包含所有关键词
-            driver.get(href)
-            time.sleep(2)  # 等待页面加载
-            
-            page_text = driver.page_source.lower()
-            all_keywords_found = True
-            
-            for keyword in keywords:
-                if keyword.lower() not in page_text:
-                    all_keywords_found = False
-                    break
-            
-            if all_keywords_found:
+        skipped = 0
+        candidates = iter(candidate_videos)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=pool.size)
+        
+        def submit_next():
+            candidate = next(candidates, None)
+            if candidate is None:
+                return
+            href, title, description = candidate
+            if matcher.contains_all(f"{title}\n{description}"):
+                # 搜索结果中的标题和简介已经包含所有关键词，不需要打开详情页面
+                pending.append((href, None))
+            else:
+                pending.append((href, executor.submit(_page_contains_keywords, pool, href, matcher)))
+        
+        try:
+            for _ in range(pool.size):
+                submit_next()
+            while pending and len(filtered_videos) < max_results:
+                href, future = pending.popleft()
+                submit_next()
+                if future is None:
+                    skipped += 1
+                else:
+                    # 单个页面或浏览器出错只跳过这个视频，不影响其余的候选
+                    try:
+                        if not future.result():
+                            continue
+                    except Exception as e:
+                        print(f"验证视频页面出错，跳过 {href}: {e}")
+                        continue
                 filtered_videos.append(href)
                 print(f"找到符合条件的视频: {href}")
+                if on_match:
+                    on_match(href)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
         
-        driver.quit()
+        if skipped:
+            print(f"其中 {skipped} 个视频根据搜索结果中的标题和简介直接确认，没有打开详情页面")
         return filtered_videos
     
     except Exception as e:
         print(f"Selenium搜索出错: {e}")
-        return []
+        pipeline_metrics.fail(str(e))
+        if filtered_videos:
+            print(f"返回出错前已找到的 {len(filtered_videos)} 个视频")
+        return filtered_videos
+    
+    finally:
+        pipeline_metrics.add(results=len(filtered_videos))
+        if own_pool:
+            pool.close()
 
 def main():
     parser = argparse.ArgumentParser(description='使用Selenium搜索YouTube视频并保存链接')
     parser.add_argument('--keywords-file', default='keywords.txt', help='关键词文件路径 (默认: keywords.txt)')
     parser.add_argument('--limit', type=int, help='每次最多添加的新链接数量 (将覆盖配置文件中的设置)')
     parser.add_argument('--output', default='videos.txt', help='输出文件路径 (默认: videos.txt)')
+    parser.add_argument('--drivers', type=int, default=SELENIUM_DRIVERS,
+                        help=f'并发验证视频页面的浏览器数量 (默认: {SELENIUM_DRIVERS})')
+    parser.add_argument('--chromedriver', help='直接使用的ChromeDriver路径，也可以通过环境变量 CHROMEDRIVER_PATH 指定')
+    parser.add_argument('--driver-cache', default=DRIVER_CACHE_PATH,
+                        help=f'按Chrome版本缓存ChromeDriver路径的文件 (默认: {DRIVER_CACHE_PATH})')
     
     args = parser.parse_args()
+    if args.drivers <= 0:
+        parser.error("--drivers 必须是正整数")
+    configure_driver(chromedriver_path=args.chromedriver, cache_path=args.driver_cache)
     
     # 读取关键词和配置
     keywords, config_limit = read_keywords_config(args.keywords_file)
@@ -177,27 +259,25 @@ def main():
     limit = args.limit if args.limit is not None else config_limit
     print(f"每次最多添加 {limit} 个新链接")
     
-    # 读取现有链接
-    existing_links = read_existing_links(args.output)
-    print(f"已存在 {len(existing_links)} 个链接")
+    # 打开链接索引，只收录videos.txt上次同步之后新增的内容
+    index = LinkIndex(args.output)
+    print(f"已存在 {len(index)} 个视频")
     
     # 搜索新链接
-    all_links = search_youtube_with_selenium(keywords, limit * 2)  # 多获取一些以防重复
-    
-    # 过滤掉已存在的链接
-    new_links = [link for link in all_links if link not in existing_links]
+    all_links = search_youtube_with_selenium(keywords, limit * 2, drivers=args.drivers)  # 多获取一些以防重复
     
-    # 限制数量
-    new_links = new_links[:limit]
+    # 过滤掉已存在的视频并限制数量，同一视频的不同链接形式只算一个
+    new_links = index.filter_new(all_links, limit)
     
     # 保存新链接
     if new_links:
-        save_links(args.output, new_links)
+        index.add(new_links)
         print(f"已添加 {len(new_links)} 个新链接到 {args.output}")
         for i, link in enumerate(new_links, 1):
             print(f"{i}. {link}")
     else:
         print("未找到新链接")
+    index.close()
     
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+AssemblyAI异步客户端
+
+使用asyncio在单个事件循环中提交多个转录任务，
+并由一个轮询协程统一轮询所有进行中的转录ID。
+轮询间隔根据音频时长和任务的状态历史自适应调整，
+短音频可以尽快拿到结果，长音频也不会发送无意义的请求。
+
+音频上传使用固定大小的分块流式发送，内存占用与文件大小无关，
+连接中断时按指数退避重试。AssemblyAI的 /v2/upload 接口不支持断点续传，
+因此重试时需要从头发送，但不会把整个文件读入内存。
+
+服务地址可以通过环境变量 ASSEMBLYAI_BASE_URL 修改，
+便于在本地用模拟的上传、转录和轮询接口进行测试。
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import subprocess
+import aiohttp
+import requests
+import pipeline_metrics
+from http_client import get_session
+
+ASSEMBLYAI_BASE_URL = os.environ.get("ASSEMBLYAI_BASE_URL", "https://api.assemblyai.com")
+
+# 轮询间隔的上下限（秒）
+MIN_POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 30.0
+
+# 排队状态下的初始轮询间隔（秒）
+QUEUED_POLL_INTERVAL = 3.0
+
+# 等待转录结果的最长时间：预计处理时间的若干倍，且不少于30分钟
+TRANSCRIPT_WAIT_FACTOR = 4
+TRANSCRIPT_MIN_WAIT = 30 * 60
+
+# 转录任务的所有状态，轮询得到其他值时认为接口返回了错误
+TRANSCRIPT_STATUSES = ('queued', 'processing', 'completed', 'error')
+
+# 上传分块大小、最大重试次数和退避时间（秒）
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+UPLOAD_MAX_RETRIES = 5
+UPLOAD_BACKOFF_BASE = 2.0
+UPLOAD_BACKOFF_MAX = 60.0
+
+# 默认转录参数，同步和异步两种方式共用
+DEFAULT_TRANSCRIPT_OPTIONS = {
+    "language_code": "zh",
+    "punctuate": True,
+    "format_text": True,
+}
+
+class AssemblyAIError(Exception):
+    """AssemblyAI接口返回错误或转录失败"""
+
+def probe_audio_duration(audio_file):
+    """
+    使用ffprobe获取音频时长
+
+    Args:
+        audio_file: 音频文件路径
+
+    Returns:
+        音频时长（秒），无法获取时返回None
+    """
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', audio_file],
+            capture_output=True, text=True, check=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+def upload_backoff(attempt):
+    """第 attempt 次重试前的等待时间，指数退避并加入随机抖动"""
+    return min(UPLOAD_BACKOFF_MAX, UPLOAD_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+def iter_file_chunks(audio_file, chunk_size=UPLOAD_CHUNK_SIZE, sent=None):
+    """
+    按固定大小分块读取文件
+
+    Args:
+        audio_file: 文件路径
+        chunk_size: 分块大小（字节）
+        sent: 可选的单元素列表，用于累计已经交给网络层的字节数
+    """
+    with open(audio_file, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            if sent is not None:
+                sent[0] += len(chunk)
+            yield chunk
+
+def _report_upload(total, elapsed, attempts):
+    """打印上传吞吐量"""
+    rate = total / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+    print(f"上传完成: {total / 1024 / 1024:.1f} MB，用时 {elapsed:.1f} 秒，"
+          f"{rate:.2f} MB/s，尝试 {attempts} 次")
+
+def is_retryable_status(status_code):
+    """服务端错误和限流可以重试，其余错误重试也不会成功"""
+    return status_code >= 500 or status_code == 429
+
+@pipeline_metrics.timed('upload')
+def stream_upload(audio_file, api_key, base_url=ASSEMBLYAI_BASE_URL, chunk_size=UPLOAD_CHUNK_SIZE,
+                  max_retries=UPLOAD_MAX_RETRIES, timeout=(10, 300)):
+    """
+    分块流式上传音频文件，连接中断或服务端错误时按指数退避重试
+
+    Args:
+        audio_file: 音频文件路径
+        api_key: AssemblyAI API密钥
+        base_url: 服务地址
+        chunk_size: 分块大小（字节），决定上传时的内存占用
+        max_retries: 最大重试次数
+        timeout: (连接超时, 读取超时) 秒
+
+    Returns:
+        服务端返回的 upload_url，多次重试仍失败时抛出 AssemblyAIError
+    """
+    total = os.path.getsize(audio_file)
+    started = time.monotonic()
+    error = None
+    for attempt in range(max_retries + 1):
+        sent = [0]
+        try:
+            response = get_session().post(
+                f"{base_url.rstrip('/')}/v2/upload",
+                headers={"authorization": api_key},
+                data=iter_file_chunks(audio_file, chunk_size, sent),
+                timeout=timeout
+            )
+            pipeline_metrics.status(response.status_code)
+            if response.status_code == 200:
+                _report_upload(total, time.monotonic() - started, attempt + 1)
+                return response.json()["upload_url"]
+            if not is_retryable_status(response.status_code):
+                raise AssemblyAIError(f"上传失败: {response.text}")
+            error = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            error = str(e)
+        finally:
+            pipeline_metrics.add(bytes=sent[0])
+        if attempt < max_retries:
+            pipeline_metrics.add(retries=1)
+            delay = upload_backoff(attempt)
+            print(f"上传中断 (已发送 {sent[0]}/{total} 字节): {error}，"
+                  f"{delay:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+    raise AssemblyAIError(f"上传失败，已重试 {max_retries} 次: {error}")
+
+def record_asr_timing(submitted, processing_since, ok=True, span=None):
+    """
+    把转录任务排队和处理的时间记录为运行指标
+
+    Args:
+        submitted: 提交任务时的 time.monotonic()
+        processing_since: 第一次轮询到 processing 状态时的 time.monotonic()，没有轮询到时为None
+        ok: 任务是否成功完成
+        span: 所属的指标阶段，默认为当前阶段
+    """
+    now = time.monotonic()
+    pipeline_metrics.observe('asr_queued', (processing_since or now) - submitted, span=span,
+                             ok=ok or processing_since is not None)
+    if processing_since is not None:
+        pipeline_metrics.observe('asr_processing', now - processing_since, span=span, ok=ok)
+
+def estimate_processing_time(audio_duration):
+    """
+    估算服务端处理一段音频所需的时间
+
+    Args:
+        audio_duration: 音频时长（秒），未知时为None
+
+    Returns:
+        预计处理时间（秒）
+    """
+    if not audio_duration:
+        return 15.0
+    return max(3.0, audio_duration * 0.25)
+
+def max_transcript_wait(audio_duration):
+    """
+    等待一个转录任务完成的最长时间，超过后放弃该任务
+
+    Args:
+        audio_duration: 音频时长（秒），未知时为None
+
+    Returns:
+        最长等待时间（秒）
+    """
+    return max(TRANSCRIPT_MIN_WAIT, estimate_processing_time(audio_duration) * TRANSCRIPT_WAIT_FACTOR)
+
+def next_poll_interval(audio_duration, status, time_in_status, polls_in_status):
+    """
+    根据音频时长和任务状态历史计算下一次轮询前的等待时间
+
+    - 排队中 (queued)：无法预估等待时间，按指数退避
+    - 处理中 (processing)：在预计完成时间之前按剩余时间的一半逐步逼近，
+      超过预计时间后按超出的比例逐步放宽
+
+    Args:
+        audio_duration: 音频时长（秒），未知时为None
+        status: 最近一次轮询得到的状态
+        time_in_status: 任务处于当前状态的时间（秒）
+        polls_in_status: 当前状态下已经轮询的次数
+
+    Returns:
+        等待时间（秒）
+    """
+    if status == "queued":
+        interval = QUEUED_POLL_INTERVAL * (1.5 ** polls_in_status)
+    else:
+        remaining = estimate_processing_time(audio_duration) - time_in_status
+        if remaining > 0:
+            interval = remaining / 2
+        else:
+            interval = -remaining * 0.25
+    return min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, interval))
+
+class AsyncAssemblyAIClient:
+    """
+    AssemblyAI异步客户端
+
+    用法:
+        async with AsyncAssemblyAIClient(api_key) as client:
+            results = await client.transcribe_many(audio_files)
+    """
+
+    def __init__(self, api_key, base_url=ASSEMBLYAI_BASE_URL, max_concurrent_uploads=4,
+                 request_timeout=120, transcript_options=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.request_timeout = request_timeout
+        self.transcript_options = dict(transcript_options or DEFAULT_TRANSCRIPT_OPTIONS)
+        self._upload_semaphore = asyncio.Semaphore(max_concurrent_uploads)
+        self._session = None
+        self._jobs = {}
+        self._poller = None
+        self._wakeup = asyncio.Event()
+        self.poll_count = 0
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            headers={"authorization": self.api_key},
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """取消轮询协程并关闭HTTP会话"""
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        for job in self._jobs.values():
+            if not job['future'].done():
+                job['future'].cancel()
+        self._jobs.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @pipeline_metrics.timed('upload')
+    async def upload(self, audio_file, chunk_size=UPLOAD_CHUNK_SIZE, max_retries=UPLOAD_MAX_RETRIES):
+        """
+        分块流式上传音频文件，连接中断或服务端错误时按指数退避重试
+
+        Args:
+            audio_file: 音频文件路径
+            chunk_size: 分块大小（字节）
+            max_retries: 最大重试次数
+
+        Returns:
+            服务端返回的 upload_url
+        """
+        total = os.path.getsize(audio_file)
+        async with self._upload_semaphore:
+            started = time.monotonic()
+            error = None
+            for attempt in range(max_retries + 1):
+                sent = [0]
+                try:
+                    async with self._session.post(
+                        f"{self.base_url}/v2/upload",
+                        data=self._aiter_file_chunks(audio_file, chunk_size, sent),
+                        timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=300),
+                    ) as response:
+                        pipeline_metrics.status(response.status)
+                        if response.status == 200:
+                            _report_upload(total, time.monotonic() - started, attempt + 1)
+                            return (await response.json())["upload_url"]
+                        if not is_retryable_status(response.status):
+                            raise AssemblyAIError(f"上传失败: {await response.text()}")
+                        error = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = str(e) or type(e).__name__
+                finally:
+                    pipeline_metrics.add(bytes=sent[0])
+                if attempt < max_retries:
+                    pipeline_metrics.add(retries=1)
+                    delay = upload_backoff(attempt)
+                    print(f"上传中断 (已发送 {sent[0]}/{total} 字节): {error}，"
+                          f"{delay:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
+                    await asyncio.sleep(delay)
+            raise AssemblyAIError(f"上传失败，已重试 {max_retries} 次: {error}")
+
+    @staticmethod
+    async def _aiter_file_chunks(audio_file, chunk_size, sent):
+        """在线程中按固定大小读取文件，避免阻塞事件循环"""
+        with open(audio_file, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if not chunk:
+                    return
+                sent[0] += len(chunk)
+                yield chunk
+
+    async def submit(self, upload_url):
+        """
+        提交转录任务
+
+        Args:
+            upload_url: 音频的 upload_url
+
+        Returns:
+            转录任务ID
+        """
+        payload = dict(self.transcript_options, audio_url=upload_url)
+        async with self._session.post(f"{self.base_url}/v2/transcript", json=payload) as response:
+            pipeline_metrics.status(response.status)
+            data = await response.json()
+            if response.status != 200 or "id" not in data:
+                raise AssemblyAIError(f"提交转录任务失败: {data}")
+            return data["id"]
+
+    def wait(self, transcript_id, audio_duration=None):
+        """
+        登记一个进行中的转录任务，由统一的轮询协程负责轮询
+
+        Args:
+            transcript_id: 转录任务ID
+            audio_duration: 音频时长（秒），用于计算轮询间隔
+
+        Returns:
+            转录完成时返回完整结果JSON的Future
+        """
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._jobs[transcript_id] = {
+            'future': future,
+            'audio_duration': audio_duration,
+            'status': 'queued',
+            'status_since': now,
+            'polls_in_status': 0,
+            'submitted': now,
+            'deadline': now + max_transcript_wait(audio_duration),
+            'processing_since': None,
+            # 所有任务由同一个轮询协程轮询，需要记下任务所属的指标阶段
+            'metrics_span': pipeline_metrics.current(),
+            'next_poll': now + next_poll_interval(audio_duration, 'queued', 0, 0),
+        }
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll_loop())
+        self._wakeup.set()
+        return future
+
+    async def transcribe(self, audio_file, audio_duration=None, upload_url=None, on_upload=None):
+        """
+        上传、提交并等待单个音频文件的转录结果
+
+        Args:
+            audio_file: 音频文件路径
+            audio_duration: 音频时长（秒），未提供时使用ffprobe获取
+            upload_url: 之前已经上传得到的 upload_url，提供时跳过上传
+            on_upload: 上传完成后以 upload_url 为参数调用的回调函数
+
+        Returns:
+            完整的转录结果JSON
+        """
+        if audio_duration is None and audio_file:
+            audio_duration = await asyncio.to_thread(probe_audio_duration, audio_file)
+        transcript_id = None
+        if upload_url is not None:
+            try:
+                transcript_id = await self.submit(upload_url)
+            except AssemblyAIError as e:
+                # 之前上传的音频可能已经失效，本地音频还在时重新上传
+                if not (audio_file and os.path.exists(audio_file)):
+                    raise
+                print(f"之前上传的音频无法使用，重新上传: {e}")
+        if transcript_id is None:
+            upload_url = await self.upload(audio_file)
+            if on_upload:
+                on_upload(upload_url)
+            transcript_id = await self.submit(upload_url)
+        print(f"已提交转录任务: {transcript_id}")
+        return await self.wait(transcript_id, audio_duration)
+
+    async def transcribe_many(self, audio_files, audio_durations=None):
+        """
+        并发转录多个音频文件，每个文件的失败互不影响
+
+        Args:
+            audio_files: 音频文件路径列表
+            audio_durations: 与audio_files对应的音频时长列表，可选
+
+        Returns:
+            与输入顺序一致的列表，成功为结果JSON，失败为对应的异常
+        """
+        durations = audio_durations or [None] * len(audio_files)
+        return await asyncio.gather(
+            *(self.transcribe(f, d) for f, d in zip(audio_files, durations)),
+            return_exceptions=True
+        )
+
+    async def _poll_loop(self):
+        """统一轮询所有进行中的转录任务"""
+        while self._jobs:
+            now = time.monotonic()
+            due = [tid for tid, job in self._jobs.items() if job['next_poll'] <= now]
+            if not due:
+                wait_time = min(job['next_poll'] for job in self._jobs.values()) - now
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait_time)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await asyncio.gather(*(self._poll_one(tid) for tid in due))
+
+    async def _poll_one(self, transcript_id):
+        """轮询单个转录任务并更新其状态，出错时只结束这一个任务，不影响其他任务的轮询"""
+        job = self._jobs[transcript_id]
+        try:
+            await self._poll_job(transcript_id, job)
+        except Exception as e:
+            if not isinstance(e, AssemblyAIError):
+                e = AssemblyAIError(f"轮询 {transcript_id} 出错: {e}")
+            self._fail_job(transcript_id, job, e)
+
+    def _fail_job(self, transcript_id, job, error):
+        """结束一个失败的任务"""
+        self._jobs.pop(transcript_id, None)
+        record_asr_timing(job['submitted'], job['processing_since'], ok=False, span=job['metrics_span'])
+        if not job['future'].done():
+            job['future'].set_exception(error)
+
+    async def _poll_job(self, transcript_id, job):
+        self.poll_count += 1
+        pipeline_metrics.add(polls=1, span=job['metrics_span'])
+        try:
+            async with self._session.get(f"{self.base_url}/v2/transcript/{transcript_id}") as response:
+                pipeline_metrics.status(response.status, span=job['metrics_span'])
+                if is_retryable_status(response.status):
+                    raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                      status=response.status)
+                if response.status != 200:
+                    raise AssemblyAIError(f"查询转录任务失败 (HTTP {response.status}): {await response.text()}")
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # 网络错误和服务端暂时不可用不结束任务，按当前状态稍后重试
+            print(f"轮询 {transcript_id} 出错: {e}")
+            data = {"status": job['status']}
+
+        status = data.get("status")
+        if status not in TRANSCRIPT_STATUSES:
+            raise AssemblyAIError(f"查询转录任务返回了未知的状态: {data}")
+        if status == "processing" and job['processing_since'] is None:
+            job['processing_since'] = time.monotonic()
+        if status == "completed":
+            del self._jobs[transcript_id]
+            record_asr_timing(job['submitted'], job['processing_since'], span=job['metrics_span'])
+            print(f"转录完成: {transcript_id}")
+            job['future'].set_result(data)
+            return
+        if status == "error":
+            raise AssemblyAIError(f"转录出错: {data.get('error')}")
+
+        now = time.monotonic()
+        if now >= job['deadline']:
+            raise AssemblyAIError(f"等待转录结果超时 ({now - job['submitted']:.0f} 秒): {transcript_id}")
+        if status != job['status']:
+            job['status'] = status
+            job['status_since'] = now
+            job['polls_in_status'] = 0
+        else:
+            job['polls_in_status'] += 1
+        job['next_poll'] = min(job['deadline'], now + next_poll_interval(
+            job['audio_duration'], status, now - job['status_since'], job['polls_in_status']
+        ))
+
+class BackgroundAssemblyAIClient:
+    """
+    在后台线程中运行的AssemblyAI异步客户端
+
+    供流水线等多线程代码使用：任意线程调用 transcribe() 都会阻塞等待结果，
+    而所有上传、提交和轮询请求都在同一个后台事件循环中完成。
+    """
+
+    def __init__(self, api_key, **client_kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name="assemblyai-loop", daemon=True)
+        self._thread.start()
+        self._client = self._call(self._open(api_key, client_kwargs))
+
+    async def _open(self, api_key, client_kwargs):
+        return await AsyncAssemblyAIClient(api_key, **client_kwargs).__aenter__()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def transcribe_result(self, audio_file, audio_duration=None, upload_url=None, on_upload=None):
+        """
+        转录单个音频文件，阻塞直到完成
+
+        Returns:
+            完整的转录结果JSON，失败时返回None
+        """
+        try:
+            return self._call(self._client.transcribe(audio_file, audio_duration,
+                                                      upload_url=upload_url, on_upload=on_upload))
+        except Exception as e:
+            print(f"转录过程中出错: {e}")
+            return None
+
+    def transcribe(self, audio_file, audio_duration=None):
+        """
+        转录单个音频文件，阻塞直到完成
+
+        Returns:
+            转录文本，失败时返回None
+        """
+        result = self.transcribe_result(audio_file, audio_duration)
+        return result["text"] if result else None
+
+    def close(self):
+        """关闭客户端并停止后台事件循环"""
+        self._call(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+def transcribe_files(audio_files, api_key, **client_kwargs):
+    """
+    同步接口：在一个事件循环中并发转录多个音频文件
+
+    Args:
+        audio_files: 音频文件路径列表
+        api_key: AssemblyAI API密钥
+
+    Returns:
+        与输入顺序一致的列表，成功为结果JSON，失败为对应的异常
+    """
+    async def run():
+        async with AsyncAssemblyAIClient(api_key, **client_kwargs) as client:
+            return await client.transcribe_many(audio_files)
+    return asyncio.run(run())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+长音频分段并发转录
+
+两小时的课程视频作为一个任务提交时，等待时间就是语音识别服务处理整段音频的时间。
+AudioSegmenter 在静音处把长音频切成指定长度左右的片段，同时提交所有片段，
+再按顺序拼接识别结果：词的时间戳加上片段的起始时间，片段衔接处重复识别的词被去掉。
+最长视频的等待时间大致按片段数成比例缩短。
+
+切分点优先选在目标长度附近最长的一段静音中间；附近找不到静音时在目标长度处直接切开，
+相邻片段重叠几秒，避免切断的词丢失，重叠部分识别出的重复内容在拼接时去掉。
+"""
+
+import os
+import re
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import pipeline_metrics
+from audio_vad import FRAME_MS, OUTPUT_BITRATE, SAMPLE_RATE, find_silences, frame_energies, speech_threshold
+
+# 默认片段长度（秒）
+SEGMENT_SECONDS = 600
+
+# 每个视频同时转录的片段数
+SEGMENT_WORKERS = 4
+
+# 在目标长度前后这一比例的范围内寻找静音作为切分点
+SEARCH_WINDOW = 0.1
+
+# 作为切分点的静音至少持续的秒数
+MIN_CUT_SILENCE = 0.3
+
+# 找不到静音、直接切开时相邻片段重叠的秒数
+OVERLAP_SECONDS = 2.0
+
+# 拼接时在衔接处最多比较的词数，以及判断为重复时允许的时间误差（秒）
+DEDUP_MAX_WORDS = 8
+DEDUP_TOLERANCE = 1.0
+
+# 比较词是否相同时忽略的标点和空白
+_PUNCTUATION = re.compile(r'[\s\.,!?;:，。！？；：、…"“”\'‘’]+')
+
+def plan_segments(energies, duration, segment_seconds=SEGMENT_SECONDS):
+    """
+    根据每帧能量计算片段的切分方式
+
+    Args:
+        energies: frame_energies 返回的每帧能量
+        duration: 音频时长（秒）
+        segment_seconds: 目标片段长度（秒）
+
+    Returns:
+        [(起点, 终点), ...]，单位为秒；在静音处切分的相邻片段首尾相接，
+        直接切开的相邻片段重叠 OVERLAP_SECONDS 秒
+    """
+    frame_sec = FRAME_MS / 1000
+    starts, ends = find_silences(energies, speech_threshold(energies), min_silence=MIN_CUT_SILENCE)
+    mids = (starts + ends) * frame_sec / 2
+    widths = (ends - starts) * frame_sec
+    window = segment_seconds * SEARCH_WINDOW
+
+    spans = []
+    start = 0.0
+    # 剩余部分不超过1.5个片段时不再切分，避免末尾出现很短的片段
+    while duration - start > segment_seconds * 1.5:
+        target = start + segment_seconds
+        lo, hi = np.searchsorted(mids, [target - window, target + window])
+        if hi > lo:
+            cut = float(mids[lo + np.argmax(widths[lo:hi])])
+            spans.append((start, cut))
+            start = cut
+        else:
+            spans.append((start, target))
+            start = target - OVERLAP_SECONDS
+    spans.append((start, duration))
+    return spans
+
+def _normalize_word(text):
+    return _PUNCTUATION.sub('', text).lower()
+
+def _strip_leading_words(text, words):
+    """从文本开头去掉给定的词，找不到对应位置时保留原文"""
+    position = 0
+    for word in words:
+        index = text.find(word['text'], position)
+        if index < 0 or text[position:index].strip(' \t\n,.，。、'):
+            return text
+        position = index + len(word['text'])
+    return text[position:].lstrip(' \t\n,.，。、')
+
+def _join_text(left, right):
+    if not left or not right:
+        return left or right
+    if left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return f"{left} {right}"
+    return left + right
+
+def stitch_results(results, spans):
+    """
+    按顺序拼接各片段的识别结果
+
+    词的时间戳（毫秒）加上片段的起始时间；后一个片段开头完全落在与前一个片段重叠范围内的词，
+    以及与前一个片段结尾相同、时间也相近的词被视为重复并去掉，文本中也去掉相应的内容。
+
+    Args:
+        results: 各片段的识别结果字典，包含 text，可以带有 words
+        spans: plan_segments 返回的片段列表
+
+    Returns:
+        拼接后的识别结果字典
+    """
+    text = ''
+    words = []
+    for result, (start, end) in zip(results, spans):
+        offset = int(round(start * 1000))
+        segment_words = [dict(word, start=word['start'] + offset, end=word['end'] + offset)
+                         for word in result.get('words') or []]
+        segment_text = result.get('text') or ''
+        if words and segment_words:
+            previous_end = words[-1]['end']
+            dropped = 0
+            # 重叠范围内前一个片段已经识别过的词
+            while dropped < len(segment_words) and segment_words[dropped]['end'] <= previous_end:
+                dropped += 1
+            # 衔接处前后相同的词
+            limit = min(DEDUP_MAX_WORDS, len(words), len(segment_words) - dropped)
+            tolerance = DEDUP_TOLERANCE * 1000
+            for size in range(limit, 0, -1):
+                head = segment_words[dropped:dropped + size]
+                if (head[0]['start'] <= previous_end + tolerance
+                        and [_normalize_word(w['text']) for w in words[-size:]]
+                        == [_normalize_word(w['text']) for w in head]):
+                    dropped += size
+                    break
+            if dropped:
+                segment_text = _strip_leading_words(segment_text, segment_words[:dropped])
+                segment_words = segment_words[dropped:]
+        words.extend(segment_words)
+        text = _join_text(text, segment_text)
+    return {
+        'text': text,
+        'words': words,
+        'audio_duration': spans[-1][1] if spans else None,
+        'segments': [[round(start, 3), round(end, 3)] for start, end in spans],
+    }
+
+class AudioSegmenter:
+    """
+    把长音频切成片段并发转录，可以在多个线程之间共享
+
+    Args:
+        segment_seconds: 目标片段长度（秒）
+        workers: 每个视频同时转录的片段数
+    """
+
+    def __init__(self, segment_seconds=SEGMENT_SECONDS, workers=SEGMENT_WORKERS):
+        self.segment_seconds = segment_seconds
+        self.workers = workers
+
+    def plan(self, audio_file, audio_duration=None):
+        """
+        计算音频的切分方式
+
+        Args:
+            audio_file: 音频文件路径
+            audio_duration: 已知的音频时长（秒），明显不需要切分时跳过解码
+
+        Returns:
+            片段列表，不需要切分时只有一个片段
+        """
+        if audio_duration is not None and audio_duration <= self.segment_seconds * 1.5:
+            return [(0.0, float(audio_duration))]
+        energies, total = frame_energies(audio_file)
+        return plan_segments(energies, total / SAMPLE_RATE, self.segment_seconds)
+
+    def _cut(self, audio_file, index, start, end):
+        output_file = f"{os.path.splitext(audio_file)[0]}.seg{index:03d}.mp3"
+        subprocess.run(
+            ['ffmpeg', '-y', '-v', 'error', '-nostdin', '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}",
+             '-i', audio_file, '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-b:a', OUTPUT_BITRATE, output_file],
+            check=True, capture_output=True,
+        )
+        return output_file
+
+    def _transcribe_segment(self, audio_file, backend, index, start, end):
+        segment_file = self._cut(audio_file, index, start, end)
+        try:
+            return backend.transcribe(segment_file, audio_duration=end - start)
+        finally:
+            if os.path.exists(segment_file):
+                os.remove(segment_file)
+
+    def transcribe(self, audio_file, spans, backend):
+        """
+        切出各片段并同时提交给语音识别后端，全部完成后拼接结果
+
+        Args:
+            audio_file: 音频文件路径
+            spans: plan 返回的片段列表
+            backend: TranscriptionBackend实例
+
+        Returns:
+            拼接后的识别结果字典，任一片段失败时返回None
+        """
+        print(f"音频分为 {len(spans)} 段同时转录，每段约 {self.segment_seconds / 60:.0f} 分钟")
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(spans))) as executor:
+            # 各片段的上传和轮询计入调用方所在的指标阶段
+            transcribe_segment = pipeline_metrics.bind(self._transcribe_segment)
+            futures = [executor.submit(transcribe_segment, audio_file, backend, i, start, end)
+                       for i, (start, end) in enumerate(spans)]
+            results = [future.result() for future in futures]
+        failed = sum(result is None for result in results)
+        if failed:
+            print(f"{failed} 个片段转录失败")
+            return None
+        return stitch_results(results, spans)
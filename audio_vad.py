@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+基于能量的静音检测与裁剪
+
+课程和风水频道的视频常有很长的片头、配乐和停顿，语音识别服务按音频时长计费，
+上传前把其中较长的静音压缩掉可以同时减少上传的字节数和计费时长。
+
+音频由ffmpeg解码为16kHz单声道PCM，按块读入NumPy数组后计算每一帧的能量，
+不需要把整段音频放在内存中。低于自适应阈值且持续足够长的片段视为静音，
+压缩为一小段短暂停顿后重新编码；同时生成时间映射，把识别结果中的时间戳
+换算回原始视频的时间。
+"""
+
+import os
+import threading
+import subprocess
+import numpy as np
+
+# 分析和输出使用的采样率与输出码率，与语音识别转码的设置一致
+SAMPLE_RATE = 16000
+OUTPUT_BITRATE = '32k'
+
+# 分析帧长（毫秒）
+FRAME_MS = 30
+
+# 短于该时长（秒）的停顿保持不变，更长的静音被压缩
+MIN_SILENCE = 1.0
+
+# 每段被压缩的静音保留的时长（秒），一半留在前面的语音之后，一半留在后面的语音之前
+KEEP_SILENCE = 0.3
+
+# 静音阈值：比背景噪声高出的分贝数
+MARGIN_DB = 12.0
+
+# 阈值至少比响亮部分低这么多分贝，动态范围很小的音频不会被裁剪
+MIN_HEADROOM_DB = 20.0
+
+# 低于该能量（dBFS）的帧总是视为静音
+ABSOLUTE_SILENCE_DB = -55.0
+
+# 可以移除的时长占比低于该值时不重新编码，直接上传原始音频
+MIN_REMOVED_SHARE = 0.05
+
+# 每次从ffmpeg读取的帧数（约1分钟）
+_BLOCK_FRAMES = 2000
+
+def _decode_command(audio_file):
+    return ['ffmpeg', '-v', 'error', '-nostdin', '-i', audio_file,
+            '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', '-']
+
+def iter_pcm_blocks(audio_file, block_samples):
+    """
+    用ffmpeg解码音频，按块产生16位单声道PCM样本
+
+    Args:
+        audio_file: 音频文件路径
+        block_samples: 每块的样本数，最后一块可能较短
+
+    Yields:
+        int16 NumPy数组
+    """
+    proc = subprocess.Popen(_decode_command(audio_file), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        block_bytes = block_samples * 2
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+        stderr = proc.stderr.read()
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+        proc.stderr.close()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg解码失败: {stderr.decode('utf-8', errors='replace').strip()}")
+
+def frame_energies(audio_file, frame_ms=FRAME_MS):
+    """
+    计算每一帧的能量
+
+    Returns:
+        (每帧能量的dBFS数组, 总样本数) 元组，最后不足一帧的样本按补零后的帧计算
+    """
+    frame_len = SAMPLE_RATE * frame_ms // 1000
+    energies = []
+    total = 0
+    for block in iter_pcm_blocks(audio_file, frame_len * _BLOCK_FRAMES):
+        total += len(block)
+        samples = block.astype(np.float32) / 32768.0
+        padding = -len(samples) % frame_len
+        if padding:
+            samples = np.concatenate((samples, np.zeros(padding, dtype=np.float32)))
+        power = np.mean(np.square(samples.reshape(-1, frame_len)), axis=1)
+        energies.append(10.0 * np.log10(power + 1e-10))
+    if not energies:
+        return np.zeros(0, dtype=np.float32), 0
+    return np.concatenate(energies), total
+
+def speech_threshold(energies, margin_db=MARGIN_DB):
+    """
+    根据能量分布计算静音阈值
+
+    背景噪声取能量的第10百分位，响亮部分取第95百分位；阈值为噪声加上 margin_db，
+    但不超过响亮部分减去 MIN_HEADROOM_DB，也不低于 ABSOLUTE_SILENCE_DB。
+    """
+    floor, loud = np.percentile(energies, [10, 95])
+    return max(min(floor + margin_db, loud - MIN_HEADROOM_DB), ABSOLUTE_SILENCE_DB)
+
+def _runs(mask):
+    """布尔数组中值为True的连续片段，返回 (起点数组, 终点数组)"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def find_silences(energies, threshold, frame_ms=FRAME_MS, min_silence=MIN_SILENCE):
+    """
+    找出持续至少 min_silence 秒的静音片段
+
+    Returns:
+        (起始帧数组, 结束帧数组)，结束帧不包含在片段内
+    """
+    starts, ends = _runs(energies < threshold)
+    long_enough = (ends - starts) * frame_ms >= min_silence * 1000
+    return starts[long_enough], ends[long_enough]
+
+class TimeMap:
+    """
+    裁剪后音频的时间到原始音频时间的映射
+
+    Args:
+        spans: 保留下来的原始音频片段 [(起点, 终点), ...]，单位为秒，按时间排列且互不重叠
+        original_duration: 原始音频时长（秒）
+    """
+
+    def __init__(self, spans, original_duration):
+        spans = np.asarray(spans, dtype=np.float64).reshape(-1, 2)
+        self.starts = spans[:, 0]
+        self.ends = spans[:, 1]
+        lengths = self.ends - self.starts
+        self.offsets = np.concatenate(([0.0], np.cumsum(lengths)[:-1])) if len(spans) else np.zeros(0)
+        self.original_duration = float(original_duration)
+        self.output_duration = float(lengths.sum())
+
+    @property
+    def removed_seconds(self):
+        return self.original_duration - self.output_duration
+
+    @property
+    def removed_share(self):
+        return self.removed_seconds / self.original_duration if self.original_duration else 0.0
+
+    def to_original(self, seconds, end=False):
+        """
+        把裁剪后音频中的时间换算为原始音频中的时间
+
+        Args:
+            seconds: 时间或时间数组（秒）
+            end: 是否为结束时间，恰好落在两个片段衔接处的结束时间归入前一个片段
+
+        Returns:
+            与输入形状相同的原始时间
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        if not len(self.starts):
+            return seconds
+        side = 'left' if end else 'right'
+        index = np.clip(np.searchsorted(self.offsets, seconds, side=side) - 1, 0, len(self.starts) - 1)
+        within = np.clip(seconds - self.offsets[index], 0.0, self.ends[index] - self.starts[index])
+        return self.starts[index] + within
+
+    def map_words(self, words):
+        """把AssemblyAI风格的词列表（毫秒时间戳）换算到原始音频的时间上，返回新的列表"""
+        if not words:
+            return words
+        starts = self.to_original(np.array([word['start'] for word in words]) / 1000.0)
+        ends = self.to_original(np.array([word['end'] for word in words]) / 1000.0, end=True)
+        return [dict(word, start=int(round(start * 1000)), end=int(round(end * 1000)))
+                for word, start, end in zip(words, starts, ends)]
+
+    def apply(self, result):
+        """把识别结果中的时间戳换算到原始音频的时间上，并记录裁剪情况，返回新的结果字典"""
+        result = dict(result)
+        if result.get('words'):
+            result['words'] = self.map_words(result['words'])
+        result['audio_duration'] = self.original_duration
+        result['silence_trim'] = {
+            'original_duration': round(self.original_duration, 3),
+            'removed_seconds': round(self.removed_seconds, 3),
+            'spans': [[round(start, 3), round(end, 3)] for start, end in zip(self.starts, self.ends)],
+        }
+        return result
+
+class SilenceTrimmer:
+    """
+    上传前压缩音频中较长的静音，可以在多个线程之间共享
+
+    Args:
+        min_silence: 短于该时长（秒）的停顿保持不变
+        keep_silence: 每段被压缩的静音保留的时长（秒）
+        margin_db: 静音阈值比背景噪声高出的分贝数
+        min_removed_share: 可以移除的时长占比低于该值时不裁剪
+    """
+
+    # 裁剪后的识别结果与未裁剪的分开缓存
+    cache_tag = 'vad'
+
+    def __init__(self, min_silence=MIN_SILENCE, keep_silence=KEEP_SILENCE, margin_db=MARGIN_DB,
+                 min_removed_share=MIN_REMOVED_SHARE):
+        self.min_silence = min_silence
+        self.keep_silence = keep_silence
+        self.margin_db = margin_db
+        self.min_removed_share = min_removed_share
+        self._lock = threading.Lock()
+        self._stats = {'files': 0, 'trimmed': 0, 'original_seconds': 0.0, 'removed_seconds': 0.0,
+                       'original_bytes': 0, 'uploaded_bytes': 0}
+
+    def plan(self, audio_file):
+        """
+        分析音频，计算要保留的片段
+
+        Returns:
+            TimeMap，音频为空时返回None
+        """
+        energies, total = frame_energies(audio_file)
+        if not total:
+            return None
+        duration = total / SAMPLE_RATE
+        frame_sec = FRAME_MS / 1000
+        starts, ends = find_silences(energies, speech_threshold(energies, self.margin_db),
+                                     min_silence=self.min_silence)
+
+        # 中间的静音两端各保留一半 keep_silence，开头和结尾的静音只保留紧挨语音的一半
+        pad = self.keep_silence / 2
+        cut_starts = np.where(starts == 0, 0.0, starts * frame_sec + pad)
+        cut_ends = np.where(ends == len(energies), duration, np.minimum(ends * frame_sec, duration) - pad)
+        valid = cut_ends > cut_starts
+        cut_starts, cut_ends = cut_starts[valid], cut_ends[valid]
+
+        span_starts = np.concatenate(([0.0], cut_ends))
+        span_ends = np.concatenate((cut_starts, [duration]))
+        keep = span_ends > span_starts
+        return TimeMap(np.column_stack((span_starts[keep], span_ends[keep])), duration)
+
+    def should_trim(self, time_map):
+        """可以移除的时长达到 min_removed_share 时才值得重新编码"""
+        return (time_map is not None and time_map.output_duration > 0
+                and time_map.removed_share >= self.min_removed_share)
+
+    def write(self, audio_file, time_map, output_file):
+        """再次解码音频，只把保留的片段送入编码器"""
+        starts = np.round(time_map.starts * SAMPLE_RATE).astype(np.int64)
+        ends = np.round(time_map.ends * SAMPLE_RATE).astype(np.int64)
+        encoder = subprocess.Popen(
+            ['ffmpeg', '-y', '-v', 'error', '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', '-',
+             '-ac', '1', '-ar', str(SAMPLE_RATE), '-b:a', OUTPUT_BITRATE, output_file],
+            stdin=subprocess.PIPE,
+        )
+        try:
+            position = 0
+            for block in iter_pcm_blocks(audio_file, SAMPLE_RATE * 60):
+                block_end = position + len(block)
+                # 与当前块重叠的保留片段
+                first = np.searchsorted(ends, position, side='right')
+                last = np.searchsorted(starts, block_end, side='left')
+                for start, end in zip(starts[first:last], ends[first:last]):
+                    encoder.stdin.write(block[max(start, position) - position:min(end, block_end) - position].tobytes())
+                position = block_end
+        finally:
+            encoder.stdin.close()
+            returncode = encoder.wait()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg编码失败，退出码 {returncode}")
+        return output_file
+
+    def trim(self, audio_file):
+        """
+        压缩音频中的静音，打印移除的时长占比和节省的上传字节数
+
+        Returns:
+            (裁剪后的文件路径, TimeMap)，不值得裁剪时返回 (None, None)
+        """
+        time_map = self.plan(audio_file)
+        original_bytes = os.path.getsize(audio_file)
+        if not self.should_trim(time_map):
+            self._record(time_map, 0.0, original_bytes, original_bytes)
+            print("静音检测: 可移除的静音很少，上传原始音频")
+            return None, None
+
+        output_file = os.path.splitext(audio_file)[0] + '.vad.mp3'
+        self.write(audio_file, time_map, output_file)
+        uploaded_bytes = os.path.getsize(output_file)
+        self._record(time_map, time_map.removed_seconds, original_bytes, uploaded_bytes)
+        print(f"静音检测: 移除 {time_map.removed_seconds:.1f} 秒静音 (占 {time_map.removed_share:.1%})，"
+              f"上传大小 {original_bytes / 1024 / 1024:.1f} MB -> {uploaded_bytes / 1024 / 1024:.1f} MB，"
+              f"节省 {(original_bytes - uploaded_bytes) / 1024 / 1024:.1f} MB")
+        return output_file, time_map
+
+    def _record(self, time_map, removed_seconds, original_bytes, uploaded_bytes):
+        with self._lock:
+            self._stats['files'] += 1
+            self._stats['trimmed'] += removed_seconds > 0
+            self._stats['original_seconds'] += time_map.original_duration if time_map is not None else 0.0
+            self._stats['removed_seconds'] += removed_seconds
+            self._stats['original_bytes'] += original_bytes
+            self._stats['uploaded_bytes'] += uploaded_bytes
+
+    def stats(self):
+        """
+        累计的裁剪统计
+
+        Returns:
+            包含 files、trimmed、removed_seconds、removed_share（占分析过的音频总时长的比例）、
+            saved_bytes 的字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['removed_share'] = (stats['removed_seconds'] / stats['original_seconds']
+                                  if stats['original_seconds'] else 0.0)
+        stats['saved_bytes'] = stats['original_bytes'] - stats['uploaded_bytes']
+        return stats
@@ -2,67 +2,101 @@
 """
 自动搜索并转录YouTube视频
 
-此脚本自动执行以下步骤：
+此脚本在同一个进程中自动执行以下步骤：
 1. 从keywords.txt读取关键词和视频数量配置
-2. 搜索YouTube视频
-3. 将新链接保存到videos.txt
-4. 转录这些新链接的视频内容
+2. 搜索YouTube视频，每确认一个新链接就保存到videos.txt
+3. 新链接同时直接进入转录队列，搜索还在翻页时第一个视频就可以开始转录
+
+videos.txt中已有的链接也会一并转录，已经完成的视频由运行清单和转录缓存跳过。
 """
 
 import os
 import sys
+import queue
 import argparse
-import subprocess
+import threading
+from functools import partial
+import youtube_transcription as transcription
+import pipeline_metrics
+from link_index import LinkIndex
+from search_youtube_videos import (
+    add_http_cache_arguments, open_http_cache, read_keywords_config, search_videos,
+    validate_http_cache_arguments,
+)
+
+# 搜索结束后放入链接队列的哨兵对象
+_DONE = object()
 
-def read_keywords_config(file_path):
+def start_search(search, index, limit):
     """
-    从文件中读取关键词和配置信息
+    在后台线程中运行搜索，每确认一个新视频就写入videos.txt并放入链接队列
     
     Args:
-        file_path: 关键词文件的路径
-        
+        search: 接受 on_match 回调参数的搜索函数
+        index: videos.txt对应的 LinkIndex，已收录的视频不会重复添加
+        limit: 最多添加的新链接数量
+    
     Returns:
-        包含关键词列表和视频数量的元组 (keywords_file_exists, limit)
+        (链接队列, 搜索线程)，搜索结束后队列中会放入 _DONE
     """
-    limit = 20
+    hits = queue.Queue()
+    added = []
     
-    if not os.path.exists(file_path):
-        return False, limit
+    def on_match(link):
+        if len(added) >= limit or not index.add([link]):
+            return
+        added.append(link)
+        print(f"已添加新链接到 {index.links_file}: {link}")
+        hits.put(link)
     
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-        
-        # 读取第二行视频数量
-        if len(lines) > 1 and lines[1].strip():
-            try:
-                limit = int(lines[1].strip())
-                if limit <= 0:
-                    limit = 20
-            except ValueError:
-                limit = 20
+    def run():
+        try:
+            search(on_match=on_match)
+        except Exception as e:
+            print(f"搜索出错: {e}")
+        finally:
+            print(f"搜索完成，共添加 {len(added)} 个新链接")
+            hits.put(_DONE)
     
-    return True, limit
+    thread = threading.Thread(target=run, name='search', daemon=True)
+    thread.start()
+    return hits, thread
 
-def run_command(command):
+def iter_links(pending_links, hits=None):
     """
-    运行命令并返回结果
+    依次产生要转录的链接，搜索新找到的链接优先于videos.txt中已有的链接
     
     Args:
-        command: 要运行的命令列表
-        
-    Returns:
-        命令执行的退出码
+        pending_links: videos.txt中已有的链接
+        hits: start_search 返回的链接队列，为None时只处理已有链接
     """
-    print(f"执行: {' '.join(command)}")
+    for link in pending_links:
+        while hits is not None:
+            try:
+                hit = hits.get_nowait()
+            except queue.Empty:
+                break
+            if hit is _DONE:
+                hits = None
+            else:
+                yield hit
+        yield link
+    while hits is not None:
+        hit = hits.get()
+        if hit is _DONE:
+            return
+        yield hit
+
+def build_search(args, keywords, limit):
+    """按参数构造搜索函数"""
+    if args.use_selenium:
+        # Selenium只在需要时导入，未安装浏览器环境时基础搜索仍然可用
+        from advanced_search import search_youtube_with_selenium
+        return partial(search_youtube_with_selenium, keywords, limit * 2)
     
-    try:
-        result = subprocess.run(command, check=True)
-        return result.returncode
-    except subprocess.CalledProcessError as e:
-        print(f"错误: {e}")
-        return e.returncode
+    return partial(search_videos, keywords, 'youtube', limit * 2, http_cache=open_http_cache(args))
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='自动搜索并转录YouTube视频')
     parser.add_argument('--keywords-file', default='keywords.txt', help='关键词文件路径 (默认: keywords.txt)')
     parser.add_argument('--limit', type=int, help='每次最多添加的新链接数量 (将覆盖配置文件中的设置)')
@@ -70,52 +104,70 @@ def main():
     parser.add_argument('--use-selenium', action='store_true', help='使用Selenium进行搜索（更可靠但需要安装浏览器）')
     parser.add_argument('--skip-search', action='store_true', help='跳过搜索步骤，直接执行转录')
     parser.add_argument('--skip-transcribe', action='store_true', help='仅执行搜索步骤，不执行转录')
+    add_http_cache_arguments(parser)
+    transcription.add_transcription_arguments(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.limit is not None and args.limit <= 0:
+        parser.error("--limit 必须是正整数")
+    validate_http_cache_arguments(parser, args)
+    transcription.validate_transcription_arguments(parser, args)
     
-    # 读取配置文件中的视频数量
-    _, config_limit = read_keywords_config(args.keywords_file)
+    if not args.skip_transcribe and args.backend == 'assemblyai' and not transcription.ASSEMBLYAI_API_KEY:
+        print("警告: 未设置AssemblyAI API密钥。请编辑 youtube_transcription.py 设置你的API密钥。")
+        return 1
     
-    # 优先使用命令行参数的limit，如果没有则使用配置文件中的limit
+    # 搜索在转录之前开始，指标也要在搜索之前开始记录
+    if not args.no_metrics:
+        pipeline_metrics.start_run(args.metrics_dir)
+    
+    # 读取关键词和配置，优先使用命令行参数的limit
+    keywords, config_limit = read_keywords_config(args.keywords_file)
     limit = args.limit if args.limit is not None else config_limit
     
-    # 步骤1: 搜索视频
+    # 搜索线程和转录共用同一个链接索引
+    index = LinkIndex(args.output)
+    pending_links = [link for link in index.file_links()
+                     if transcription.identify_platform(link) != 'unknown']
+    
+    hits = None
+    search_thread = None
     if not args.skip_search:
-        print("\n===== 步骤1: 搜索YouTube视频 =====")
-        
-        if args.use_selenium:
-            search_script = "advanced_search.py"
-        else:
-            search_script = "search_youtube_videos.py"
-        
-        search_cmd = [
-            sys.executable, search_script, 
-            "--keywords-file", args.keywords_file
-        ]
-        
-        # 仅当命令行指定了limit时，才将其传递给搜索脚本
-        if args.limit is not None:
-            search_cmd.extend(["--limit", str(args.limit)])
-            
-        search_cmd.extend(["--output", args.output])
-        
-        exit_code = run_command(search_cmd)
-        if exit_code != 0:
-            print("搜索步骤失败，退出程序")
-            return exit_code
-    
-    # 步骤2: 转录视频
-    if not args.skip_transcribe:
-        print("\n===== 步骤2: 转录YouTube视频 =====")
-        
-        transcribe_cmd = [sys.executable, "youtube_transcription.py"]
-        exit_code = run_command(transcribe_cmd)
-        if exit_code != 0:
-            print("转录步骤失败")
-            return exit_code
+        print("\n===== 搜索YouTube视频 =====")
+        print(f"将搜索以下关键词: {', '.join(keywords)}，最多添加 {limit} 个新链接")
+        hits, search_thread = start_search(build_search(args, keywords, limit), index, limit)
+    
+    if args.skip_transcribe:
+        if search_thread is not None:
+            search_thread.join()
+        index.close()
+        pipeline_metrics.finish_run()
+        print("\n===== 全部任务完成 =====")
+        return 0
+    
+    print("\n===== 转录YouTube视频 =====")
+    print(f"videos.txt中已有 {len(pending_links)} 个链接，搜索到的新链接会陆续加入转录队列")
+    temp_dir = "temp_audio"
+    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(transcription.OUTPUT_DIR, exist_ok=True)
+    
+    context = transcription.open_transcription_context(args)
+    try:
+        transcription.transcribe_links(iter_links(pending_links, hits), args, context, temp_dir)
+    finally:
+        transcription.close_transcription_context(context)
+    if search_thread is not None:
+        search_thread.join()
+    index.close()
+    pipeline_metrics.finish_run()
+    
+    # 清理临时目录
+    if os.path.exists(temp_dir) and not os.listdir(temp_dir):
+        os.rmdir(temp_dir)
     
     print("\n===== 全部任务完成 =====")
+    print(f"转录结果已保存到 {transcription.OUTPUT_DIR} 目录")
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+关键词匹配微基准
+
+比较验证视频页面时原来的做法（对整个页面逐个关键词 .lower() 后查找）
+和 KeywordMatcher 一次扫描、流式读取并在找齐关键词后停止的做法，
+输出每种页面情况下的耗时以及流式扫描实际读取的字节数。
+
+运行方法：
+    python benchmarks/bench_keyword_matcher.py --page-kb 1200 --repeat 20
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher
+
+KEYWORDS = ["紫微斗数", "八字", "命理", "Astrology"]
+CHUNK_SIZE = 64 * 1024
+
+def build_page(size_bytes, keyword_positions, seed=0):
+    """
+    生成一个接近真实视频页面的HTML文本
+
+    Args:
+        size_bytes: 页面大小（字节）
+        keyword_positions: 关键词出现的位置（0到1之间的比例），None表示不出现
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    filler = ['<div class="style-scope ytd-watch-flexy">', '"videoId":"abcdefghijk"', '观看次数', 'script',
+              '{"responseContext":{"serviceTrackingParams":[]}}', '推荐视频', 'window.ytcfg', '字幕']
+    parts = []
+    size = 0
+    while size < size_bytes:
+        piece = rng.choice(filler)
+        parts.append(piece)
+        size += len(piece.encode('utf-8'))
+    for keyword, position in zip(KEYWORDS, keyword_positions):
+        if position is not None:
+            parts.insert(int(len(parts) * position), keyword)
+    return ''.join(parts)
+
+def old_contains_all(text, keywords):
+    """原来的做法：每个关键词都对整个页面转换一次小写"""
+    for keyword in keywords:
+        if keyword.lower() not in text.lower():
+            return False
+    return True
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='关键词匹配微基准')
+    parser.add_argument('--page-kb', type=int, default=1200, help='模拟页面大小 KB (默认: 1200)')
+    parser.add_argument('--repeat', type=int, default=20, help='每种情况重复次数 (默认: 20)')
+    args = parser.parse_args()
+
+    matcher = KeywordMatcher(KEYWORDS)
+    cases = {
+        '关键词都在页面前部': (0.05, 0.08, 0.1, 0.12),
+        '关键词分散在页面中': (0.1, 0.4, 0.6, 0.9),
+        '缺少一个关键词': (0.1, 0.4, 0.6, None),
+    }
+
+    print(f"页面大小 {args.page_kb} KB，关键词 {len(KEYWORDS)} 个，重复 {args.repeat} 次\n")
+    print(f"{'情况':<16}{'原做法(ms)':>12}{'整页扫描(ms)':>14}{'流式扫描(ms)':>14}{'流式读取(KB)':>14}")
+    for name, positions in cases.items():
+        text = build_page(args.page_kb * 1024, positions)
+        data = text.encode('utf-8')
+
+        old_result, old_ms = timed(lambda: old_contains_all(text, KEYWORDS), args.repeat)
+        new_result, new_ms = timed(lambda: matcher.contains_all(text), args.repeat)
+
+        def stream():
+            scanner = matcher.scanner('utf-8')
+            for chunk in iter_chunks(data):
+                if scanner.feed(chunk):
+                    break
+            return scanner.complete, scanner.bytes_read
+
+        (stream_result, bytes_read), stream_ms = timed(stream, args.repeat)
+        assert old_result == new_result == stream_result, name
+        print(f"{name:<16}{old_ms:>12.2f}{new_ms:>14.2f}{stream_ms:>14.2f}{bytes_read / 1024:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+基准测试用的 yt-dlp 替身
+
+接受 download_audio 传给 yt-dlp 的参数，不访问网络，为每个视频生成一段音频：
+语音片段（带噪声调制的多个音调）和长短不一的静音交替出现，静音检测和分段能够正常工作。
+写出 info JSON 后在标准输出打印音频文件路径，与 --print after_move:filepath 一致。
+
+安装了ffmpeg时生成32kbps的m4a（--audio-format mp3 时生成mp3）；没有ffmpeg时写出
+相同大小的占位 .opus 文件，此时需要配合 --no-vad --no-segment 使用。
+
+通过环境变量控制：
+    BENCH_AUDIO_SECONDS   每个视频的音频时长（秒，默认600）
+    BENCH_YTDLP_LATENCY   每次下载额外等待的秒数，模拟网络下载（默认0）
+    BENCH_YTDLP_FAIL_RATE 下载失败的概率（默认0）
+    BENCH_AUDIO_CACHE     生成的音频的缓存目录，重复运行时直接复制，不计入编码时间
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import subprocess
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# 32kbps 音频每秒的字节数，与 mock_services.AUDIO_BYTES_PER_SECOND 一致
+AUDIO_BYTES_PER_SECOND = 4000
+
+def parse_args(argv):
+    """
+    从 yt-dlp 参数中取出输出模板、音频格式和视频链接
+
+    Returns:
+        (输出模板, 音频格式, 链接)，没有 --audio-format 时音频格式为None
+    """
+    template = '%(id)s.%(ext)s'
+    audio_format = None
+    link = None
+    takes_value = {'-o', '--audio-format', '--audio-quality', '--print', '-f', '--referer'}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in takes_value:
+            if arg == '-o':
+                template = argv[i + 1]
+            elif arg == '--audio-format':
+                audio_format = argv[i + 1]
+            i += 2
+            continue
+        if not arg.startswith('-'):
+            link = arg
+        i += 1
+    return template, audio_format, link
+
+def video_id_from_link(link):
+    match = re.search(r'[?&]v=([A-Za-z0-9_-]{11})', link) or re.search(r'/([A-Za-z0-9_-]{11})(?:[?/]|$)', link)
+    if match:
+        return match.group(1)
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()[:11]
+
+def synthesize(seconds, seed):
+    """
+    生成语音与静音交替的16位单声道PCM
+
+    语音片段长2到8秒，之间的停顿多数为0.2到0.8秒，约四分之一是1.5到4秒的长静音。
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    samples = np.zeros(total, dtype=np.float32)
+    position = int(rng.uniform(0.5, 2.0) * SAMPLE_RATE)
+    while position < total:
+        length = min(int(rng.uniform(2.0, 8.0) * SAMPLE_RATE), total - position)
+        t = np.arange(length, dtype=np.float32) / SAMPLE_RATE
+        tone = sum(np.sin(2 * np.pi * f * t) for f in rng.uniform(120, 900, size=3))
+        envelope = 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+        samples[position:position + length] = 0.1 * tone * envelope + 0.02 * rng.standard_normal(length)
+        pause = rng.uniform(1.5, 4.0) if rng.random() < 0.25 else rng.uniform(0.2, 0.8)
+        position += length + int(pause * SAMPLE_RATE)
+    # 静音部分保留很弱的底噪，接近真实录音
+    samples += 0.0005 * rng.standard_normal(total).astype(np.float32)
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+def write_audio(path, seconds, seed, ext):
+    """生成音频文件，没有ffmpeg时写出同样大小的占位文件"""
+    if ext == 'opus':
+        rng = random.Random(seed)
+        with open(path, 'wb') as f:
+            f.write(rng.randbytes(int(seconds * AUDIO_BYTES_PER_SECOND)))
+        return
+    codec = ['-c:a', 'libmp3lame'] if ext == 'mp3' else ['-c:a', 'aac']
+    subprocess.run(
+        ['ffmpeg', '-y', '-v', 'error', '-nostdin', '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1',
+         '-i', 'pipe:0', *codec, '-b:a', '32k', path],
+        input=synthesize(seconds, seed), check=True, capture_output=True,
+    )
+
+def audio_seed(video_id):
+    """每个视频的音频不同，转录缓存不会在视频之间命中"""
+    return int(hashlib.sha1(video_id.encode('utf-8')).hexdigest()[:8], 16)
+
+def audio_ext(audio_format=None):
+    """生成的音频格式：没有ffmpeg时只能写出占位的opus文件"""
+    if shutil.which('ffmpeg') is None:
+        return 'opus'
+    return 'mp3' if audio_format == 'mp3' else 'm4a'
+
+def fill_cache(cache_dir, video_id, seconds, ext):
+    """
+    确保缓存目录中有该视频的音频
+
+    Returns:
+        缓存中的音频文件路径
+    """
+    cached = os.path.join(cache_dir, f"{video_id}-{seconds:g}.{ext}")
+    if not os.path.exists(cached):
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_file = f"{cached}.{os.getpid()}.tmp.{ext}"
+        write_audio(temp_file, seconds, audio_seed(video_id), ext)
+        os.replace(temp_file, cached)
+    return cached
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    template, audio_format, link = parse_args(argv)
+    if not link:
+        print("ERROR: 没有提供视频链接", file=sys.stderr)
+        return 2
+
+    video_id = video_id_from_link(link)
+    seconds = float(os.environ.get('BENCH_AUDIO_SECONDS', 600))
+    latency = float(os.environ.get('BENCH_YTDLP_LATENCY', 0))
+    fail_rate = float(os.environ.get('BENCH_YTDLP_FAIL_RATE', 0))
+    if latency > 0:
+        time.sleep(latency)
+    if fail_rate > 0 and random.Random(audio_seed(video_id)).random() < fail_rate:
+        print(f"ERROR: [youtube] {video_id}: 模拟的下载失败", file=sys.stderr)
+        return 1
+
+    ext = audio_ext(audio_format)
+    output_file = template.replace('%(id)s', video_id).replace('%(ext)s', ext)
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    cache_dir = os.environ.get('BENCH_AUDIO_CACHE')
+    if cache_dir:
+        shutil.copyfile(fill_cache(cache_dir, video_id, seconds, ext), output_file)
+    else:
+        write_audio(output_file, seconds, audio_seed(video_id), ext)
+
+    info = {
+        'id': video_id,
+        'title': f"基准测试视频 {video_id}",
+        'duration': seconds,
+        'uploader': 'bench',
+        'uploader_id': '@bench',
+        'channel': 'bench',
+        'upload_date': '20240101',
+        'webpage_url': link,
+        'extractor': 'youtube',
+        'ext': ext,
+    }
+    with open(os.path.splitext(output_file)[0] + '.info.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False)
+    print(output_file)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
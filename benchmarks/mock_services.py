@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+基准测试用的本地服务
+
+一个HTTP服务同时模拟三类外部服务，端点与真实服务一致，
+把 ASSEMBLYAI_BASE_URL、DEEPSEEK_BASE_URL、YOUTUBE_BASE_URL 指向它即可：
+
+- AssemblyAI：/v2/upload、/v2/transcript、/v2/transcript/<id>
+- DeepSeek：/v1/chat/completions
+- YouTube：/results 搜索结果页、/youtubei/v1/search 翻页接口、/watch 视频页面
+
+延迟和失败率由配置（profile）决定，搜索结果由夹具（fixture）文件生成。
+随机数使用固定的种子，同样的配置每次注入的失败相同，便于比较不同版本。
+测试中可以用 MockServices.inject 让接下来的请求必定失败。
+
+单独运行时启动服务并等待，可以手动配合脚本使用：
+    python benchmarks/mock_services.py --port 8800 --profile realistic
+"""
+
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'youtube.json')
+
+# 上传的音频每秒对应的字节数（32kbps），用于从上传大小推算音频时长
+AUDIO_BYTES_PER_SECOND = 4000
+
+# 每秒音频识别出的字数
+CHARS_PER_SECOND = 4
+
+# 延迟单位为秒，*_error_rate 为注入失败的概率；upload_drop 是上传读到一半时直接断开连接
+PROFILES = {
+    # 没有网络延迟，只测本地处理的开销
+    'fast': {
+        'latency': 0.0,
+        'jitter': 0.0,
+        'upload_bytes_per_second': 0,
+        'asr_queue_seconds': 0.0,
+        'asr_realtime_factor': 0.0,
+        'asr_punctuated': True,
+        'llm_latency': 0.0,
+        'llm_seconds_per_1k_chars': 0.0,
+        'search_latency': 0.0,
+        'watch_latency': 0.0,
+        'upload_error_rate': 0.0,
+        'upload_drop_error_rate': 0.0,
+        'asr_error_rate': 0.0,
+        'llm_error_rate': 0.0,
+        'watch_error_rate': 0.0,
+    },
+    # 接近真实服务的延迟，识别耗时约为音频时长的2%
+    'realistic': {
+        'latency': 0.05,
+        'jitter': 0.02,
+        'upload_bytes_per_second': 5 * 1024 * 1024,
+        'asr_queue_seconds': 2.0,
+        'asr_realtime_factor': 0.02,
+        'asr_punctuated': True,
+        'llm_latency': 0.8,
+        'llm_seconds_per_1k_chars': 3.0,
+        'search_latency': 0.3,
+        'watch_latency': 0.2,
+        'upload_error_rate': 0.0,
+        'upload_drop_error_rate': 0.0,
+        'asr_error_rate': 0.0,
+        'llm_error_rate': 0.0,
+        'watch_error_rate': 0.0,
+    },
+    # 在 realistic 的基础上注入上传出错和断开、识别失败、限流和页面错误
+    'flaky': {
+        'latency': 0.05,
+        'jitter': 0.05,
+        'upload_bytes_per_second': 5 * 1024 * 1024,
+        'asr_queue_seconds': 2.0,
+        'asr_realtime_factor': 0.02,
+        'asr_punctuated': True,
+        'llm_latency': 0.8,
+        'llm_seconds_per_1k_chars': 3.0,
+        'search_latency': 0.3,
+        'watch_latency': 0.2,
+        'upload_error_rate': 0.15,
+        'upload_drop_error_rate': 0.05,
+        'asr_error_rate': 0.05,
+        'llm_error_rate': 0.1,
+        'watch_error_rate': 0.05,
+    },
+    # 识别结果不带标点，所有文本都需要大模型格式化
+    'unpunctuated': {
+        'latency': 0.05,
+        'jitter': 0.02,
+        'upload_bytes_per_second': 5 * 1024 * 1024,
+        'asr_queue_seconds': 2.0,
+        'asr_realtime_factor': 0.02,
+        'asr_punctuated': False,
+        'llm_latency': 0.8,
+        'llm_seconds_per_1k_chars': 3.0,
+        'search_latency': 0.3,
+        'watch_latency': 0.2,
+        'upload_error_rate': 0.0,
+        'upload_drop_error_rate': 0.0,
+        'asr_error_rate': 0.0,
+        'llm_error_rate': 0.0,
+        'watch_error_rate': 0.0,
+    },
+}
+
+# 生成识别文本使用的短语
+_PHRASES = (
+    '今天我们来讲风水的基本原理', '左青龙右白虎', '明财位在进门的对角线上', '这是最重要的一点',
+    '厨房不能正对大门', '紫微斗数的命盘一共有十二个宫位', '命宫代表一个人的性格', '大家要注意',
+    '八字讲究五行平衡', '我们再看一个例子', '这个格局比较少见', '下次我们继续讲',
+)
+
+def load_profile(name='realistic', profile_file=None):
+    """
+    读取延迟和失败配置
+
+    Args:
+        name: PROFILES 中的配置名
+        profile_file: JSON文件路径，其中的字段覆盖 name 对应配置中的同名字段
+
+    Returns:
+        配置字典
+    """
+    if name not in PROFILES:
+        raise ValueError(f"未知的配置: {name}，可选: {', '.join(PROFILES)}")
+    profile = dict(PROFILES[name])
+    if profile_file:
+        with open(profile_file, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(profile)
+        if unknown:
+            raise ValueError(f"配置文件中有未知的字段: {', '.join(sorted(unknown))}")
+        profile.update(overrides)
+    return profile
+
+def load_fixture(path=FIXTURE_PATH):
+    """读取搜索结果夹具"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def fixture_videos(fixture):
+    """
+    按夹具生成搜索结果中的视频
+
+    Returns:
+        视频字典列表，包含 id、title、description、matches（视频页面是否包含所有关键词）
+    """
+    videos = []
+    keywords = fixture['keywords']
+    for i in range(fixture['pages'] * fixture['per_page']):
+        matches = i % fixture['match_every'] == 0
+        title_keywords = keywords if matches and i % (fixture['match_every'] * 2) == 0 else keywords[:1]
+        videos.append({
+            'id': f"bench{i:06d}",
+            'title': f"{' '.join(title_keywords)} 第{i + 1}讲",
+            'description': _PHRASES[i % len(_PHRASES)],
+            'matches': matches,
+        })
+    return videos
+
+def generate_text(seconds, punctuated, seed=0):
+    """按音频时长生成识别文本和词列表（毫秒时间戳）"""
+    rng = random.Random(seed)
+    words = []
+    position = 0.0
+    parts = []
+    while position < seconds:
+        phrase = rng.choice(_PHRASES)
+        duration = len(phrase) / CHARS_PER_SECOND
+        words.append({'text': phrase, 'start': int(position * 1000), 'end': int((position + duration) * 1000),
+                      'confidence': 0.9})
+        parts.append(phrase + ('。' if punctuated and len(words) % 2 == 0 else '，' if punctuated else ''))
+        position += duration
+    return ''.join(parts), words
+
+def punctuate(text):
+    """模拟大模型添加标点：按长度插入逗号和句号"""
+    text = re.sub(r'[，。！？、\s]', '', text)
+    pieces = [text[i:i + 12] for i in range(0, len(text), 12)]
+    return ''.join(piece + ('。' if i % 3 == 2 or i == len(pieces) - 1 else '，') for i, piece in enumerate(pieces))
+
+class MockServices:
+    """
+    在后台线程中运行的模拟服务
+
+    Args:
+        profile: load_profile 返回的配置
+        fixture: load_fixture 返回的夹具
+        host: 监听地址
+        port: 监听端口，0表示自动选择
+        seed: 注入失败和延迟抖动使用的随机种子
+    """
+
+    def __init__(self, profile, fixture, host='127.0.0.1', port=0, seed=0):
+        self.profile = profile
+        self.fixture = fixture
+        self.videos = fixture_videos(fixture)
+        self._video_index = {video['id']: video for video in self.videos}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._uploads = {}
+        self._transcripts = {}
+        self._stats = {}
+        self._injected = {}
+        handler = type('Handler', (_Handler,), {'services': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-services', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def delay(self, seconds):
+        """按配置的基础延迟和抖动等待"""
+        seconds += self.profile['latency'] + self.profile['jitter'] * self.random()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def inject(self, name, times=1):
+        """让接下来 times 次 fail(name) 必定失败，测试中用来注入指定的失败"""
+        with self._lock:
+            self._injected[name] = self._injected.get(name, 0) + times
+
+    def fail(self, name):
+        with self._lock:
+            if self._injected.get(name):
+                self._injected[name] -= 1
+                return True
+        rate = self.profile[f'{name}_error_rate']
+        return rate > 0 and self.random() < rate
+
+    def record(self, endpoint, status, bytes_in=0, bytes_out=0):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'requests': 0, 'errors': 0, 'bytes_in': 0, 'bytes_out': 0})
+            stats['requests'] += 1
+            stats['errors'] += status >= 400
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+
+    def stats(self):
+        """各端点的请求数、返回错误的次数和收发字节数"""
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in sorted(self._stats.items())}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+
+    # AssemblyAI
+
+    def add_upload(self, size):
+        with self._lock:
+            upload_id = f"u{len(self._uploads) + 1:06d}"
+            self._uploads[upload_id] = size
+        return f"{self.base_url}/uploads/{upload_id}"
+
+    def add_transcript(self, audio_url):
+        size = self._uploads.get(audio_url.rsplit('/', 1)[-1])
+        if size is None:
+            return None
+        seconds = size / AUDIO_BYTES_PER_SECOND
+        queued = self.profile['asr_queue_seconds']
+        failed = self.fail('asr')
+        with self._lock:
+            transcript_id = f"t{len(self._transcripts) + 1:06d}"
+            self._transcripts[transcript_id] = {
+                'seconds': seconds,
+                'processing_at': time.monotonic() + queued,
+                'completed_at': time.monotonic() + queued + seconds * self.profile['asr_realtime_factor'],
+                'failed': failed,
+                'seed': len(self._transcripts),
+            }
+        return transcript_id
+
+    def transcript_status(self, transcript_id):
+        job = self._transcripts.get(transcript_id)
+        if job is None:
+            return None
+        now = time.monotonic()
+        if now < job['processing_at']:
+            return {'id': transcript_id, 'status': 'queued'}
+        if now < job['completed_at']:
+            return {'id': transcript_id, 'status': 'processing'}
+        if job['failed']:
+            return {'id': transcript_id, 'status': 'error', 'error': '模拟的识别失败'}
+        text, words = generate_text(job['seconds'], self.profile['asr_punctuated'], job['seed'])
+        return {'id': transcript_id, 'status': 'completed', 'text': text, 'words': words,
+                'audio_duration': job['seconds']}
+
+    # YouTube
+
+    def search_page(self, page):
+        """第 page 页（从0开始）的搜索结果和下一页的token"""
+        per_page = self.fixture['per_page']
+        items = []
+        for video in self.videos[page * per_page:(page + 1) * per_page]:
+            items.append({'videoRenderer': {
+                'videoId': video['id'],
+                'title': {'runs': [{'text': video['title']}]},
+                'descriptionSnippet': {'runs': [{'text': video['description']}]},
+                'ownerText': {'runs': [{'text': 'bench'}]},
+            }})
+        token = f"page-{page + 1}" if page + 1 < self.fixture['pages'] else None
+        return items, token
+
+    def watch_page(self, video_id):
+        """生成视频页面，符合条件的视频在简介中包含所有关键词"""
+        video = self._video_index.get(video_id)
+        if video is None:
+            return None
+        keywords = self.fixture['keywords'] if video['matches'] else self.fixture['keywords'][:1]
+        filler = '<div class="style-scope ytd-watch-flexy">推荐视频</div>'
+        repeat = max(1, self.fixture['watch_page_kb'] * 1024 // len(filler.encode('utf-8')))
+        head = filler * (repeat // 4)
+        return (f"<html><head><title>{video['title']} - YouTube</title></head><body>{head}"
+                f"<div id=\"description\">{' '.join(keywords)} {video['description']}</div>"
+                f"{filler * (repeat - repeat // 4)}</body></html>")
+
+def _search_html(items, token):
+    contents = [{'itemSectionRenderer': {'contents': items}}]
+    if token:
+        contents.append({'continuationItemRenderer': {
+            'continuationEndpoint': {'continuationCommand': {'token': token}}}})
+    data = {'contents': {'twoColumnSearchResultsRenderer': {'primaryContents': {
+        'sectionListRenderer': {'contents': contents}}}}}
+    return ('<html><script>ytcfg.set({"INNERTUBE_API_KEY":"bench-key",'
+            '"INNERTUBE_CLIENT_VERSION":"2.20240101.00.00"});</script>'
+            f'<script>var ytInitialData = {json.dumps(data, ensure_ascii=False)};</script></html>')
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    services = None
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            size = 0
+            parts = []
+            while True:
+                length = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if length == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(length))
+                size += length
+                self.rfile.readline()
+            return b''.join(parts)
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send(self, endpoint, status, body, content_type='application/json', bytes_in=0):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type + ('; charset=utf-8' if 'charset' not in content_type else ''))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.services.record(endpoint, status, bytes_in, len(body))
+
+    def do_GET(self):
+        services = self.services
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/v2/transcript/'):
+            services.delay(0)
+            result = services.transcript_status(url.path.rsplit('/', 1)[-1])
+            if result is None:
+                return self._send('assemblyai.poll', 404, {'error': 'transcript not found'})
+            return self._send('assemblyai.poll', 200, result)
+        if url.path == '/results':
+            services.delay(services.profile['search_latency'])
+            items, token = services.search_page(0)
+            return self._send('youtube.results', 200, _search_html(items, token), 'text/html')
+        if url.path == '/watch':
+            services.delay(services.profile['watch_latency'])
+            if services.fail('watch'):
+                return self._send('youtube.watch', 500, 'error', 'text/html')
+            page = services.watch_page((query.get('v') or [''])[0])
+            if page is None:
+                return self._send('youtube.watch', 404, 'not found', 'text/html')
+            return self._send('youtube.watch', 200, page, 'text/html')
+        return self._send('unknown', 404, {'error': f'unknown path {url.path}'})
+
+    def _drop_upload(self):
+        """读取一部分上传内容后不返回响应直接断开连接，模拟传输中途掉线"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            length = int(self.rfile.readline().split(b';')[0].strip(), 16)
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+        received = len(self.rfile.read(min(length, 64 * 1024)))
+        self.close_connection = True
+        self.services.record('assemblyai.upload_dropped', 0, bytes_in=received)
+
+    def do_POST(self):
+        services = self.services
+        url = urlsplit(self.path)
+        if url.path == '/v2/upload' and services.fail('upload_drop'):
+            return self._drop_upload()
+        body = self._read_body()
+        if url.path == '/v2/upload':
+            rate = services.profile['upload_bytes_per_second']
+            services.delay(len(body) / rate if rate else 0)
+            if services.fail('upload'):
+                return self._send('assemblyai.upload', 503, {'error': '模拟的上传失败'}, bytes_in=len(body))
+            return self._send('assemblyai.upload', 200, {'upload_url': services.add_upload(len(body))},
+                              bytes_in=len(body))
+        if url.path == '/v2/transcript':
+            services.delay(0)
+            transcript_id = services.add_transcript(json.loads(body).get('audio_url', ''))
+            if transcript_id is None:
+                return self._send('assemblyai.submit', 400, {'error': 'audio_url not found'}, bytes_in=len(body))
+            return self._send('assemblyai.submit', 200, {'id': transcript_id, 'status': 'queued'},
+                              bytes_in=len(body))
+        if url.path == '/v1/chat/completions':
+            content = json.loads(body)['messages'][-1]['content']
+            text = content.rsplit('\n\n', 1)[-1]
+            profile = services.profile
+            services.delay(profile['llm_latency'] + len(text) / 1000 * profile['llm_seconds_per_1k_chars'])
+            if services.fail('llm'):
+                status = 429 if services.random() < 0.5 else 500
+                return self._send('deepseek.chat', status, {'error': {'message': '模拟的限流或服务错误'}},
+                                  bytes_in=len(body))
+            return self._send('deepseek.chat', 200, {
+                'choices': [{'message': {'role': 'assistant', 'content': punctuate(text)}}],
+                'usage': {'prompt_tokens': len(content), 'completion_tokens': len(text)},
+            }, bytes_in=len(body))
+        if url.path == '/youtubei/v1/search':
+            services.delay(services.profile['search_latency'])
+            token = json.loads(body).get('continuation', '')
+            page = int(token.rsplit('-', 1)[-1]) if token.startswith('page-') else 0
+            items, token = services.search_page(page)
+            data = {'onResponseReceivedCommands': [{'appendContinuationItemsAction': {'continuationItems': items + (
+                [{'continuationItemRenderer': {'continuationEndpoint': {'continuationCommand': {'token': token}}}}]
+                if token else [])}}]}
+            return self._send('youtube.search', 200, data, bytes_in=len(body))
+        return self._send('unknown', 404, {'error': f'unknown path {url.path}'}, bytes_in=len(body))
+
+def main():
+    parser = argparse.ArgumentParser(description='启动基准测试用的本地服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8800, help='监听端口 (默认: 8800)')
+    parser.add_argument('--profile', choices=list(PROFILES), default='realistic', help='延迟和失败配置 (默认: realistic)')
+    parser.add_argument('--profile-file', help='覆盖配置字段的JSON文件')
+    parser.add_argument('--fixture', default=FIXTURE_PATH, help='搜索结果夹具文件')
+    args = parser.parse_args()
+
+    services = MockServices(load_profile(args.profile, args.profile_file), load_fixture(args.fixture),
+                            host=args.host, port=args.port)
+    print(f"模拟服务已启动: {services.start()}")
+    print("使用方法: 把 ASSEMBLYAI_BASE_URL、DEEPSEEK_BASE_URL、YOUTUBE_BASE_URL 设置为以上地址")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+离线端到端基准测试
+
+不访问任何外部服务：AssemblyAI、DeepSeek和YouTube由 mock_services.py 在本地模拟，
+yt-dlp 由 fake_yt_dlp.py 代替，生成带有静音的音频。每个场景在独立的临时目录和子进程中
+运行真实的入口函数，测量各阶段耗时（p50/p95）、每分钟处理的视频数和峰值内存，
+结果写成JSON，可以用 compare 子命令比较两个版本。
+
+场景：
+    transcribe      youtube_transcription.py 串行处理 videos.txt
+    pipeline        youtube_transcription.py --pipeline
+    pipeline-async  youtube_transcription.py --pipeline --async-asr
+    search          search_youtube_videos.py 搜索并验证视频页面
+    auto            auto_search_and_transcribe.py --pipeline，边搜索边转录
+
+运行方法：
+    python benchmarks/run_benchmarks.py run --profile realistic --videos 4 --label before
+    python benchmarks/run_benchmarks.py compare .cache/benchmarks/before.json .cache/benchmarks/after.json
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from fake_yt_dlp import audio_ext, fill_cache
+from mock_services import FIXTURE_PATH, PROFILES, MockServices, fixture_videos, load_fixture, load_profile
+
+# 结果和生成的音频的默认保存目录
+RESULTS_DIR = os.path.join(".cache", "benchmarks")
+AUDIO_CACHE_DIR = os.path.join(RESULTS_DIR, "audio")
+
+# 场景对应的入口和固定参数
+SCENARIOS = {
+    'transcribe': ('transcribe', []),
+    'pipeline': ('transcribe', ['--pipeline']),
+    'pipeline-async': ('transcribe', ['--pipeline', '--async-asr']),
+    'search': ('search', []),
+    'auto': ('auto', ['--pipeline']),
+}
+DEFAULT_SCENARIOS = 'transcribe,pipeline,search,auto'
+
+# 需要转录的场景
+TRANSCRIBE_SCENARIOS = ('transcribe', 'pipeline', 'pipeline-async', 'auto')
+
+# 按顺序输出的阶段
+STAGES = ('download', 'transcribe', 'format', 'save', 'search', 'verify_page')
+
+def percentile(values, q):
+    """线性插值的百分位数，values 为空时返回None"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(values):
+    """耗时列表的次数、p50、p95、平均值和最大值"""
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'mean': None, 'max': None}
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.5),
+        'p95': percentile(values, 0.95),
+        'mean': sum(values) / len(values),
+        'max': max(values),
+    }
+
+def git_revision():
+    """当前代码的提交和工作区是否有未提交的修改"""
+    def git(*args):
+        result = subprocess.run(['git', *args], cwd=REPO_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+def transcribe_video_ids(videos):
+    """转录场景使用的视频ID，与搜索夹具中的ID不同，避免与搜索场景的结果混淆"""
+    return [f"clip{i:07d}" for i in range(videos)]
+
+def warm_audio_cache(scenarios, videos, audio_seconds, fixture):
+    """预先生成各场景会下载的音频，生成音频的时间不计入下载阶段"""
+    video_ids = []
+    if any(SCENARIOS[name][0] == 'transcribe' for name in scenarios):
+        video_ids += transcribe_video_ids(videos)
+    if 'auto' in scenarios:
+        video_ids += [video['id'] for video in fixture_videos(fixture) if video['matches']][:videos]
+    ext = audio_ext()
+    print(f"准备 {len(video_ids)} 个视频的音频...")
+    for video_id in video_ids:
+        fill_cache(AUDIO_CACHE_DIR, video_id, audio_seconds, ext)
+
+def prepare_workdir(workdir, scenario, videos, keywords):
+    """写出场景需要的 videos.txt、keywords.txt 和代替 yt-dlp 的脚本"""
+    bin_dir = os.path.join(workdir, 'bin')
+    os.makedirs(bin_dir)
+    wrapper = os.path.join(bin_dir, 'yt-dlp')
+    with open(wrapper, 'w', encoding='utf-8') as f:
+        f.write(f"#!/bin/sh\nexec {shlex.quote(sys.executable)} "
+                f"{shlex.quote(os.path.join(BENCH_DIR, 'fake_yt_dlp.py'))} \"$@\"\n")
+    os.chmod(wrapper, 0o755)
+
+    with open(os.path.join(workdir, 'keywords.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{','.join(keywords)}\n{videos}\n")
+    with open(os.path.join(workdir, 'videos.txt'), 'w', encoding='utf-8') as f:
+        if SCENARIOS[scenario][0] == 'transcribe':
+            f.writelines(f"https://www.youtube.com/watch?v={video_id}\n" for video_id in transcribe_video_ids(videos))
+    return bin_dir
+
+def scenario_args(scenario, args, has_ffmpeg):
+    """场景传给被测入口的参数"""
+    entry, fixed = SCENARIOS[scenario]
+    entry_args = list(fixed)
+    if entry in ('search', 'auto'):
+        entry_args += ['--limit', str(args.videos)]
+    if scenario in TRANSCRIBE_SCENARIOS:
+        if not has_ffmpeg:
+            # 没有ffmpeg时生成的是占位音频，无法解码
+            entry_args += ['--no-vad', '--no-segment']
+        entry_args += shlex.split(args.transcribe_args)
+    return entry, entry_args
+
+def run_scenario(scenario, args, services, fixture, has_ffmpeg):
+    """在临时目录中运行一次场景，返回子进程写出的结果加上服务端统计"""
+    entry, entry_args = scenario_args(scenario, args, has_ffmpeg)
+    with tempfile.TemporaryDirectory(prefix=f"bench-{scenario}-") as workdir:
+        bin_dir = prepare_workdir(workdir, scenario, args.videos, fixture['keywords'])
+        env = dict(os.environ)
+        env.update({
+            'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+            'ASSEMBLYAI_BASE_URL': services.base_url,
+            'DEEPSEEK_BASE_URL': services.base_url,
+            'YOUTUBE_BASE_URL': services.base_url,
+            'NO_PROXY': '127.0.0.1,localhost',
+            'no_proxy': '127.0.0.1,localhost',
+            'BENCH_AUDIO_SECONDS': str(args.audio_seconds),
+            'BENCH_YTDLP_LATENCY': str(args.download_latency),
+            'BENCH_YTDLP_FAIL_RATE': str(args.download_fail_rate),
+            'BENCH_AUDIO_CACHE': os.path.abspath(AUDIO_CACHE_DIR),
+            'PYTHONUNBUFFERED': '1',
+        })
+        result_file = os.path.join(workdir, 'result.json')
+        log_file = os.path.join(workdir, 'output.log')
+        services.reset_stats()
+        with open(log_file, 'w', encoding='utf-8') as log:
+            process = subprocess.run(
+                [sys.executable, os.path.join(BENCH_DIR, 'run_scenario.py'), '--scenario', entry,
+                 '--result', result_file, '--', *entry_args],
+                cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+        if not os.path.exists(result_file):
+            with open(log_file, 'r', encoding='utf-8', errors='replace') as f:
+                tail = f.read()[-2000:]
+            raise RuntimeError(f"场景 {scenario} 没有写出结果 (退出码 {process.returncode}):\n{tail}")
+        with open(result_file, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        if args.keep_logs:
+            os.makedirs(os.path.join(RESULTS_DIR, 'logs'), exist_ok=True)
+            shutil.copyfile(log_file, os.path.join(RESULTS_DIR, 'logs', f"{args.label}-{scenario}-{time.time_ns()}.log"))
+    result['services'] = services.stats()
+    return result
+
+def aggregate(runs):
+    """合并同一场景多次运行的结果：阶段耗时合并计算百分位数，其他指标取中位数"""
+    stages = {}
+    for run in runs:
+        for stage, values in run['stages'].items():
+            stages.setdefault(stage, []).extend(values)
+    videos = [run['jobs']['succeeded'] if run['scenario'] != 'search' else run['links_found'] for run in runs]
+    walls = [run['wall_seconds'] for run in runs]
+    first_saved = [run['first_saved_seconds'] for run in runs if run['first_saved_seconds'] is not None]
+    return {
+        'repeat': len(runs),
+        'wall_seconds': percentile(walls, 0.5),
+        'videos': percentile(videos, 0.5),
+        'videos_per_minute': percentile([count * 60 / wall for count, wall in zip(videos, walls) if wall > 0], 0.5),
+        'first_saved_seconds': percentile(first_saved, 0.5),
+        'failed': sum(run['jobs']['failed'] for run in runs),
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+        'children_peak_rss_mb': max(run['children_peak_rss_mb'] for run in runs),
+        'stages': {stage: summarize(stages[stage]) for stage in STAGES if stage in stages},
+    }
+
+def _fmt(value, digits=2):
+    return '-' if value is None else f"{value:.{digits}f}"
+
+def print_report(results):
+    print(f"\n{'场景':<16}{'耗时(s)':>10}{'视频数':>8}{'视频/分钟':>12}{'首个完成(s)':>13}{'失败':>6}{'峰值内存(MB)':>14}")
+    for name, summary in results['scenarios'].items():
+        print(f"{name:<16}{_fmt(summary['wall_seconds']):>10}{_fmt(summary['videos'], 0):>8}"
+              f"{_fmt(summary['videos_per_minute']):>12}{_fmt(summary['first_saved_seconds']):>13}"
+              f"{summary['failed']:>6}{_fmt(summary['peak_rss_mb'], 1):>14}")
+    print(f"\n{'场景':<16}{'阶段':<14}{'次数':>6}{'p50(s)':>10}{'p95(s)':>10}{'最大(s)':>10}")
+    for name, summary in results['scenarios'].items():
+        for stage, stats in summary['stages'].items():
+            print(f"{name:<16}{stage:<14}{stats['count']:>6}{_fmt(stats['p50'], 3):>10}"
+                  f"{_fmt(stats['p95'], 3):>10}{_fmt(stats['max'], 3):>10}")
+
+def command_run(args):
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"未知的场景: {', '.join(unknown)}，可选: {', '.join(SCENARIOS)}")
+    profile = load_profile(args.profile, args.profile_file)
+    fixture = load_fixture(args.fixture)
+    has_ffmpeg = shutil.which('ffmpeg') is not None
+    if not has_ffmpeg:
+        print("未找到ffmpeg，使用占位音频并关闭静音检测和音频分段")
+
+    results = {
+        'label': args.label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ffmpeg': has_ffmpeg,
+        'settings': {
+            'profile_name': args.profile,
+            'profile': profile,
+            'fixture': fixture,
+            'videos': args.videos,
+            'audio_seconds': args.audio_seconds,
+            'download_latency': args.download_latency,
+            'download_fail_rate': args.download_fail_rate,
+            'transcribe_args': args.transcribe_args,
+            'repeat': args.repeat,
+        },
+        'scenarios': {},
+        'runs': {},
+    }
+    warm_audio_cache(scenarios, args.videos, args.audio_seconds, fixture)
+    with MockServices(profile, fixture, seed=args.seed) as services:
+        print(f"模拟服务: {services.base_url}，配置: {args.profile}")
+        for scenario in scenarios:
+            runs = []
+            for i in range(args.repeat):
+                print(f"运行场景 {scenario} ({i + 1}/{args.repeat})...")
+                run = run_scenario(scenario, args, services, fixture, has_ffmpeg)
+                if run['exit_code'] or run['error']:
+                    print(f"  场景 {scenario} 异常结束: 退出码 {run['exit_code']} {run['error'] or ''}")
+                runs.append(run)
+            results['runs'][scenario] = runs
+            results['scenarios'][scenario] = aggregate(runs)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.label or time.strftime('%Y%m%d-%H%M%S')}.json")
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print_report(results)
+    print(f"\n结果已保存到 {output}")
+
+def _change(old, new):
+    if old is None or new is None:
+        return '-'
+    if old == 0:
+        return '-' if new == 0 else '+inf'
+    return f"{(new - old) / old:+.1%}"
+
+def command_compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+    for results in (baseline, candidate):
+        commit = (results['git']['commit'] or '?')[:10]
+        print(f"{results['label'] or '-'}: {commit}{' (有未提交的修改)' if results['git']['dirty'] else ''}，"
+              f"配置 {results['settings']['profile_name']}，{results['settings']['videos']} 个视频，"
+              f"{results['created']}")
+    if baseline['settings'] != candidate['settings']:
+        print("注意: 两次运行的设置不同，比较结果可能没有意义")
+
+    print(f"\n{'场景':<16}{'指标':<22}{'基准':>10}{'对比':>10}{'变化':>10}")
+    for name, new in candidate['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            continue
+        rows = [(key, old[key], new[key]) for key in
+                ('wall_seconds', 'videos_per_minute', 'first_saved_seconds', 'peak_rss_mb')]
+        for stage, stats in new['stages'].items():
+            old_stats = old['stages'].get(stage, {})
+            rows.append((f"{stage}.p50", old_stats.get('p50'), stats['p50']))
+            rows.append((f"{stage}.p95", old_stats.get('p95'), stats['p95']))
+        for key, old_value, new_value in rows:
+            print(f"{name:<16}{key:<22}{_fmt(old_value, 3):>10}{_fmt(new_value, 3):>10}{_change(old_value, new_value):>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线端到端基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行基准场景并保存结果')
+    run_parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS,
+                            help=f"逗号分隔的场景，可选: {', '.join(SCENARIOS)} (默认: {DEFAULT_SCENARIOS})")
+    run_parser.add_argument('--profile', choices=list(PROFILES), default='realistic',
+                            help='模拟服务的延迟和失败配置 (默认: realistic)')
+    run_parser.add_argument('--profile-file', help='覆盖配置字段的JSON文件')
+    run_parser.add_argument('--fixture', default=FIXTURE_PATH, help='搜索结果夹具文件')
+    run_parser.add_argument('--videos', type=int, default=4, help='每个场景处理或搜索的视频数 (默认: 4)')
+    run_parser.add_argument('--audio-seconds', type=float, default=1200, help='每个视频的音频时长秒数 (默认: 1200)')
+    run_parser.add_argument('--download-latency', type=float, default=0.5,
+                            help='每次下载额外等待的秒数，模拟网络下载 (默认: 0.5)')
+    run_parser.add_argument('--download-fail-rate', type=float, default=0.0, help='下载失败的概率 (默认: 0)')
+    run_parser.add_argument('--transcribe-args', default='', help='转录场景额外传入的参数，例如 "--no-vad"')
+    run_parser.add_argument('--repeat', type=int, default=1, help='每个场景运行的次数 (默认: 1)')
+    run_parser.add_argument('--seed', type=int, default=0, help='注入失败使用的随机种子 (默认: 0)')
+    run_parser.add_argument('--label', default='', help='结果的标签，也用作默认的文件名')
+    run_parser.add_argument('--output', help=f'结果JSON文件路径 (默认: {RESULTS_DIR}/<标签或时间>.json)')
+    run_parser.add_argument('--keep-logs', action='store_true', help=f'把被测程序的输出保存到 {RESULTS_DIR}/logs')
+
+    compare_parser = subparsers.add_parser('compare', help='比较两次运行的结果')
+    compare_parser.add_argument('baseline', help='作为基准的结果文件')
+    compare_parser.add_argument('candidate', help='要比较的结果文件')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        if args.videos <= 0 or args.repeat <= 0 or args.audio_seconds <= 0:
+            parser.error("--videos、--repeat 和 --audio-seconds 必须是正数")
+        command_run(args)
+    else:
+        command_compare(args)
+
+if __name__ == "__main__":
+    main()
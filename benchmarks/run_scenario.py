@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+在当前目录中运行一个基准场景，并把测量结果写成JSON
+
+由 run_benchmarks.py 在独立的子进程中调用：各服务地址在模块导入时从环境变量读取，
+独立进程也使峰值内存只包含被测的代码。被测入口的参数放在 -- 之后，例如：
+    python benchmarks/run_scenario.py --scenario transcribe --result result.json -- --pipeline
+
+测量内容：
+- 下载、转录、格式化、保存各阶段每个视频的耗时，以及搜索和验证视频页面的耗时
+- 整个入口函数的运行时间和第一个转录稿保存完成的时间
+- 本进程和子进程（yt-dlp、ffmpeg）的峰值内存
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import threading
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import youtube_transcription
+import search_youtube_videos
+import auto_search_and_transcribe
+
+SCENARIOS = ('transcribe', 'search', 'auto')
+
+class StageTimer:
+    """记录各阶段每次调用的耗时，可以在多个线程中使用"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_saved = None
+        self._lock = threading.Lock()
+        self._durations = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._durations.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_job_stage(self, stage, handler):
+        """包装处理阶段，从缓存或清单中恢复而没有实际执行的阶段不计入耗时"""
+        @wraps(handler)
+        def timed(job):
+            stage_before = job['stage']
+            start = time.perf_counter()
+            raised = True
+            try:
+                handler(job)
+                raised = False
+            finally:
+                if raised or job['stage'] != stage_before or job['error'] is not None:
+                    self.record(stage, time.perf_counter() - start)
+            if stage == 'save' and job['stage'] == 'saved':
+                with self._lock:
+                    if self.first_saved is None:
+                        self.first_saved = time.perf_counter() - self.started
+        return timed
+
+    def durations(self):
+        with self._lock:
+            return {stage: list(values) for stage, values in self._durations.items()}
+
+def instrument(timer, jobs):
+    """替换被测模块中的阶段函数，收集耗时和任务结果"""
+    module = youtube_transcription
+    handlers = []
+    for stage, name in (('download', '_download_stage'), ('transcribe', '_transcribe_stage'),
+                        ('format', '_format_stage'), ('save', '_save_stage')):
+        handler = timer.wrap_job_stage(stage, getattr(module, name))
+        setattr(module, name, handler)
+        handlers.append(handler)
+    module._STAGE_HANDLERS = tuple(handlers)
+
+    print_summary = module._print_summary
+
+    def capture_summary(finished_jobs):
+        jobs.extend(finished_jobs)
+        print_summary(finished_jobs)
+    module._print_summary = capture_summary
+
+    search = timer.wrap('search', search_youtube_videos.search_videos)
+    search_youtube_videos.search_videos = search
+    auto_search_and_transcribe.search_videos = search
+    search_youtube_videos._page_contains_keywords = timer.wrap('verify_page',
+                                                               search_youtube_videos._page_contains_keywords)
+
+def peak_rss_mb(who):
+    # Linux上 ru_maxrss 的单位是KB，macOS上是字节
+    value = resource.getrusage(who).ru_maxrss
+    return value / 1024 / 1024 if sys.platform == 'darwin' else value / 1024
+
+def run(scenario, argv):
+    """运行场景对应的入口函数，返回退出码"""
+    if scenario == 'transcribe':
+        return youtube_transcription.main(argv) or 0
+    if scenario == 'search':
+        # search_youtube_videos.main 直接读取 sys.argv
+        sys.argv = ['search_youtube_videos.py', *argv]
+        return search_youtube_videos.main() or 0
+    return auto_search_and_transcribe.main(argv) or 0
+
+def main():
+    parser = argparse.ArgumentParser(description='在当前目录中运行一个基准场景')
+    parser.add_argument('--scenario', choices=SCENARIOS, required=True, help='被测的入口')
+    parser.add_argument('--result', required=True, help='结果JSON文件路径')
+    parser.add_argument('entry_args', nargs=argparse.REMAINDER, help='传给被测入口的参数，放在 -- 之后')
+    args = parser.parse_args()
+    entry_args = args.entry_args[1:] if args.entry_args[:1] == ['--'] else args.entry_args
+
+    timer = StageTimer()
+    jobs = []
+    instrument(timer, jobs)
+
+    error = None
+    exit_code = 0
+    start = time.perf_counter()
+    try:
+        exit_code = run(args.scenario, entry_args)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        exit_code = 1
+    wall_seconds = time.perf_counter() - start
+
+    links_found = 0
+    if os.path.exists('videos.txt'):
+        with open('videos.txt', 'r', encoding='utf-8') as f:
+            links_found = sum(1 for line in f if line.strip())
+
+    result = {
+        'scenario': args.scenario,
+        'args': entry_args,
+        'exit_code': exit_code,
+        'error': error,
+        'wall_seconds': wall_seconds,
+        'first_saved_seconds': timer.first_saved,
+        'stages': timer.durations(),
+        'jobs': {
+            'total': len(jobs),
+            'succeeded': sum(not job['error'] for job in jobs),
+            'failed': sum(bool(job['error']) for job in jobs),
+            'errors': [job['error'] for job in jobs if job['error']],
+            'format_paths': {path: sum(job['format_path'] == path for job in jobs)
+                             for path in ('local', 'llm', 'mixed')},
+        },
+        'links_found': links_found,
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+        'children_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if error is None else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+磁盘缓存
+
+DiskCache 是一个基于目录的键值缓存：每个条目保存为一个JSON文件，
+文件的修改时间记录最近一次访问，超过容量上限时按最近最少使用(LRU)淘汰。
+
+TranscriptCache 在其之上保存语音识别的原始结果，
+以音频内容的SHA-256作为内容地址，并记录规范视频ID到音频哈希的映射，
+这样在下载之前就能根据视频ID判断是否已经有转录结果。
+
+FormatCache 保存大模型格式化的结果，以模型名、提示词、采样参数和输入文本块
+的哈希作为键，修改提示词或参数后旧的结果自然不会再命中。
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import threading
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    基于目录的LRU键值缓存
+
+    Args:
+        cache_dir: 缓存目录
+        max_bytes: 缓存总大小上限（字节）
+        compress: 是否使用gzip压缩条目
+        refresh: 为True时读取总是未命中，但仍会写入新结果
+
+    超过上限时一次淘汰到上限的 LOW_WATER_RATIO 以下，留出余量，
+    避免之后每次写入都要重新扫描整个缓存目录。
+    """
+
+    LOW_WATER_RATIO = 0.9
+
+    def __init__(self, cache_dir, max_bytes, compress=False, refresh=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        suffix = '.json.gz' if self.compress else '.json'
+        return os.path.join(self.cache_dir, digest[:2], digest + suffix)
+
+    def _entries(self):
+        """遍历缓存中的所有条目，返回 (路径, 修改时间, 大小)"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not (name.endswith('.json') or name.endswith('.json.gz')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _read(self, key):
+        """读取缓存条目但不计入命中统计，未命中时返回None"""
+        if self.refresh:
+            return None
+        path = self._path(key)
+        try:
+            opener = gzip.open if self.compress else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                value = json.load(f)
+            # 更新修改时间作为最近访问时间
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return value
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """
+        读取缓存条目
+
+        Returns:
+            缓存的值，未命中时返回None
+        """
+        value = self._read(key)
+        self._record(value is not None)
+        return value
+
+    def set(self, key, value):
+        """写入缓存条目，必要时淘汰最久未使用的条目"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        if self.compress:
+            data = gzip.compress(data)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            try:
+                self._total_bytes -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        """删除缓存条目"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """按最近访问时间从旧到新淘汰条目，直到总大小低于低水位"""
+        low_water = self.max_bytes * self.LOW_WATER_RATIO
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._total_bytes <= low_water:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'bytes': self._total_bytes,
+        }
+
+class TranscriptCache(DiskCache):
+    """
+    语音识别结果缓存
+
+    - 'audio:<sha256>' 保存语音识别的原始结果
+    - 'video:<platform>:<id>' 保存规范视频ID对应的音频哈希和标题
+
+    不同后端或音频预处理的结果用 tag 区分：音频键带上 tag 前缀，视频映射的键为
+    'video:<tag>:<platform>:<id>'，切换后端或静音裁剪设置时不会读到另一种设置的结果。
+    """
+
+    def __init__(self, cache_dir, max_bytes, refresh=False):
+        super().__init__(cache_dir, max_bytes, compress=True, refresh=refresh)
+
+    def get_by_audio(self, audio_sha256):
+        """根据音频哈希读取识别结果"""
+        return self.get(f"audio:{audio_sha256}")
+
+    @staticmethod
+    def _video_cache_key(video_key, tag=''):
+        return f"video:{tag}:{video_key}" if tag else f"video:{video_key}"
+
+    def get_by_video(self, video_key, tag=''):
+        """
+        根据规范视频ID读取识别结果
+
+        Args:
+            video_key: 规范视频ID
+            tag: 后端和音频预处理的标识，只读取同一 tag 下保存的结果
+
+        Returns:
+            包含 title、audio_sha256 和 result 的字典，未命中时返回None
+        """
+        # 视频映射只是指针，一次查询只按识别结果计一次命中或未命中
+        pointer = self._read(self._video_cache_key(video_key, tag))
+        if pointer is None:
+            self._record(False)
+            return None
+        result = self.get_by_audio(pointer['audio_sha256'])
+        if result is None:
+            return None
+        return dict(pointer, result=result)
+
+    def put(self, audio_sha256, result, video_key=None, title=None, tag=''):
+        """
+        保存识别结果，并在提供视频ID时记录视频到音频的映射
+
+        Args:
+            audio_sha256: 音频键，内容的SHA-256，带 tag 时为 '<tag>:<sha256>'
+            result: 语音识别返回的原始结果
+            video_key: 规范视频ID，形如 'youtube:SJLWfJBR4Y4'
+            title: 视频标题
+            tag: 后端和音频预处理的标识
+        """
+        self.set(f"audio:{audio_sha256}", result)
+        if video_key:
+            self.link_video(video_key, audio_sha256, title, tag)
+
+    def link_video(self, video_key, audio_sha256, title, tag=''):
+        """记录规范视频ID在某个 tag 下对应的音频键和标题"""
+        self.set(self._video_cache_key(video_key, tag), {
+            'video_key': video_key,
+            'audio_sha256': audio_sha256,
+            'title': title,
+        })
+
+class FormatCache(DiskCache):
+    """
+    大模型格式化结果缓存
+
+    键是整个请求体（模型名、系统提示词、用户消息和采样参数）的SHA-256，
+    任何一项改变都会得到新的键。
+    """
+
+    def __init__(self, cache_dir, max_bytes, refresh=False):
+        super().__init__(cache_dir, max_bytes, compress=True, refresh=refresh)
+
+    @staticmethod
+    def request_key(payload):
+        """计算请求体的哈希"""
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return 'completion:' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get_completion(self, payload):
+        """读取请求对应的格式化结果，未命中时返回None"""
+        entry = self.get(self.request_key(payload))
+        return entry['content'] if entry else None
+
+    def put_completion(self, payload, content):
+        """保存请求对应的格式化结果"""
+        self.set(self.request_key(payload), {'content': content})
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Selenium浏览器池
+
+启动一个无头Chrome需要数秒。DriverPool 按需创建最多 size 个浏览器，
+用完后放回池中供下一次搜索或验证复用，多个线程可以同时各自借用一个浏览器，
+程序结束时统一关闭。
+
+ChromeDriver的路径按本机Chrome版本缓存在本地，只有Chrome升级后才需要
+webdriver_manager 重新解析版本和下载；也可以通过 --chromedriver 参数或
+CHROMEDRIVER_PATH 环境变量直接指定，没有网络时退回到已缓存的或PATH中的驱动。
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import threading
+import subprocess
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+
+# 页面加载超时（秒）
+PAGE_LOAD_TIMEOUT = 30
+
+# 直接指定的ChromeDriver路径，以及按Chrome版本缓存驱动路径的文件
+CHROMEDRIVER_PATH = os.environ.get("CHROMEDRIVER_PATH")
+DRIVER_CACHE_PATH = os.path.join(".cache", "chromedriver.json")
+
+# 用于检测Chrome版本的可执行文件
+_CHROME_BINARIES = (
+    'google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome',
+    '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+)
+_VERSION_RE = re.compile(r'(\d+)\.\d+\.\d+\.\d+')
+
+_settings = {
+    'chromedriver_path': CHROMEDRIVER_PATH,
+    'cache_path': DRIVER_CACHE_PATH,
+}
+_resolve_lock = threading.Lock()
+_resolved = None
+
+def configure(chromedriver_path=None, cache_path=None):
+    """
+    修改ChromeDriver的解析方式，之后创建的浏览器使用新的设置
+
+    Args:
+        chromedriver_path: 直接使用的ChromeDriver路径
+        cache_path: 按Chrome版本缓存驱动路径的文件
+    """
+    global _resolved
+    with _resolve_lock:
+        if chromedriver_path is not None:
+            _settings['chromedriver_path'] = chromedriver_path
+        if cache_path is not None:
+            _settings['cache_path'] = cache_path
+        _resolved = None
+
+def detect_chrome_version():
+    """
+    检测本机安装的Chrome版本
+
+    Returns:
+        完整版本号字符串，例如 '126.0.6478.126'，检测不到时返回None
+    """
+    for binary in _CHROME_BINARIES:
+        if os.path.sep not in binary:
+            binary = shutil.which(binary)
+        if not binary or not os.path.exists(binary):
+            continue
+        try:
+            output = subprocess.run([binary, '--version'], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        match = _VERSION_RE.search(output)
+        if match:
+            return match.group(0)
+    return None
+
+def _load_driver_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_driver_cache(cache_path, cache):
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, cache_path)
+
+def _cached_for_major(cache, major):
+    """返回缓存中同一主版本、文件仍然存在的驱动路径"""
+    for version, path in sorted(cache.items(), reverse=True):
+        if version.split('.')[0] == major and os.path.exists(path):
+            return path
+    return None
+
+def resolve_chromedriver():
+    """
+    解析ChromeDriver路径，结果在进程内只解析一次
+
+    依次尝试：直接指定的路径、按当前Chrome版本缓存的路径、webdriver_manager 下载，
+    失败时（例如没有网络）退回到同一主版本的已缓存驱动或PATH中的 chromedriver。
+
+    Returns:
+        (驱动路径, 来源说明, 耗时秒数)，路径为None时交给Selenium自行查找
+    """
+    global _resolved
+    with _resolve_lock:
+        if _resolved is not None:
+            return _resolved
+        started = time.monotonic()
+        path, source = _resolve_uncached()
+        _resolved = (path, source, time.monotonic() - started)
+        return _resolved
+
+def _resolve_uncached():
+    override = _settings['chromedriver_path']
+    if override:
+        if not os.path.exists(override):
+            raise FileNotFoundError(f"指定的ChromeDriver不存在: {override}")
+        return override, '指定路径'
+
+    cache_path = _settings['cache_path']
+    cache = _load_driver_cache(cache_path)
+    chrome_version = detect_chrome_version()
+    if chrome_version and os.path.exists(cache.get(chrome_version, '')):
+        return cache[chrome_version], f'缓存 (Chrome {chrome_version})'
+
+    try:
+        path = ChromeDriverManager().install()
+    except Exception as e:
+        print(f"webdriver_manager 解析ChromeDriver失败: {e}")
+        major = chrome_version.split('.')[0] if chrome_version else None
+        fallback = _cached_for_major(cache, major) if major else None
+        if fallback:
+            return fallback, f'离线使用缓存 (Chrome {major})'
+        fallback = shutil.which('chromedriver')
+        if fallback:
+            return fallback, '离线使用PATH中的chromedriver'
+        return None, '交给Selenium自行查找'
+
+    if chrome_version:
+        cache[chrome_version] = path
+        _save_driver_cache(cache_path, cache)
+    return path, 'webdriver_manager'
+
+def chrome_options():
+    """无头Chrome的启动选项"""
+    options = Options()
+    options.add_argument("--headless")  # 无头模式，不显示浏览器
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    # DOMContentLoaded 后即返回，不等待图片、广告等资源加载完
+    options.page_load_strategy = 'eager'
+    return options
+
+def create_driver():
+    """启动一个新的无头Chrome，并报告驱动解析和浏览器启动的耗时"""
+    path, source, resolve_seconds = resolve_chromedriver()
+    started = time.monotonic()
+    driver = webdriver.Chrome(service=Service(executable_path=path), options=chrome_options())
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    print(f"浏览器启动用时 {time.monotonic() - started:.2f} 秒 "
+          f"(ChromeDriver: {source}，解析用时 {resolve_seconds:.2f} 秒)")
+    return driver
+
+class DriverPool:
+    """
+    可在多个线程之间共享的浏览器池
+
+    Args:
+        size: 最多同时存在的浏览器数量
+        factory: 创建浏览器的函数，默认使用 create_driver
+    """
+
+    def __init__(self, size=2, factory=create_driver):
+        self.size = size
+        self.factory = factory
+        self.created = 0
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        # 优先复用空闲的浏览器，没有空闲且未达到上限时才创建新的，否则等待归还。
+        # 队列中的None表示有浏览器被关闭，等待者应重新检查是否可以创建
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = None
+                with self._lock:
+                    can_create = self.created < self.size
+                    if can_create:
+                        self.created += 1
+                if can_create:
+                    break
+                driver = self._idle.get()
+            if driver is not None:
+                return driver
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._lock:
+                self.created -= 1
+            self._idle.put(None)
+            raise
+        with self._lock:
+            self._all.append(driver)
+        return driver
+
+    def _discard(self, driver):
+        """关闭出错的浏览器，之后需要时会重新创建"""
+        with self._lock:
+            if driver in self._all:
+                self._all.remove(driver)
+                self.created -= 1
+        self._idle.put(None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def driver(self):
+        """
+        借用一个浏览器，用完自动归还
+
+        使用过程中抛出除超时以外的WebDriver异常说明浏览器可能已经不可用，
+        此时关闭它而不是放回池中。
+        """
+        driver = self._acquire()
+        try:
+            yield driver
+        except WebDriverException as e:
+            if isinstance(e, TimeoutException):
+                self._idle.put(driver)
+            else:
+                self._discard(driver)
+            raise
+        except Exception:
+            self._idle.put(driver)
+            raise
+        else:
+            self._idle.put(driver)
+
+    def close(self):
+        """关闭池中所有浏览器"""
+        with self._lock:
+            drivers, self._all = self._all, []
+            self.created = 0
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
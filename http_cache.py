@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+HTTP响应缓存
+
+反复运行搜索时，相同或重叠的关键词会重复请求同样的搜索结果页和视频页面。
+HttpCache 在 DiskCache 之上保存成功的响应（gzip压缩，超过容量上限按LRU淘汰），
+在有效期(TTL)内直接返回缓存内容；过期后如果响应带有 ETag 或 Last-Modified，
+先发送条件请求，服务端返回304时继续使用缓存内容并刷新有效期。
+
+视频页面通过 stream_page 流式读取，调用方找齐关键词后可以提前停止，
+缓存只保存实际读取过的正文前缀；之后再次读取时先给出缓存的前缀，
+不够时才重新请求页面，跳过已经给出的部分继续读取。
+"""
+
+import json
+import time
+import codecs
+import requests
+from disk_cache import DiskCache
+from http_client import get_session
+
+# 随缓存保存的响应头
+_KEPT_HEADERS = ('content-type', 'etag', 'last-modified')
+
+class CachedResponse:
+    """
+    缓存或网络返回的响应，提供与 requests.Response 相同的常用属性
+
+    Args:
+        url: 请求地址
+        status_code: HTTP状态码
+        headers: 响应头字典（键为小写）
+        text: 响应正文
+        source: 'cache'（有效期内命中）、'revalidated'（条件请求返回304）或 'network'
+    """
+
+    def __init__(self, url, status_code, headers, text, source):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.source = source
+
+    @property
+    def from_cache(self):
+        """正文是否来自缓存"""
+        return self.source != 'network'
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+class StreamedPage:
+    """
+    HttpCache.stream_page 返回的流式响应，用法与 requests 的流式响应相同
+
+    Args:
+        cache: 所属的HttpCache
+        key: 缓存键
+        url: 请求地址
+        headers: 请求头，缓存的前缀不够时重新请求使用
+        entry: 缓存条目，没有时为None
+        response: 已经发出的流式请求，直接使用缓存时为None
+        source: 'cache'、'revalidated' 或 'network'
+    """
+
+    def __init__(self, cache, key, url, headers, entry, response, source):
+        self.url = url
+        self.source = source
+        self._cache = cache
+        self._key = key
+        self._request_headers = headers
+        self._response = response
+        self._stored_at = time.time() if source != 'cache' else entry['stored_at']
+        if response is not None and source == 'network':
+            self.status_code = response.status_code
+            self.headers = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+            self._prefix, self._prefix_complete = b'', False
+        else:
+            self.status_code = entry['status_code']
+            self.headers = entry['headers']
+        # 没有声明字符集时requests会假定ISO-8859-1，YouTube的页面实际都是UTF-8
+        content_type = self.headers.get('content-type', '')
+        self.encoding = requests.utils.get_encoding_from_headers(self.headers) if 'charset' in content_type else 'utf-8'
+        if entry is not None and source != 'network':
+            self._prefix = entry['text'].encode(self.encoding)
+            self._prefix_complete = entry.get('complete', True)
+        self._chunks = []
+        self._complete = False
+
+    @property
+    def from_cache(self):
+        """当前给出的正文是否来自缓存，缓存的前缀读完后转为从网络读取"""
+        return self.source != 'network'
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+    def iter_content(self, chunk_size):
+        """按块给出正文，先给出缓存的前缀，不够时再从网络读取剩余部分"""
+        for start in range(0, len(self._prefix), chunk_size):
+            yield self._prefix[start:start + chunk_size]
+        if self._prefix_complete:
+            self._complete = True
+            return
+        skip = len(self._prefix)
+        if self._response is None or self.source != 'network':
+            self._reopen()
+            if self._response.status_code != 200:
+                return
+        for chunk in self._response.iter_content(chunk_size):
+            self._chunks.append(chunk)
+            if skip:
+                chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+                if not chunk:
+                    continue
+            yield chunk
+        self._complete = True
+
+    def _reopen(self):
+        """缓存的前缀不够时，不带条件重新请求页面"""
+        if self._response is not None:
+            self._response.close()
+        self._response = get_session().get(self.url, headers=self._request_headers, stream=True)
+        self.source = 'network'
+        self._stored_at = time.time()
+
+    def close(self):
+        """关闭连接，并把读取到的正文（没有读完时只保存前缀）写入缓存"""
+        if self._response is not None:
+            self._response.close()
+        if self.source == 'cache':
+            return
+        if self.source == 'network':
+            if self._response is None or self._response.status_code != 200:
+                return
+            # 在最后一块上停止读取时迭代没有结束，但正文已经全部读到
+            data = b''.join(self._chunks)
+            complete = self._complete or getattr(self._response.raw, 'length_remaining', None) == 0
+        else:
+            data, complete = self._prefix, self._prefix_complete
+        # 没有读完时丢掉末尾不完整的字符，只保存能完整解码的前缀
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        text = decoder.decode(data, final=complete)
+        self._cache.set(self._key, {
+            'status_code': 200,
+            'headers': self.headers,
+            'text': text,
+            'complete': complete,
+            'stored_at': self._stored_at,
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class HttpCache(DiskCache):
+    """
+    带有效期和条件验证的HTTP响应缓存，可以在多个线程之间共享
+
+    Args:
+        cache_dir: 缓存目录
+        max_bytes: 缓存总大小上限（字节）
+        ttl: 有效期（秒）
+        refresh: 为True时总是重新请求，并用新结果更新缓存
+    """
+
+    def __init__(self, cache_dir, max_bytes, ttl, refresh=False):
+        super().__init__(cache_dir, max_bytes, compress=True, refresh=refresh)
+        self.ttl = ttl
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.fetched = 0
+
+    @staticmethod
+    def request_key(method, url, params=None, json_body=None):
+        """根据请求方法、完整地址和请求体计算缓存键"""
+        prepared = requests.Request(method, url, params=params).prepare()
+        key = f"{method} {prepared.url}"
+        if json_body is not None:
+            key += ' ' + json.dumps(json_body, ensure_ascii=False, sort_keys=True)
+        return key
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def request(self, method, url, params=None, json_body=None, headers=None):
+        """
+        发送请求，有效期内的缓存直接返回，过期的缓存先做条件验证
+
+        只缓存状态码为200的响应，网络错误照常抛出 requests.exceptions.RequestException。
+
+        Returns:
+            CachedResponse
+        """
+        key = self.request_key(method, url, params, json_body)
+        entry = self.get(key)
+        # stream_page 没有读完的页面只保存了前缀，不能作为完整响应使用
+        if entry is not None and not entry.get('complete', True):
+            entry = None
+        now = time.time()
+        if entry is not None and now - entry['stored_at'] < self.ttl:
+            self._count('fresh_hits')
+            return CachedResponse(url, entry['status_code'], entry['headers'], entry['text'], 'cache')
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry['headers'].get('etag'):
+                request_headers['If-None-Match'] = entry['headers']['etag']
+            if entry['headers'].get('last-modified'):
+                request_headers['If-Modified-Since'] = entry['headers']['last-modified']
+
+        response = get_session().request(method, url, params=params, json=json_body, headers=request_headers)
+        if response.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            entry['stored_at'] = now
+            self.set(key, entry)
+            return CachedResponse(url, entry['status_code'], entry['headers'], entry['text'], 'revalidated')
+
+        self._count('fetched')
+        kept = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+        # 没有声明字符集时requests会假定ISO-8859-1，YouTube的页面实际都是UTF-8
+        if 'charset' not in kept.get('content-type', ''):
+            response.encoding = 'utf-8'
+        result = CachedResponse(url, response.status_code, kept, response.text, 'network')
+        if response.status_code == 200:
+            self.set(key, {
+                'status_code': 200,
+                'headers': kept,
+                'text': result.text,
+                'stored_at': now,
+            })
+        return result
+
+    def get_page(self, url, params=None, headers=None):
+        """发送GET请求"""
+        return self.request('GET', url, params=params, headers=headers)
+
+    def stream_page(self, url, headers=None):
+        """
+        流式发送GET请求，调用方可以随时停止读取
+
+        有效期内的缓存不发请求，过期的缓存先做条件验证。关闭时保存读取到的正文，
+        没有读完的页面只保存已经读取的前缀。
+
+        Returns:
+            StreamedPage，应在 with 语句中使用
+        """
+        key = self.request_key('GET', url)
+        entry = self.get(key)
+        if entry is not None and time.time() - entry['stored_at'] < self.ttl:
+            self._count('fresh_hits')
+            return StreamedPage(self, key, url, headers, entry, None, 'cache')
+
+        request_headers = dict(headers or {})
+        # 只有完整的页面才能用条件请求验证，前缀无法和服务端的新内容对比
+        if entry is not None and entry.get('complete', True):
+            if entry['headers'].get('etag'):
+                request_headers['If-None-Match'] = entry['headers']['etag']
+            if entry['headers'].get('last-modified'):
+                request_headers['If-Modified-Since'] = entry['headers']['last-modified']
+
+        response = get_session().get(url, headers=request_headers, stream=True)
+        if response.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            return StreamedPage(self, key, url, headers, entry, response, 'revalidated')
+        self._count('fetched')
+        return StreamedPage(self, key, url, headers, entry, response, 'network')
+
+    def post_json(self, url, json_body, params=None, headers=None):
+        """发送带JSON请求体的POST请求"""
+        return self.request('POST', url, params=params, json_body=json_body, headers=headers)
+
+    def stats(self):
+        """返回缓存命中统计，hit_rate 包括条件验证后继续使用的缓存"""
+        total = self.fresh_hits + self.revalidated + self.fetched
+        return {
+            'hits': self.fresh_hits,
+            'revalidated': self.revalidated,
+            'misses': self.fetched,
+            'hit_rate': (self.fresh_hits + self.revalidated) / total if total else 0.0,
+            'bytes': self._total_bytes,
+        }
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+共享HTTP客户端
+
+所有网络请求都通过同一个 requests.Session 发送：按主机维护连接池并保持长连接，
+避免每个请求（包括每次轮询和每个视频页面验证）都重新建立TCP和TLS连接。
+连接池大小和超时可以配置，并统计连接复用情况。
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# 最多同时保留连接池的主机数、每个主机的最大连接数
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+
+# 默认超时：(连接超时, 读取超时) 秒
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "60"))
+
+_lock = threading.Lock()
+_session = None
+_settings = {
+    'pool_connections': HTTP_POOL_CONNECTIONS,
+    'pool_maxsize': HTTP_POOL_MAXSIZE,
+    'timeout': (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+}
+# 已经被淘汰的连接池的统计数据
+_retired = {'requests': 0, 'connections': 0}
+
+class _CountingAdapter(HTTPAdapter):
+    """连接池被淘汰前把它的统计数据累加到 _retired 中"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            with _lock:
+                _retired['requests'] += pool.num_requests
+                _retired['connections'] += pool.num_connections
+            if dispose:
+                dispose(pool)
+
+        pools.dispose_func = retire
+
+class _Session(requests.Session):
+    """未指定timeout时使用默认超时的Session"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+def _build_session():
+    session = _Session(_settings['timeout'])
+    adapter = _CountingAdapter(pool_connections=_settings['pool_connections'],
+                               pool_maxsize=_settings['pool_maxsize'])
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def configure(pool_connections=None, pool_maxsize=None, timeout=None):
+    """
+    修改连接池大小和默认超时，之后获取的会话使用新的设置
+
+    Args:
+        pool_connections: 最多同时保留连接池的主机数
+        pool_maxsize: 每个主机的最大连接数，应不小于访问同一主机的并发线程数
+        timeout: 默认超时，秒数或 (连接超时, 读取超时) 元组
+    """
+    global _session
+    with _lock:
+        if pool_connections is not None:
+            _settings['pool_connections'] = pool_connections
+        if pool_maxsize is not None:
+            _settings['pool_maxsize'] = pool_maxsize
+        if timeout is not None:
+            _settings['timeout'] = timeout
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
+
+def get_session():
+    """返回进程内共享的Session"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+def connection_stats():
+    """
+    统计连接复用情况
+
+    Returns:
+        包含 requests（请求数）、connections（新建连接数）和 reused（复用连接的请求数）的字典
+    """
+    with _lock:
+        total_requests = _retired['requests']
+        total_connections = _retired['connections']
+        session = _session
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    total_requests += pool.num_requests
+                    total_connections += pool.num_connections
+    return {
+        'requests': total_requests,
+        'connections': total_connections,
+        'reused': max(0, total_requests - total_connections),
+    }
+
+def print_connection_stats():
+    """打印连接复用统计"""
+    stats = connection_stats()
+    if stats['requests']:
+        print(f"HTTP请求 {stats['requests']} 次，新建连接 {stats['connections']} 个，"
+              f"复用连接 {stats['reused']} 次")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+多关键词匹配
+
+验证视频页面时需要判断页面是否同时包含所有关键词。原来的做法对整个页面
+逐个关键词重复 .lower() 和查找，页面往往超过1MB。
+
+KeywordMatcher 只在创建时把关键词转换为小写一次；KeywordScanner 在响应流式到达时
+逐块扫描，每块只转换一次小写，并且只查找尚未出现的关键词，
+所有关键词都出现后立即报告完成，调用方可以就此停止读取剩余内容。
+
+查找使用字符串内置的子串搜索（C实现），对于几个关键词的规模，
+它比正则表达式多选一分支或纯Python实现的Aho-Corasick自动机都更快，
+见 benchmarks/bench_keyword_matcher.py。
+"""
+
+import codecs
+
+# 扫描字符串时按此长度分段，找齐关键词后不再转换剩余文本
+SCAN_CHUNK_CHARS = 64 * 1024
+
+class KeywordMatcher:
+    """
+    为一组关键词构建的匹配器，不区分大小写，可以在多个线程之间共享
+
+    Args:
+        keywords: 关键词列表
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [keyword for keyword in keywords if keyword]
+        self.targets = tuple(dict.fromkeys(keyword.lower() for keyword in self.keywords))
+        self.max_length = max((len(target) for target in self.targets), default=0)
+
+    def scanner(self, encoding=None):
+        """
+        创建一个流式扫描器
+
+        Args:
+            encoding: 输入为字节时使用的编码，None表示输入为字符串
+        """
+        return KeywordScanner(self, encoding)
+
+    def contains_all(self, text):
+        """判断文本是否包含所有关键词，找齐后不再处理剩余文本"""
+        return self.scan_stream(text[start:start + SCAN_CHUNK_CHARS]
+                                for start in range(0, len(text), SCAN_CHUNK_CHARS))
+
+    def scan_stream(self, chunks, encoding=None):
+        """
+        扫描逐块到达的内容，找齐所有关键词后立即停止读取
+
+        Args:
+            chunks: 字符串或字节块的可迭代对象，例如 response.iter_content()
+            encoding: 字节块使用的编码，None表示输入为字符串
+
+        Returns:
+            是否包含所有关键词
+        """
+        scanner = self.scanner(encoding)
+        if scanner.complete:
+            return True
+        for chunk in chunks:
+            if scanner.feed(chunk):
+                return True
+        return scanner.complete
+
+class KeywordScanner:
+    """
+    流式扫描状态，记录尚未找到的关键词
+
+    跨块出现的关键词通过保留上一块末尾 max_length - 1 个字符来识别。
+    """
+
+    def __init__(self, matcher, encoding=None):
+        self.matcher = matcher
+        self.missing = list(matcher.targets)
+        self.bytes_read = 0
+        self._tail = ''
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace') if encoding else None
+
+    @property
+    def complete(self):
+        """是否已经找到所有关键词"""
+        return not self.missing
+
+    def feed(self, chunk):
+        """
+        扫描下一块内容
+
+        Returns:
+            所有关键词都已找到时返回True
+        """
+        if not self.missing:
+            return True
+        if self._decoder is not None:
+            self.bytes_read += len(chunk)
+            chunk = self._decoder.decode(chunk)
+        text = self._tail + chunk.lower()
+        self.missing = [target for target in self.missing if target not in text]
+        keep = self.matcher.max_length - 1
+        self._tail = text[-keep:] if keep > 0 else ''
+        return not self.missing
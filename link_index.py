@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+视频链接索引
+
+videos.txt 中的链接按规范视频ID（见 video_links.py）保存在SQLite索引中，
+youtu.be短链接、带时间参数的watch链接和Selenium取到的各种链接形式
+都对应同一条记录，判断链接是否已存在只需一次主键查询。
+
+打开索引时从上次同步的位置读取 videos.txt 新增的完整行，第一次打开时把现有的
+videos.txt 全部导入；文件没有变化时只需比较一次文件状态，读取的内容与历史长度无关。
+手动在末尾添加的链接会在下次打开时被收录，没有换行结尾的最后一行可能还没写完，
+等到写完后再收录。文件换了inode、变得比同步位置短，或同步位置之前的一小段内容
+与上次不同时，说明文件被改写过（例如删除了链接），按当前文件重建索引。
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from video_links import video_key
+
+# 索引数据库所在目录，每个链接文件对应一个数据库
+LINK_INDEX_DIR = os.path.join(".cache", "link_index")
+
+# 检查文件是否被改写时比较的同步位置之前的字节数
+CHECK_WINDOW_BYTES = 4096
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_key TEXT NOT NULL UNIQUE,
+    link TEXT NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def link_key(link):
+    """链接在索引中的键，无法识别平台的链接使用原始链接"""
+    return video_key(link) or f"raw:{link}"
+
+class LinkIndex:
+    """
+    按规范视频ID去重的链接索引，可以在多个线程之间共享
+
+    Args:
+        links_file: 链接文件路径，新链接同时追加到该文件
+        db_path: 索引数据库路径，默认为 LINK_INDEX_DIR 下与链接文件同名的数据库
+    """
+
+    def __init__(self, links_file='videos.txt', db_path=None):
+        self.links_file = links_file
+        if db_path is None:
+            db_path = os.path.join(LINK_INDEX_DIR, f"{os.path.basename(links_file)}.sqlite3")
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _get_meta(self, name, default=0):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return default
+        return type(default)(row[0])
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def _insert(self, link):
+        """插入一条链接，已存在同一视频时忽略，返回是否为新链接"""
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO links (video_key, link, added_at) VALUES (?, ?, ?)",
+            (link_key(link), link, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def sync(self):
+        """
+        收录链接文件中上次同步之后新增的完整行
+
+        检测到文件被改写过时清空索引并按当前文件重新收录，文件中已经删除的链接不再保留。
+        只检查同步位置之前的一小段内容，只改动了文件前面部分且长度不变的改写不会被发现。
+
+        Returns:
+            新收录的链接数量
+        """
+        with self._lock, self._conn:
+            return self._sync_locked()
+
+    def _sync_locked(self):
+        try:
+            stat = os.stat(self.links_file)
+        except FileNotFoundError:
+            return 0
+        # 文件的inode、修改时间和大小都没变时不需要读取内容
+        stamp = f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}"
+        if self._get_meta('file_stamp', '') == stamp:
+            return 0
+        offset = self._get_meta('synced_bytes')
+        with open(self.links_file, 'rb') as f:
+            # 换了文件、文件变短或同步位置之前的一小段内容变了，都说明文件被改写过
+            window_start = max(0, offset - CHECK_WINDOW_BYTES)
+            f.seek(window_start)
+            window = f.read(offset - window_start)
+            if (str(stat.st_ino) != self._get_meta('file_ino', '') or stat.st_size < offset
+                    or hashlib.sha1(window).hexdigest() != self._get_meta('window_hash', '')):
+                self._conn.execute("DELETE FROM links")
+                offset, window = 0, b''
+                f.seek(0)
+            data = f.read()
+        # 只收录以换行结尾的完整行，写到一半的最后一行留到下次
+        end = data.rfind(b'\n') + 1
+        now = time.time()
+        rows = [(link_key(line), line, now)
+                for line in map(str.strip, data[:end].decode('utf-8', errors='replace').splitlines()) if line]
+        added = self._conn.executemany(
+            "INSERT OR IGNORE INTO links (video_key, link, added_at) VALUES (?, ?, ?)", rows
+        ).rowcount
+        self._set_meta('synced_bytes', offset + end)
+        self._set_meta('window_hash', hashlib.sha1((window + data[:end])[-CHECK_WINDOW_BYTES:]).hexdigest())
+        self._set_meta('file_ino', stat.st_ino)
+        self._set_meta('file_stamp', stamp)
+        return added
+
+    def __contains__(self, link):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM links WHERE video_key = ?", (link_key(link),)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+
+    def filter_new(self, links, limit=None):
+        """
+        筛选出索引中还没有的链接，同一视频只保留第一次出现的链接形式
+
+        Args:
+            links: 链接列表
+            limit: 最多返回的链接数量，为None时不限制
+
+        Returns:
+            新链接列表（尚未添加到索引）
+        """
+        new_links = []
+        seen = set()
+        for link in links:
+            if limit is not None and len(new_links) >= limit:
+                break
+            key = link_key(link)
+            if key not in seen and link not in self:
+                seen.add(key)
+                new_links.append(link)
+        return new_links
+
+    def add(self, links):
+        """
+        添加链接，同一视频的链接只保留第一次出现的那个，新链接同时追加到链接文件
+
+        Args:
+            links: 链接列表
+
+        Returns:
+            实际新增的链接列表
+        """
+        with self._lock, self._conn:
+            self._sync_locked()
+            # 没有换行结尾的最后一行会在追加时补上换行，先收录它，同一视频不再重复追加
+            for line in self._unsynced_lines():
+                self._insert(line)
+            new_links = [link for link in links if self._insert(link)]
+            if new_links:
+                self._append_to_file(new_links)
+                self._sync_locked()
+        return new_links
+
+    def _unsynced_lines(self):
+        """链接文件中同步位置之后的行，即没有换行结尾的最后一行"""
+        try:
+            with open(self.links_file, 'rb') as f:
+                f.seek(self._get_meta('synced_bytes'))
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        return [line for line in map(str.strip, data.decode('utf-8', errors='replace').splitlines()) if line]
+
+    def _append_to_file(self, links):
+        prefix = ''
+        try:
+            with open(self.links_file, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    # 文件末尾没有换行时先补一个，避免与最后一行连在一起
+                    if f.read(1) != b'\n':
+                        prefix = '\n'
+        except FileNotFoundError:
+            pass
+        with open(self.links_file, 'a', encoding='utf-8') as f:
+            f.write(prefix + ''.join(f"{link}\n" for link in links))
+
+    def file_links(self):
+        """
+        按文件顺序返回链接文件中当前的链接，同一视频只返回第一次出现的链接形式
+
+        与 links() 不同，没有换行结尾的最后一行也包括在内。
+        """
+        try:
+            with open(self.links_file, 'r', encoding='utf-8', errors='replace') as f:
+                lines = [line.strip() for line in f]
+        except FileNotFoundError:
+            return []
+        links = []
+        seen = set()
+        for line in lines:
+            key = link_key(line) if line else None
+            if key and key not in seen:
+                seen.add(key)
+                links.append(line)
+        return links
+
+    def links(self):
+        """按收录顺序返回所有链接，同一视频只返回一次"""
+        with self._lock:
+            rows = self._conn.execute("SELECT link FROM links ORDER BY seq").fetchall()
+        return [row[0] for row in rows]
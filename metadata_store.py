@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+视频元数据存储
+
+下载音频时yt-dlp会写出视频的info JSON，这里只保留标题、ID、时长、
+上传者、上传日期等常用字段，按规范视频ID保存为本地JSON文件。
+之后的运行以及调度、命名、去重等环节都可以直接读取，不需要再访问网络。
+"""
+
+import os
+import re
+import json
+import threading
+
+# 从yt-dlp的info JSON中保留的字段
+METADATA_FIELDS = (
+    'id', 'title', 'duration', 'uploader', 'uploader_id', 'channel',
+    'upload_date', 'webpage_url', 'extractor', 'ext',
+)
+
+def extract_metadata(info):
+    """从yt-dlp的info JSON中提取需要保留的字段"""
+    return {field: info.get(field) for field in METADATA_FIELDS if info.get(field) is not None}
+
+class MetadataStore:
+    """
+    按规范视频ID保存视频元数据
+
+    Args:
+        store_dir: 存储目录
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, video_key):
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', video_key)
+        return os.path.join(self.store_dir, f"{safe_key}.json")
+
+    def get(self, video_key):
+        """
+        读取视频元数据
+
+        Returns:
+            元数据字典，不存在时返回None
+        """
+        try:
+            with open(self._path(video_key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, video_key, metadata):
+        """保存视频元数据，已有的字段会被新值覆盖"""
+        path = self._path(video_key)
+        with self._lock:
+            merged = self.get(video_key) or {}
+            merged.update(metadata)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(merged, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
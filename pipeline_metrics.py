@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+流水线运行指标
+
+记录每个视频在各阶段（yt-dlp下载、静音裁剪、上传、识别排队、识别处理、大模型格式化、保存、
+搜索和页面验证）的耗时、传输的字节数、HTTP状态码、重试次数和轮询次数，
+一次运行结束时：
+
+- 事件逐条追加到 events.jsonl，每行一个JSON对象，带有本次运行的 run_id
+- 各阶段的耗时分位数和计数写成Prometheus文本格式的 <命令>.prom，可以由
+  node_exporter 的 textfile collector 采集
+- 打印各阶段 p50/p95 耗时的汇总表
+
+指标在进程内共享，与 http_client 一样由入口脚本配置一次。被测的函数用 timed 装饰，
+函数内部用 add、status 给当前阶段累加计数，不需要在函数之间传递记录器；
+当前阶段保存在 contextvars 中，异步客户端的协程也能归属到正确的视频。
+提交到线程池的函数需要用 bind 包装才能继承当前阶段。未配置时所有调用都不做任何事。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import inspect
+import threading
+import contextvars
+from functools import wraps
+
+# 指标文件的默认目录
+METRICS_DIR = os.path.join(".cache", "metrics")
+
+# 汇总表和Prometheus文件中阶段的顺序，未列出的阶段排在最后
+STAGE_ORDER = ('search', 'search_page', 'verify_page', 'download', 'vad', 'upload', 'asr_queued',
+               'asr_processing', 'transcribe', 'llm', 'format', 'save')
+
+# 汇总表中显示的计数
+SUMMARY_COUNTERS = (('bytes', '流量(MB)', 1024 * 1024), ('retries', '重试', 1), ('polls', '轮询', 1))
+
+_current = contextvars.ContextVar('pipeline_metrics_span', default=None)
+_lock = threading.Lock()
+_active = None
+
+def percentile(values, q):
+    """线性插值的百分位数，values 为空时返回None"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class Span:
+    """
+    一次阶段调用，计数可以从多个线程累加
+
+    stage 为None的根节点只用来标记所属的视频，不作为事件记录。
+    """
+
+    def __init__(self, metrics, stage, video=None):
+        self.metrics = metrics
+        self.stage = stage
+        self.video = video
+        self.started = time.perf_counter()
+        self.ok = True
+        self.error = None
+        self.counts = {}
+        self.statuses = {}
+        self.fields = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def status(self, code):
+        with self._lock:
+            self.statuses[str(code)] = self.statuses.get(str(code), 0) + 1
+
+    def tag(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def fail(self, error):
+        self.ok = False
+        self.error = error
+
+class PipelineMetrics:
+    """
+    一次运行的指标记录器
+
+    Args:
+        metrics_dir: 指标文件目录，为None时只在内存中汇总
+        command: 入口命令名，用于Prometheus文件名和标签
+    """
+
+    def __init__(self, metrics_dir=METRICS_DIR, command='pipeline'):
+        self.metrics_dir = metrics_dir
+        self.command = command
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._failures = {}
+        self._counts = {}
+        self._statuses = {}
+        self._videos = {}
+        self._events = None
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+            self._events = open(os.path.join(metrics_dir, 'events.jsonl'), 'a', encoding='utf-8')
+        self.event('run_start', argv=sys.argv[1:])
+
+    def event(self, name, **fields):
+        """追加一条事件，每条都立即写入文件，进程中途退出时已有的事件不会丢失"""
+        if self._events is None:
+            return
+        line = json.dumps(dict(ts=round(time.time(), 3), run=self.run_id, event=name, **fields),
+                          ensure_ascii=False)
+        with self._lock:
+            self._events.write(line + '\n')
+            self._events.flush()
+
+    def record(self, span, seconds):
+        """记录一次结束的阶段调用"""
+        with self._lock:
+            self._durations.setdefault(span.stage, []).append(seconds)
+            if not span.ok:
+                self._failures[span.stage] = self._failures.get(span.stage, 0) + 1
+            counts = self._counts.setdefault(span.stage, {})
+            for name, value in span.counts.items():
+                counts[name] = counts.get(name, 0) + value
+            statuses = self._statuses.setdefault(span.stage, {})
+            for code, value in span.statuses.items():
+                statuses[code] = statuses.get(code, 0) + value
+            if span.video:
+                video = self._videos.setdefault(span.video, {'seconds': {}, 'counts': {}, 'statuses': {},
+                                                             'failures': 0})
+                video['seconds'][span.stage] = video['seconds'].get(span.stage, 0) + seconds
+                for name, value in span.counts.items():
+                    video['counts'][name] = video['counts'].get(name, 0) + value
+                for code, value in span.statuses.items():
+                    video['statuses'][code] = video['statuses'].get(code, 0) + value
+                video['failures'] += not span.ok
+        fields = dict(span.fields, stage=span.stage, seconds=round(seconds, 4), ok=span.ok)
+        if span.video:
+            fields['video'] = span.video
+        if span.error:
+            fields['error'] = span.error
+        if span.counts:
+            fields['counts'] = span.counts
+        if span.statuses:
+            fields['http_status'] = span.statuses
+        self.event('stage', **fields)
+
+    def summary(self):
+        """
+        各阶段的汇总
+
+        Returns:
+            {阶段: {count, failures, p50, p95, max, total, counts, statuses}}，按 STAGE_ORDER 排序
+        """
+        with self._lock:
+            stages = sorted(self._durations, key=lambda stage: (
+                STAGE_ORDER.index(stage) if stage in STAGE_ORDER else len(STAGE_ORDER), stage))
+            return {stage: {
+                'count': len(self._durations[stage]),
+                'failures': self._failures.get(stage, 0),
+                'p50': percentile(self._durations[stage], 0.5),
+                'p95': percentile(self._durations[stage], 0.95),
+                'max': max(self._durations[stage]),
+                'total': sum(self._durations[stage]),
+                'counts': dict(self._counts.get(stage, {})),
+                'statuses': dict(self._statuses.get(stage, {})),
+            } for stage in stages}
+
+    def print_summary(self):
+        """打印各阶段耗时的汇总表"""
+        summary = self.summary()
+        if not summary:
+            return
+        header = f"{'阶段':<16}{'次数':>6}{'失败':>6}{'p50(s)':>10}{'p95(s)':>10}{'最大(s)':>10}{'合计(s)':>10}"
+        header += ''.join(f"{label:>10}" for _, label, _ in SUMMARY_COUNTERS) + "  HTTP状态"
+        print(f"\n各阶段耗时 (运行 {self.run_id}):")
+        print(header)
+        for stage, stats in summary.items():
+            row = (f"{stage:<16}{stats['count']:>6}{stats['failures']:>6}{stats['p50']:>10.3f}"
+                   f"{stats['p95']:>10.3f}{stats['max']:>10.3f}{stats['total']:>10.1f}")
+            for name, _, scale in SUMMARY_COUNTERS:
+                value = stats['counts'].get(name)
+                if value is None:
+                    cell = '-'
+                else:
+                    cell = f"{value / scale:.1f}" if scale > 1 else f"{value:g}"
+                row += f"{cell:>10}"
+            statuses = ' '.join(f"{code}×{count}" for code, count in sorted(stats['statuses'].items()))
+            print(f"{row}  {statuses or '-'}")
+
+    def prometheus_text(self):
+        """Prometheus文本格式的指标"""
+        summary = self.summary()
+        command = _label(self.command)
+        lines = [
+            '# HELP pipeline_stage_duration_seconds 各阶段每次调用的耗时',
+            '# TYPE pipeline_stage_duration_seconds summary',
+        ]
+        for stage, stats in summary.items():
+            labels = f'command="{command}",stage="{_label(stage)}"'
+            lines.append(f'pipeline_stage_duration_seconds{{{labels},quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'pipeline_stage_duration_seconds{{{labels},quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'pipeline_stage_duration_seconds_sum{{{labels}}} {stats["total"]:.6f}')
+            lines.append(f'pipeline_stage_duration_seconds_count{{{labels}}} {stats["count"]}')
+        lines += ['# HELP pipeline_stage_failures_total 各阶段失败的调用次数',
+                  '# TYPE pipeline_stage_failures_total counter']
+        for stage, stats in summary.items():
+            lines.append(f'pipeline_stage_failures_total{{command="{command}",stage="{_label(stage)}"}} '
+                         f'{stats["failures"]}')
+        names = sorted({name for stats in summary.values() for name in stats['counts']})
+        for name in names:
+            metric = f"pipeline_{_metric_name(name)}_total"
+            lines += [f'# HELP {metric} 各阶段累计的 {name}', f'# TYPE {metric} counter']
+            for stage, stats in summary.items():
+                if name in stats['counts']:
+                    lines.append(f'{metric}{{command="{command}",stage="{_label(stage)}"}} '
+                                 f'{stats["counts"][name]:g}')
+        lines += ['# HELP pipeline_http_responses_total 各阶段收到的HTTP响应数，按状态码',
+                  '# TYPE pipeline_http_responses_total counter']
+        for stage, stats in summary.items():
+            for code, count in sorted(stats['statuses'].items()):
+                lines.append(f'pipeline_http_responses_total{{command="{command}",stage="{_label(stage)}",'
+                             f'code="{_label(code)}"}} {count}')
+        lines += [
+            '# HELP pipeline_videos 本次运行处理的视频数',
+            '# TYPE pipeline_videos gauge',
+            f'pipeline_videos{{command="{command}"}} {len(self._videos)}',
+            '# HELP pipeline_run_duration_seconds 本次运行的总耗时',
+            '# TYPE pipeline_run_duration_seconds gauge',
+            f'pipeline_run_duration_seconds{{command="{command}"}} {time.time() - self.started:.3f}',
+            '# HELP pipeline_run_timestamp_seconds 本次运行开始的时间',
+            '# TYPE pipeline_run_timestamp_seconds gauge',
+            f'pipeline_run_timestamp_seconds{{command="{command}"}} {self.started:.3f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        """写出每个视频的汇总事件和Prometheus文件，打印汇总表"""
+        with self._lock:
+            videos = {video: dict(data) for video, data in self._videos.items()}
+        for video, data in videos.items():
+            self.event('video', video=video, seconds={stage: round(seconds, 4)
+                                                      for stage, seconds in data['seconds'].items()},
+                       counts=data['counts'], http_status=data['statuses'], failures=data['failures'])
+        self.event('run_end', seconds=round(time.time() - self.started, 3), videos=len(videos))
+        if self.metrics_dir:
+            prom_file = os.path.join(self.metrics_dir, f"{self.command}.prom")
+            # 先写临时文件再替换，采集程序不会读到写了一半的文件
+            with open(prom_file + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(prom_file + '.tmp', prom_file)
+        if self._events is not None:
+            with self._lock:
+                self._events.close()
+                self._events = None
+        self.print_summary()
+        if self.metrics_dir:
+            print(f"运行指标已写入 {self.metrics_dir} (events.jsonl, {self.command}.prom)")
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() or c == '_' else '_' for c in name)
+
+def start_run(metrics_dir=METRICS_DIR, command=None):
+    """
+    开始记录本次运行的指标，之后 timed 装饰的函数和 add、status 调用都记录到其中
+
+    Args:
+        metrics_dir: 指标文件目录
+        command: 入口命令名，默认使用脚本文件名
+
+    Returns:
+        PipelineMetrics实例
+    """
+    global _active
+    if command is None:
+        command = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'pipeline'
+    metrics = PipelineMetrics(metrics_dir, command)
+    with _lock:
+        _active = metrics
+    return metrics
+
+def finish_run():
+    """结束本次运行：写出指标文件并打印汇总表，没有进行中的运行时不做任何事"""
+    global _active
+    with _lock:
+        metrics, _active = _active, None
+    if metrics is not None:
+        metrics.close()
+
+def active():
+    """当前正在记录的 PipelineMetrics，未开始记录时返回None"""
+    return _active
+
+def current():
+    """当前上下文所在的阶段，没有时返回None"""
+    return _current.get()
+
+class _Scope:
+    """进入时把 span 设为当前阶段，退出时恢复；stage 不为None时记录这次调用"""
+
+    def __init__(self, span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self):
+        if self.span is not None:
+            self.span.started = time.perf_counter()
+            self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        _current.reset(self._token)
+        if self.span.stage is not None:
+            if exc is not None:
+                self.span.fail(f"{type(exc).__name__}: {exc}")
+            self.span.metrics.record(self.span, time.perf_counter() - self.span.started)
+        return False
+
+def _new_span(stage, video=None):
+    metrics = _active
+    if metrics is None:
+        return None
+    parent = _current.get()
+    if video is None and parent is not None:
+        video = parent.video
+    return Span(metrics, stage, video)
+
+def span(stage, video=None):
+    """
+    记录一段代码作为一次阶段调用
+
+        with pipeline_metrics.span('search_page'):
+            response = session.get(...)
+            pipeline_metrics.status(response.status_code)
+
+    Args:
+        stage: 阶段名
+        video: 所属视频，默认继承外层阶段的视频
+    """
+    return _Scope(_new_span(stage, video))
+
+def video(key):
+    """把代码块内的所有阶段归属到视频 key，本身不记录耗时"""
+    return _Scope(_new_span(None, key))
+
+def timed(stage, check=None):
+    """
+    装饰器：把函数的每次调用记录为一次阶段调用，同时支持普通函数和协程函数
+
+    Args:
+        stage: 阶段名
+        check: 以返回值为参数的函数，返回False时这次调用记为失败（适用于出错时返回None而不抛出异常的函数）
+    """
+    def decorate(func):
+        def finish(current_span, result):
+            if current_span is not None and check is not None and not check(result):
+                current_span.fail('返回了失败结果')
+            return result
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage) as current_span:
+                    return finish(current_span, await func(*args, **kwargs))
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage) as current_span:
+                return finish(current_span, func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+def bind(func):
+    """
+    包装提交到线程池的函数，使它在工作线程中继承调用 bind 时所在的阶段
+
+    contextvars 不会自动传递到 ThreadPoolExecutor 的工作线程中。
+    """
+    parent = _current.get()
+    if parent is None:
+        return func
+
+    @wraps(func)
+    def bound(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+def add(span=None, **counts):
+    """给当前阶段（或指定的 span）累加计数，例如 add(bytes=1024, retries=1)"""
+    span = span or _current.get()
+    if span is not None:
+        span.add(**counts)
+
+def status(code, span=None):
+    """记录当前阶段收到的一个HTTP状态码"""
+    span = span or _current.get()
+    if span is not None:
+        span.status(code)
+
+def record_response(response, span=None):
+    """
+    记录一次HTTP响应的状态码和正文大小
+
+    HttpCache 返回的响应正文来自缓存时不计流量，只标记 cache_hit。
+    """
+    span = span or _current.get()
+    if span is None:
+        return
+    span.status(response.status_code)
+    if getattr(response, 'from_cache', False):
+        span.tag(cache_hit=True)
+    elif hasattr(response, 'content'):
+        span.add(bytes=len(response.content))
+    else:
+        span.add(bytes=len(response.text.encode('utf-8')))
+
+def tag(span=None, **fields):
+    """给当前阶段的事件附加字段，例如 tag(path='local')"""
+    span = span or _current.get()
+    if span is not None:
+        span.tag(**fields)
+
+def observe(stage, seconds, span=None, ok=True, **counts):
+    """
+    记录一次已知耗时的阶段调用，用于由状态变化推算的时间，例如识别任务的排队和处理时间
+
+    Args:
+        stage: 阶段名
+        seconds: 耗时（秒）
+        span: 所属的阶段，默认为当前阶段，用于继承视频
+        ok: 是否成功
+        counts: 计数
+    """
+    parent = span or _current.get()
+    metrics = parent.metrics if parent is not None else _active
+    if metrics is None:
+        return
+    observed = Span(metrics, stage, parent.video if parent is not None else None)
+    if counts:
+        observed.add(**counts)
+    if not ok:
+        observed.fail('失败')
+    metrics.record(observed, seconds)
+
+def fail(error, span=None):
+    """把当前阶段记为失败，用于出错时不抛出异常的代码"""
+    span = span or _current.get()
+    if span is not None:
+        span.fail(error)
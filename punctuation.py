@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+本地标点规整
+
+AssemblyAI已经按 punctuate、format_text 返回带标点的文本，大多数转录稿不需要
+再经过大模型。本模块在本地完成标点规整和清理：
+
+1. 中日韩文字旁边的半角标点转换为全角，去掉重复的标点
+2. 去掉单独出现的语气词（嗯、呃），连续重复的语气词和用标点隔开的重复口头禅只保留一次
+3. 中日韩文字之间的单个空白是分词留下的，直接去掉；连续多个空白才是停顿，转换为逗号
+
+规整之后按标点的密度、句末标点的数量、最长的无标点片段和平均分句长度给文本打分，
+只有标点不足或断句过碎的文本才需要交给大模型。
+"""
+
+import re
+
+# 评分达到该值的文本认为标点已经足够，不需要大模型
+MIN_SCORE = 0.8
+
+# 期望平均每隔多少个字出现一个标点、一个句末标点
+CLAUSE_CHARS = 20
+SENTENCE_CHARS = 80
+
+# 没有任何标点的片段超过该长度时开始扣分
+MAX_RUN_CHARS = 60
+
+# 平均每个分句少于该字数时认为断句过碎，开始扣分
+MIN_CLAUSE_CHARS = 4
+
+# 少于该字数的文本不评分，直接认为足够
+MIN_SCORED_CHARS = 20
+
+_CJK = '\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff'
+_HALF_TO_FULL = {',': '，', '.': '。', '?': '？', '!': '！', ':': '：', ';': '；'}
+_ALL_PUNCTUATION = '，。！？、；：…,.!?;:'
+_SENTENCE_END = '。！？…!?'
+
+# 紧挨中日韩文字的半角标点（前后可能带空白），小数点和英文句子中的标点不受影响
+_HALF_AFTER_CJK = re.compile(rf'(?<=[{_CJK}])\s*([,.?!:;])(?![\d.])\s*')
+_HALF_BEFORE_CJK = re.compile(rf'(?<![\d.])\s*([,.?!:;])\s*(?=[{_CJK}])')
+_ELLIPSIS = re.compile(r'\.{3,}|。{3,}|…+')
+
+# 前后都是标点、空白或文本边界的语气词（粤语的“唔”是否定词，不能去掉）
+_STANDALONE_FILLER = re.compile(
+    r'(?:^|(?<=[\s，。！？、；：,.!?]))(?:嗯|呃)+(?:[，、,]\s*|\s+|(?=[。！？；：.!?;:]|$))'
+)
+# 连续重复的语气词；“这个”“就是”等也是常用词，只有用标点隔开的重复才合并
+_REPEATED_FILLER = re.compile(r'(嗯|呃|啊)(?:[，、,\s]*\1)+')
+_REPEATED_PHRASE = re.compile(r'(那个|这个|就是|然后)(?:\s*[，、,]\s*\1)+')
+
+# 中日韩文字之间的分词空白和停顿标记（连续多个空白）
+_WORD_GAP = re.compile(rf'(?<=[{_CJK}])[ \t\u3000](?=[{_CJK}])')
+_PAUSE = re.compile(rf'(?<=[{_CJK}])[ \t\u3000]{{2,}}(?=[{_CJK}])')
+
+# 重复的标点、句末标点前多余的逗号、开头的逗号
+_REPEATED_MARK = re.compile(r'([，。！？、；：])\1+')
+_COMMA_BEFORE_END = re.compile(r'[，、；：]+(?=[。！？…])')
+_LEADING_COMMA = re.compile(r'(?:^|(?<=\n))[，、；：\s]+')
+
+_UNPUNCTUATED_RUN = re.compile(rf'[^{_ALL_PUNCTUATION}\n]+')
+
+def normalize_punctuation(text):
+    """中日韩文字旁边的半角标点转换为全角，并去掉重复或多余的标点"""
+    text = _ELLIPSIS.sub('…', text)
+    text = _HALF_AFTER_CJK.sub(lambda m: _HALF_TO_FULL[m.group(1)], text)
+    text = _HALF_BEFORE_CJK.sub(lambda m: _HALF_TO_FULL[m.group(1)], text)
+    text = _REPEATED_MARK.sub(r'\1', text)
+    text = _COMMA_BEFORE_END.sub('', text)
+    return _LEADING_COMMA.sub('', text)
+
+def remove_fillers(text):
+    """去掉单独出现的语气词，连续重复的语气词和用标点隔开的重复口头禅只保留一次"""
+    text = _REPEATED_FILLER.sub(r'\1', text)
+    text = _REPEATED_PHRASE.sub(r'\1', text)
+    return _STANDALONE_FILLER.sub('', text)
+
+def split_at_pauses(text):
+    """把中日韩文字之间的停顿标记（连续多个空白）转换为逗号，去掉单个的分词空白"""
+    text = _PAUSE.sub('，', text)
+    return _WORD_GAP.sub('', text)
+
+def clean_text(text):
+    """
+    本地规整转录文本：标点全角化、去掉语气词、停顿处断句
+
+    Returns:
+        规整后的文本，以中日韩文字结尾时补上句号
+    """
+    text = normalize_punctuation(split_at_pauses(remove_fillers(text.strip())))
+    if text and re.match(rf'[{_CJK}]', text[-1]):
+        text += '。'
+    return text
+
+def punctuation_score(text):
+    """
+    评价文本的标点是否充分
+
+    分别计算标点密度、句末标点密度、最长无标点片段和平均分句长度四项得分，取其中最低的一项。
+    标点过密（例如每个词后面都是逗号）和标点不足一样需要交给大模型。
+
+    Returns:
+        0到1之间的分数，1表示标点充分
+    """
+    length = len(re.sub(r'\s', '', text))
+    if length < MIN_SCORED_CHARS:
+        return 1.0
+    marks = sum(text.count(mark) for mark in _ALL_PUNCTUATION)
+    ends = sum(text.count(mark) for mark in _SENTENCE_END)
+    longest_run = max((len(run.strip()) for run in _UNPUNCTUATED_RUN.findall(text)), default=0)
+    return min(
+        1.0,
+        marks * CLAUSE_CHARS / length,
+        ends * SENTENCE_CHARS / length,
+        MAX_RUN_CHARS / longest_run if longest_run else 1.0,
+        length / (marks * MIN_CLAUSE_CHARS) if marks else 1.0,
+    )
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+运行清单
+
+使用SQLite记录每个规范视频的处理进度：下载、上传、转录、格式化、保存
+各阶段的完成时间、中间结果以及出错次数。
+程序中途崩溃后再次运行时，可以从每个链接最后完成的阶段继续，
+也可以只列出或重试失败的链接。
+"""
+
+import time
+import sqlite3
+import threading
+
+# 处理阶段，按先后顺序排列
+STAGES = ('downloaded', 'uploaded', 'transcribed', 'formatted', 'saved')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_key TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    title TEXT,
+    stage TEXT,
+    audio_file TEXT,
+    upload_url TEXT,
+    transcript TEXT,
+    formatted TEXT,
+    md_file TEXT,
+    downloaded_at REAL,
+    uploaded_at REAL,
+    transcribed_at REAL,
+    formatted_at REAL,
+    saved_at REAL,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_failed ON videos(updated_at) WHERE last_error IS NOT NULL;
+"""
+
+# mark() 允许更新的字段
+_STAGE_FIELDS = ('title', 'audio_file', 'upload_url', 'transcript', 'formatted', 'md_file')
+
+def stage_reached(current_stage, stage):
+    """判断 current_stage 是否已经达到或超过 stage"""
+    if current_stage is None:
+        return False
+    return STAGES.index(current_stage) >= STAGES.index(stage)
+
+class RunManifest:
+    """
+    基于SQLite的运行清单，可以在多个线程之间共享
+
+    Args:
+        db_path: 数据库文件路径
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def get(self, video_key):
+        """
+        读取一个视频的记录
+
+        Returns:
+            记录字典，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM videos WHERE video_key = ?", (video_key,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def ensure(self, video_key, link):
+        """
+        确保视频存在记录，不存在时创建
+
+        Returns:
+            该视频的记录字典
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO videos (video_key, link, updated_at) VALUES (?, ?, ?)",
+                (video_key, link, time.time())
+            )
+        return self.get(video_key)
+
+    def mark(self, video_key, stage, **fields):
+        """
+        记录视频完成了某个阶段，并保存该阶段产生的中间结果
+
+        Args:
+            video_key: 规范视频ID
+            stage: STAGES 中的阶段名称
+            **fields: 要同时更新的字段，例如 title、audio_file、transcript
+        """
+        if stage not in STAGES:
+            raise ValueError(f"未知的阶段: {stage}")
+        unknown = set(fields) - set(_STAGE_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的字段: {', '.join(sorted(unknown))}")
+        now = time.time()
+        assignments = ["stage = ?", f"{stage}_at = ?", "updated_at = ?"]
+        values = [stage, now, now]
+        for name, value in fields.items():
+            assignments.append(f"{name} = ?")
+            values.append(value)
+        if stage == 'saved':
+            assignments.append("last_error = NULL")
+        values.append(video_key)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE videos SET {', '.join(assignments)} WHERE video_key = ?", values
+            )
+
+    def record_error(self, video_key, message):
+        """记录视频处理出错，出错次数加一"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE videos SET error_count = error_count + 1, last_error = ?, updated_at = ? "
+                "WHERE video_key = ?",
+                (message, time.time(), video_key)
+            )
+
+    def failures(self):
+        """
+        列出最近一次处理失败的视频
+
+        Returns:
+            记录字典列表，按最近更新时间排序
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM videos WHERE last_error IS NOT NULL ORDER BY updated_at"
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -9,10 +9,31 @@
 """
 
 import os
-import re
 import argparse
+import threading
 import requests
-from bs4 import BeautifulSoup
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from http_client import get_session, configure as configure_http, print_connection_stats
+import pipeline_metrics
+from http_cache import HttpCache
+from keyword_matcher import KeywordMatcher
+from link_index import LinkIndex
+from youtube_search_client import DEFAULT_HEADERS, YOUTUBE_BASE_URL, iter_search_results
+from pipeline_metrics import METRICS_DIR
+
+# 并发验证视频页面的线程数，以及对同一主机同时发出的最大请求数
+VERIFY_WORKERS = 8
+PER_HOST_LIMIT = 4
+
+# 流式读取视频页面时每次读取的字节数
+VERIFY_CHUNK_SIZE = 64 * 1024
+
+# 搜索结果页和视频页面的HTTP缓存目录、有效期（小时）和默认容量上限
+HTTP_CACHE_DIR = os.path.join(".cache", "http")
+HTTP_CACHE_TTL_HOURS = 6
+HTTP_CACHE_MAX_MB = 256
 
 def read_keywords_config(file_path):
     """
@@ -56,143 +77,227 @@ def read_keywords_config(file_path):
         
     return keywords, limit
 
-def read_existing_links(file_path):
+def search_videos(keywords, platform='youtube', max_results=20, verify_workers=VERIFY_WORKERS,
+                  per_host_limit=PER_HOST_LIMIT, http_cache=None, on_match=None):
     """
-    读取现有的视频链接
+    搜索视频，支持YouTube和抖音
     
     Args:
-        file_path: videos.txt文件的路径
+        keywords: 搜索关键词列表
+        platform: 搜索平台，可选 'youtube' 或 'douyin'
+        max_results: 最多返回的结果数量
+        verify_workers: 并发验证视频页面的线程数
+        per_host_limit: 对同一主机同时发出的最大请求数
+        http_cache: HttpCache实例，为None时不使用缓存
+        on_match: 每确认一个符合条件的视频就立即调用的回调函数，参数为视频链接
         
     Returns:
-        包含所有现有链接的集合
+        包含视频链接的列表
     """
-    existing_links = set()
-    
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                line = line.strip()
-                if line and line.startswith('http'):
-                    existing_links.add(line)
+    combined_keyword = ' '.join(keywords)
     
-    return existing_links
+    if platform == 'youtube':
+        return search_youtube(keywords, max_results, verify_workers, per_host_limit, http_cache, on_match)
+    elif platform == 'douyin':
+        print(f"抖音搜索功能尚未实现，将使用YouTube搜索代替")
+        return search_youtube(keywords, max_results, verify_workers, per_host_limit, http_cache, on_match)
+    else:
+        print(f"不支持的平台: {platform}，将使用YouTube搜索代替")
+        return search_youtube(keywords, max_results, verify_workers, per_host_limit, http_cache, on_match)
 
-def save_links(file_path, links):
+class _HostLimiter:
+    """按主机限制同时进行的请求数"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+@pipeline_metrics.timed('verify_page')
+def _page_contains_keywords(url, matcher, headers, limiter, stop, http_cache=None):
     """
-    保存链接到文件
+    流式获取视频页面并检查是否包含所有关键词，关键词找齐后不再读取剩余内容
     
-    Args:
-        file_path: videos.txt文件的路径
-        links: 要保存的链接列表
-    """
-    mode = 'a' if os.path.exists(file_path) else 'w'
+    使用HTTP缓存时同样流式读取，缓存只保存实际读取过的页面前缀。
     
-    with open(file_path, mode, encoding='utf-8') as file:
-        for link in links:
-            file.write(f"{link}\n")
+    Returns:
+        包含所有关键词时返回True，不包含、出错或已取消时返回False
+    """
+    with limiter(url):
+        if stop.is_set():
+            return False
+        try:
+            if http_cache is not None:
+                response = http_cache.stream_page(url, headers=headers)
+            else:
+                response = get_session().get(url, headers=headers, stream=True)
+                # 没有声明字符集时requests会假定ISO-8859-1，视频页面实际都是UTF-8
+                if 'charset' not in response.headers.get('content-type', ''):
+                    response.encoding = 'utf-8'
+            with response:
+                pipeline_metrics.status(response.status_code)
+                response.raise_for_status()
+                scanner = matcher.scanner(response.encoding)
+                for chunk in response.iter_content(VERIFY_CHUNK_SIZE):
+                    # 来自缓存的部分不计流量
+                    if getattr(response, 'from_cache', False):
+                        pipeline_metrics.tag(cache_hit=True)
+                    else:
+                        pipeline_metrics.add(bytes=len(chunk))
+                    # 已经找到足够的视频时放弃读取剩余内容
+                    if stop.is_set():
+                        return False
+                    if scanner.feed(chunk):
+                        return True
+                return scanner.complete
+        except requests.exceptions.RequestException as e:
+            # 跳过出错的视频
+            pipeline_metrics.fail(str(e))
+            return False
 
-def search_videos(keywords, platform='youtube', max_results=20):
+def verify_videos(video_ids, keywords, max_results, headers, workers=VERIFY_WORKERS,
+                  per_host_limit=PER_HOST_LIMIT, http_cache=None, on_match=None):
     """
-    搜索视频，支持YouTube和抖音
+    并发验证视频页面是否包含所有关键词
+    
+    页面按候选顺序提交给线程池，同时进行的请求不超过 workers 个，
+    结果也按候选顺序判定，因此返回的总是候选列表中前 max_results 个符合条件的视频，
+    与各请求完成的先后无关。一旦确定了这些视频，不再提交新的请求，
+    尚未开始的请求会被取消，正在读取的请求也会尽快中止。
     
     Args:
+        video_ids: 按搜索结果顺序排列的候选视频ID，可以是按需产生ID的生成器
         keywords: 搜索关键词列表
-        platform: 搜索平台，可选 'youtube' 或 'douyin'
         max_results: 最多返回的结果数量
+        headers: 请求头
+        workers: 并发验证的线程数
+        per_host_limit: 对同一主机同时发出的最大请求数
+        http_cache: HttpCache实例，为None时不使用缓存
+        on_match: 每确认一个符合条件的视频就立即调用的回调函数，参数为视频链接
         
     Returns:
-        包含视频链接的列表
+        符合条件的视频链接列表
     """
-    combined_keyword = ' '.join(keywords)
+    filtered_video_links = []
+    if max_results <= 0:
+        return filtered_video_links
     
-    if platform == 'youtube':
-        return search_youtube(keywords, max_results)
-    elif platform == 'douyin':
-        print(f"抖音搜索功能尚未实现，将使用YouTube搜索代替")
-        return search_youtube(keywords, max_results)
-    else:
-        print(f"不支持的平台: {platform}，将使用YouTube搜索代替")
-        return search_youtube(keywords, max_results)
+    matcher = KeywordMatcher(keywords)
+    stop = threading.Event()
+    limiter = _HostLimiter(per_host_limit)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    video_ids = iter(video_ids)
+    base_url = YOUTUBE_BASE_URL.rstrip('/')
+    pending = deque()
+    
+    def submit_next():
+        vid = next(video_ids, None)
+        if vid is not None:
+            # 页面从配置的服务地址获取，返回的始终是规范的YouTube链接
+            future = executor.submit(_page_contains_keywords, f"{base_url}/watch?v={vid}",
+                                     matcher, headers, limiter, stop, http_cache)
+            pending.append((f"https://www.youtube.com/watch?v={vid}", future))
+    
+    try:
+        # 只提交有限数量的请求，前面的结果判定后再补充，避免靠后的候选抢占连接
+        for _ in range(workers):
+            submit_next()
+        while pending:
+            video_url, future = pending.popleft()
+            submit_next()
+            if future.result():
+                filtered_video_links.append(video_url)
+                print(f"找到符合条件的视频: {video_url}")
+                if on_match:
+                    on_match(video_url)
+                if len(filtered_video_links) >= max_results:
+                    break
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return filtered_video_links
 
-def search_youtube(keywords, max_results=20):
+@pipeline_metrics.timed('search')
+def search_youtube(keywords, max_results=20, verify_workers=VERIFY_WORKERS, per_host_limit=PER_HOST_LIMIT,
+                   http_cache=None, on_match=None):
     """
     使用网页抓取搜索YouTube视频
     
     Args:
         keywords: 搜索关键词列表
         max_results: 最多返回的结果数量
+        verify_workers: 并发验证视频页面的线程数
+        per_host_limit: 对同一主机同时发出的最大请求数
+        http_cache: HttpCache实例，为None时不使用缓存
+        on_match: 每确认一个符合条件的视频就立即调用的回调函数，参数为视频链接
         
     Returns:
         包含视频链接的列表
     """
-    # 构建主要关键词搜索URL (使用所有关键词)
     combined_keyword = ' '.join(keywords)
-    search_url = f"https://www.youtube.com/results?search_query={'+'.join(combined_keyword.split())}"
-    
-    # 发送请求
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    headers = DEFAULT_HEADERS
     
     print(f"正在搜索同时包含关键词 '{combined_keyword}' 的YouTube视频...")
     
     try:
-        response = requests.get(search_url, headers=headers)
-        response.raise_for_status()
-        
-        # 解析页面内容
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 提取视频ID和标题
-        video_data = []
-        
-        # 提取视频ID
-        video_ids = re.findall(r"watch\?v=(\S{11})", response.text)
-        unique_ids = []
-        
-        # 去重
-        for vid in video_ids:
-            if vid not in unique_ids:
-                unique_ids.append(vid)
-        
-        # 对每个视频获取更多信息，验证是否包含所有关键词
-        filtered_video_links = []
-        count = 0
+        # 候选视频按需从搜索结果中取出，验证需要更多候选时才会请求下一页
+        results = iter_search_results(combined_keyword, headers=headers, http_cache=http_cache)
+        candidate_ids = (video['video_id'] for video in results)
         
+        # 并发获取视频页面，验证是否包含所有关键词
         print(f"正在验证视频是否包含所有关键词...")
-        for vid in unique_ids:
-            if count >= max_results:
-                break
-                
-            video_url = f"https://www.youtube.com/watch?v={vid}"
-            
-            try:
-                # 获取视频页面
-                video_response = requests.get(video_url, headers=headers)
-                video_response.raise_for_status()
-                
-                # 检查是否包含所有关键词
-                all_keywords_found = True
-                for keyword in keywords:
-                    if keyword.lower() not in video_response.text.lower():
-                        all_keywords_found = False
-                        break
-                
-                if all_keywords_found:
-                    filtered_video_links.append(video_url)
-                    count += 1
-                    print(f"找到符合条件的视频: {video_url}")
-            
-            except requests.exceptions.RequestException:
-                # 跳过出错的视频
-                continue
-        
-        return filtered_video_links
+        links = verify_videos(candidate_ids, keywords, max_results, headers,
+                              workers=verify_workers, per_host_limit=per_host_limit, http_cache=http_cache,
+                              on_match=on_match)
+        pipeline_metrics.add(results=len(links))
+        return links
     
     except requests.exceptions.RequestException as e:
         print(f"搜索时出错: {e}")
         return []
 
+def add_http_cache_arguments(parser, refresh_flags=('--refresh-http-cache',)):
+    """
+    添加HTTP缓存的命令行参数，本脚本和 auto_search_and_transcribe.py 共用
+    
+    Args:
+        parser: argparse.ArgumentParser实例
+        refresh_flags: 强制重新请求的参数名，auto_search_and_transcribe.py 的 --refresh 已用于转录缓存
+    """
+    parser.add_argument('--no-http-cache', action='store_true', help='不使用搜索页面和视频页面的HTTP缓存')
+    parser.add_argument(*refresh_flags, dest='refresh_http_cache', action='store_true',
+                        help='忽略已有的HTTP缓存重新请求，并用新结果更新缓存')
+    parser.add_argument('--http-cache-dir', default=HTTP_CACHE_DIR, help=f'HTTP缓存目录 (默认: {HTTP_CACHE_DIR})')
+    parser.add_argument('--http-cache-ttl', type=float, default=HTTP_CACHE_TTL_HOURS,
+                        help=f'HTTP缓存有效期小时数 (默认: {HTTP_CACHE_TTL_HOURS})')
+    parser.add_argument('--http-cache-max-mb', type=int, default=HTTP_CACHE_MAX_MB,
+                        help=f'HTTP缓存容量上限 MB (默认: {HTTP_CACHE_MAX_MB})')
+
+def validate_http_cache_arguments(parser, args):
+    """检查HTTP缓存参数，不合法时通过 parser.error 退出"""
+    if args.http_cache_ttl < 0 or args.http_cache_max_mb <= 0:
+        parser.error("--http-cache-ttl 不能为负数，--http-cache-max-mb 必须是正整数")
+
+def open_http_cache(args):
+    """
+    按命令行参数创建HTTP缓存
+    
+    Returns:
+        HttpCache实例，使用 --no-http-cache 时返回None
+    """
+    if args.no_http_cache:
+        return None
+    return HttpCache(args.http_cache_dir, args.http_cache_max_mb * 1024 * 1024,
+                     ttl=args.http_cache_ttl * 3600, refresh=args.refresh_http_cache)
+
 def main():
     parser = argparse.ArgumentParser(description='搜索YouTube和抖音视频并保存链接')
     parser.add_argument('--keywords-file', default='keywords.txt', help='关键词文件路径 (默认: keywords.txt)')
@@ -200,8 +305,25 @@ def main():
     parser.add_argument('--output', default='videos.txt', help='输出文件路径 (默认: videos.txt)')
     parser.add_argument('--platform', choices=['youtube', 'douyin', 'all'], default='youtube', 
                         help='搜索平台 (默认: youtube，可选: youtube, douyin, all)')
+    parser.add_argument('--http-timeout', type=float, default=30, help='HTTP请求的读取超时秒数 (默认: 30)')
+    parser.add_argument('--verify-workers', type=int, default=VERIFY_WORKERS,
+                        help=f'并发验证视频页面的线程数 (默认: {VERIFY_WORKERS})')
+    parser.add_argument('--per-host-limit', type=int, default=PER_HOST_LIMIT,
+                        help=f'对同一主机同时发出的最大请求数 (默认: {PER_HOST_LIMIT})')
+    add_http_cache_arguments(parser, refresh_flags=('--refresh', '--refresh-http-cache'))
+    parser.add_argument('--metrics-dir', default=METRICS_DIR,
+                        help=f'运行指标目录，写入 events.jsonl 事件日志和Prometheus格式的 .prom 文件 (默认: {METRICS_DIR})')
+    parser.add_argument('--no-metrics', action='store_true', help='不记录运行指标，结束时也不打印各阶段耗时')
     
     args = parser.parse_args()
+    if args.verify_workers <= 0 or args.per_host_limit <= 0:
+        parser.error("--verify-workers 和 --per-host-limit 必须是正整数")
+    validate_http_cache_arguments(parser, args)
+    configure_http(timeout=(10, args.http_timeout))
+    if not args.no_metrics:
+        pipeline_metrics.start_run(args.metrics_dir)
+    
+    http_cache = open_http_cache(args)
     
     # 读取关键词和配置
     keywords, config_limit = read_keywords_config(args.keywords_file)
@@ -211,35 +333,42 @@ def main():
     limit = args.limit if args.limit is not None else config_limit
     print(f"每次最多添加 {limit} 个新链接")
     
-    # 读取现有链接
-    existing_links = read_existing_links(args.output)
-    print(f"已存在 {len(existing_links)} 个链接")
+    # 打开链接索引，只收录videos.txt上次同步之后新增的内容
+    index = LinkIndex(args.output)
+    print(f"已存在 {len(index)} 个视频")
     
     # 搜索新链接
     all_links = []
     
     if args.platform in ['youtube', 'all']:
-        youtube_links = search_videos(keywords, 'youtube', limit * 2)
+        youtube_links = search_videos(keywords, 'youtube', limit * 2, args.verify_workers, args.per_host_limit,
+                                      http_cache)
         print(f"YouTube搜索找到 {len(youtube_links)} 个视频")
         all_links.extend(youtube_links)
     
     if args.platform in ['douyin', 'all']:
-        douyin_links = search_videos(keywords, 'douyin', limit * 2)
+        douyin_links = search_videos(keywords, 'douyin', limit * 2, args.verify_workers, args.per_host_limit,
+                                     http_cache)
         print(f"抖音搜索找到 {len(douyin_links)} 个视频")
         all_links.extend(douyin_links)
     
-    # 过滤掉已存在的链接
-    new_links = [link for link in all_links if link not in existing_links]
-    
-    # 限制数量
-    new_links = new_links[:limit]
+    # 过滤掉已存在的视频并限制数量，同一视频的不同链接形式只算一个
+    new_links = index.filter_new(all_links, limit)
     
     # 保存新链接
     if new_links:
-        save_links(args.output, new_links)
+        index.add(new_links)
         print(f"已添加 {len(new_links)} 个新链接到 {args.output}")
     else:
         print("未找到新链接")
+    index.close()
+    
+    if http_cache is not None:
+        stats = http_cache.stats()
+        print(f"HTTP缓存: 命中 {stats['hits']} 次，验证后复用 {stats['revalidated']} 次，"
+              f"未命中 {stats['misses']} 次，命中率 {stats['hit_rate']:.0%}")
+    print_connection_stats()
+    pipeline_metrics.finish_run()
     
 if __name__ == "__main__":
     main() 
\ No newline at end of file
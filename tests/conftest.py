@@ -0,0 +1,37 @@
+"""
+测试共用的夹具
+
+测试不访问任何外部服务：AssemblyAI、DeepSeek和YouTube的请求都发给
+benchmarks/mock_services.py 在本地启动的模拟服务。
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT_DIR, os.path.join(ROOT_DIR, 'benchmarks')]
+
+import assemblyai_client
+from mock_services import AUDIO_BYTES_PER_SECOND, MockServices, load_fixture, load_profile
+
+@pytest.fixture
+def services():
+    """没有延迟和随机失败的模拟服务，需要的失败由测试用 inject 注入"""
+    with MockServices(load_profile('fast'), load_fixture()) as services:
+        yield services
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    """缩短轮询间隔并去掉上传重试前的退避等待"""
+    monkeypatch.setattr(assemblyai_client, 'MIN_POLL_INTERVAL', 0.05)
+    monkeypatch.setattr(assemblyai_client, 'QUEUED_POLL_INTERVAL', 0.05)
+    monkeypatch.setattr(assemblyai_client, 'upload_backoff', lambda attempt: 0)
+
+@pytest.fixture
+def audio_file(tmp_path):
+    """10秒音频大小的文件，模拟服务按大小推算音频时长"""
+    path = tmp_path / 'audio.m4a'
+    path.write_bytes(os.urandom(10 * AUDIO_BYTES_PER_SECOND))
+    return str(path)
@@ -0,0 +1,100 @@
+"""AssemblyAI客户端：对本地模拟服务上传、提交和轮询"""
+
+import asyncio
+
+import pytest
+
+import assemblyai_client
+from assemblyai_client import AssemblyAIError, AsyncAssemblyAIClient
+from mock_services import AUDIO_BYTES_PER_SECOND, generate_text
+from transcription_backends import AssemblyAIBackend
+
+def _run(coro):
+    return asyncio.run(coro)
+
+def test_async_client_polls_many_transcripts_to_completion(services, fast_polling, audio_file):
+    async def main():
+        async with AsyncAssemblyAIClient('test-key', base_url=services.base_url) as client:
+            return await client.transcribe_many([audio_file] * 3, [10] * 3), client.poll_count
+
+    results, poll_count = _run(main())
+    assert [result['status'] for result in results] == ['completed'] * 3
+    assert sorted(result['text'] for result in results) == sorted(
+        generate_text(10, True, seed)[0] for seed in range(3))
+    assert poll_count == services.stats()['assemblyai.poll']['requests']
+
+def test_async_client_error_status_fails_only_that_transcript(services, fast_polling, audio_file):
+    async def main():
+        async with AsyncAssemblyAIClient('test-key', base_url=services.base_url) as client:
+            upload_url = await client.upload(audio_file)
+            good = await client.submit(upload_url)
+            services.inject('asr')
+            bad = await client.submit(upload_url)
+            return await asyncio.gather(client.wait(good, 10), client.wait(bad, 10), client.wait('missing', 10),
+                                        return_exceptions=True)
+
+    good, bad, missing = _run(main())
+    assert good['status'] == 'completed'
+    assert isinstance(bad, AssemblyAIError) and '模拟的识别失败' in str(bad)
+    assert isinstance(missing, AssemblyAIError) and '404' in str(missing)
+
+def test_async_client_gives_up_after_deadline(services, fast_polling, audio_file, monkeypatch):
+    monkeypatch.setattr(assemblyai_client, 'TRANSCRIPT_MIN_WAIT', 0.3)
+    monkeypatch.setattr(assemblyai_client, 'TRANSCRIPT_WAIT_FACTOR', 0)
+    services.profile['asr_queue_seconds'] = 30
+
+    async def main():
+        async with AsyncAssemblyAIClient('test-key', base_url=services.base_url) as client:
+            return await client.transcribe(audio_file, 10)
+
+    with pytest.raises(AssemblyAIError, match='超时'):
+        _run(main())
+
+def test_backend_polls_until_completed(services, fast_polling, audio_file):
+    backend = AssemblyAIBackend('test-key', base_url=services.base_url)
+    result = backend.transcribe(audio_file, audio_duration=10)
+    assert result['text'] == generate_text(10, True, 0)[0]
+
+def test_backend_returns_none_on_error_status(services, fast_polling, audio_file):
+    services.inject('asr')
+    backend = AssemblyAIBackend('test-key', base_url=services.base_url)
+    assert backend.transcribe(audio_file, audio_duration=10) is None
+
+def test_backend_with_async_client(services, fast_polling, audio_file):
+    backend = AssemblyAIBackend('test-key', base_url=services.base_url, async_client=True)
+    try:
+        result = backend.transcribe(audio_file, audio_duration=10)
+    finally:
+        backend.close()
+    assert result['status'] == 'completed'
+
+def test_stream_upload_retries_after_dropped_connection(services, fast_polling, audio_file):
+    services.inject('upload_drop')
+    upload_url = assemblyai_client.stream_upload(audio_file, 'test-key', services.base_url, chunk_size=8 * 1024)
+    assert upload_url.startswith(services.base_url)
+    stats = services.stats()
+    assert stats['assemblyai.upload_dropped']['requests'] == 1
+    assert stats['assemblyai.upload']['requests'] == 1
+    assert stats['assemblyai.upload']['bytes_in'] == 10 * AUDIO_BYTES_PER_SECOND
+
+def test_stream_upload_retries_server_errors_then_gives_up(services, fast_polling, audio_file):
+    services.inject('upload', times=2)
+    assert assemblyai_client.stream_upload(audio_file, 'test-key', services.base_url, max_retries=2)
+    services.inject('upload', times=3)
+    with pytest.raises(AssemblyAIError, match='已重试 2 次'):
+        assemblyai_client.stream_upload(audio_file, 'test-key', services.base_url, max_retries=2)
+
+def test_async_upload_retries_after_dropped_connection(services, fast_polling, audio_file):
+    services.inject('upload_drop', times=2)
+
+    async def main():
+        async with AsyncAssemblyAIClient('test-key', base_url=services.base_url) as client:
+            return await client.upload(audio_file, chunk_size=8 * 1024)
+
+    assert _run(main()).startswith(services.base_url)
+    assert services.stats()['assemblyai.upload_dropped']['requests'] == 2
+
+def test_backend_transcribes_after_dropped_upload(services, fast_polling, audio_file):
+    services.inject('upload_drop')
+    backend = AssemblyAIBackend('test-key', base_url=services.base_url)
+    assert backend.transcribe(audio_file, audio_duration=10)['text'] == generate_text(10, True, 0)[0]
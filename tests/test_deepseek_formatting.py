@@ -0,0 +1,63 @@
+"""DeepSeek分块格式化：对本地模拟的 chat completions 接口并发请求"""
+
+import re
+
+import pytest
+
+import youtube_transcription
+from disk_cache import FormatCache
+from mock_services import generate_text
+from punctuation import MIN_SCORE, clean_text, punctuation_score
+
+def _strip_marks(text):
+    return re.sub(r'[，。！？、\s]', '', text)
+
+@pytest.fixture
+def deepseek(services, monkeypatch):
+    monkeypatch.setattr(youtube_transcription, 'DEEPSEEK_BASE_URL', services.base_url)
+    monkeypatch.setattr(youtube_transcription, 'DEEPSEEK_API_KEY', 'test-key')
+    return services
+
+def test_split_text_into_chunks_respects_budget_and_keeps_text():
+    text = generate_text(600, True)[0]
+    chunks = youtube_transcription.split_text_into_chunks(text, max_tokens=200)
+    assert len(chunks) > 1
+    assert ''.join(chunks) == text
+    assert all(youtube_transcription.estimate_tokens(chunk) <= 200 for chunk in chunks)
+    # 带标点的文本只在句末或停顿处切开
+    assert all(chunk[-1] in '，。' for chunk in chunks)
+
+def test_chunks_are_formatted_concurrently_and_stitched_in_order(deepseek):
+    text = generate_text(600, False)[0]
+    chunks = youtube_transcription.split_text_into_chunks(text, 300)
+    formatted = youtube_transcription.format_text_with_deepseek(text, concurrency=4, max_chunk_tokens=300)
+    assert deepseek.stats()['deepseek.chat']['requests'] == len(chunks) > 1
+    assert _strip_marks(formatted) == text
+    assert '。' in formatted
+
+def test_failed_chunk_keeps_original_text(deepseek):
+    text = generate_text(600, False)[0]
+    deepseek.inject('llm')
+    formatted = youtube_transcription.format_text_with_deepseek(text, concurrency=4, max_chunk_tokens=300)
+    assert deepseek.stats()['deepseek.chat']['errors'] == 1
+    assert _strip_marks(formatted) == text
+
+def test_format_transcript_sends_only_unpunctuated_chunks(deepseek):
+    punctuated = generate_text(300, True, seed=1)[0]
+    unpunctuated = generate_text(300, False, seed=2)[0]
+    formatted, method = youtube_transcription.format_transcript(punctuated + unpunctuated, max_chunk_tokens=300)
+    assert method == 'mixed'
+    chunks = youtube_transcription.split_text_into_chunks(clean_text(punctuated + unpunctuated), 300)
+    weak = [chunk for chunk in chunks if punctuation_score(chunk) < MIN_SCORE]
+    assert 0 < len(weak) < len(chunks)
+    assert deepseek.stats()['deepseek.chat']['requests'] == len(weak)
+    assert formatted.startswith(punctuated[:100])
+    assert _strip_marks(formatted) == _strip_marks(punctuated + unpunctuated)
+
+def test_format_cache_avoids_repeated_requests(deepseek, tmp_path):
+    cache = FormatCache(str(tmp_path / 'formatted'), 10 * 1024 * 1024)
+    text = generate_text(300, False)[0]
+    first = youtube_transcription.format_text_with_deepseek(text, max_chunk_tokens=300, cache=cache)
+    requests = deepseek.stats()['deepseek.chat']['requests']
+    assert youtube_transcription.format_text_with_deepseek(text, max_chunk_tokens=300, cache=cache) == first
+    assert deepseek.stats()['deepseek.chat']['requests'] == requests
@@ -0,0 +1,88 @@
+"""YouTube搜索：解析本地模拟服务按夹具生成的搜索结果页和翻页接口"""
+
+import itertools
+
+import pytest
+
+import search_youtube_videos
+import youtube_search_client
+from http_cache import HttpCache
+from http_client import get_session
+from youtube_search_client import (
+    extract_initial_data, extract_innertube_config, iter_search_results, parse_search_page
+)
+
+QUERY = '紫微斗数 命理'
+
+@pytest.fixture
+def youtube(services, monkeypatch):
+    monkeypatch.setattr(youtube_search_client, 'YOUTUBE_BASE_URL', services.base_url)
+    monkeypatch.setattr(search_youtube_videos, 'YOUTUBE_BASE_URL', services.base_url)
+    return services
+
+def test_parse_results_page(youtube):
+    html = get_session().get(f"{youtube.base_url}/results", params={'search_query': QUERY}).text
+    data = extract_initial_data(html)
+    videos, token = parse_search_page(data)
+    per_page = youtube.fixture['per_page']
+    assert [video['video_id'] for video in videos] == [video['id'] for video in youtube.videos[:per_page]]
+    assert videos[0]['title'] == youtube.videos[0]['title']
+    assert videos[0]['description'] == youtube.videos[0]['description']
+    assert token == 'page-1'
+    api_key, context = extract_innertube_config(html)
+    assert api_key == 'bench-key'
+    assert context['client']['clientVersion'] == '2.20240101.00.00'
+
+def test_iter_search_results_follows_continuations(youtube):
+    ids = [video['video_id'] for video in iter_search_results(QUERY)]
+    assert ids == [video['id'] for video in youtube.videos]
+    stats = youtube.stats()
+    assert stats['youtube.results']['requests'] == 1
+    assert stats['youtube.search']['requests'] == youtube.fixture['pages'] - 1
+
+def test_iter_search_results_requests_pages_on_demand(youtube):
+    per_page = youtube.fixture['per_page']
+    first = list(itertools.islice(iter_search_results(QUERY), per_page))
+    assert len(first) == per_page
+    assert 'youtube.search' not in youtube.stats()
+    assert len(list(iter_search_results(QUERY, max_pages=2))) == 2 * per_page
+
+def test_search_youtube_returns_matching_videos_in_order(youtube):
+    links = search_youtube_videos.search_youtube(youtube.fixture['keywords'], max_results=5)
+    expected = [f"https://www.youtube.com/watch?v={video['id']}" for video in youtube.videos if video['matches']]
+    assert links == expected[:5]
+
+def _cached_page(cache, base_url, video):
+    return cache.get(cache.request_key('GET', f"{base_url}/watch?v={video['id']}"))
+
+def test_verify_with_http_cache_stops_early_and_caches_prefix(youtube, tmp_path):
+    cache = HttpCache(str(tmp_path / 'http'), 256 * 1024 * 1024, ttl=3600)
+    keywords = youtube.fixture['keywords']
+    videos = youtube.videos[:4]
+    expected = [f"https://www.youtube.com/watch?v={video['id']}" for video in videos if video['matches']]
+    links = search_youtube_videos.verify_videos([video['id'] for video in videos], keywords, len(videos), {},
+                                                workers=1, http_cache=cache)
+    assert links == expected
+    page_kb = youtube.fixture['watch_page_kb']
+    for video in videos:
+        entry = _cached_page(cache, youtube.base_url, video)
+        # 符合条件的页面找齐关键词后就停止读取，只缓存读到的前缀
+        assert entry['complete'] == (not video['matches'])
+        if video['matches']:
+            assert len(entry['text'].encode('utf-8')) < page_kb * 1024 // 2
+    assert search_youtube_videos.verify_videos([video['id'] for video in videos], keywords, len(videos), {},
+                                               workers=1, http_cache=cache) == expected
+    assert youtube.stats()['youtube.watch']['requests'] == len(videos)
+
+def test_cached_prefix_is_extended_when_more_content_is_needed(youtube, tmp_path):
+    cache = HttpCache(str(tmp_path / 'http'), 256 * 1024 * 1024, ttl=3600)
+    video = next(video for video in youtube.videos if video['matches'])
+    keyword = youtube.fixture['keywords'][0]
+    assert search_youtube_videos.verify_videos([video['id']], [keyword], 1, {}, http_cache=cache)
+    assert not _cached_page(cache, youtube.base_url, video)['complete']
+    # 第二个关键词在页面末尾，缓存的前缀不够时重新请求并读完整个页面
+    assert search_youtube_videos.verify_videos([video['id']], [keyword, '</body>'], 1, {}, http_cache=cache)
+    assert youtube.stats()['youtube.watch']['requests'] == 2
+    entry = _cached_page(cache, youtube.base_url, video)
+    assert entry['complete'] and entry['text'] == youtube.watch_page(video['id'])
+    assert cache.get_page(f"{youtube.base_url}/watch?v={video['id']}").from_cache
@@ -0,0 +1,761 @@
+#!/usr/bin/env python3
+"""
+转录文本全文索引
+
+save_to_markdown 每写出一个Markdown文件，就把它加入倒排索引，之后可以在命令行中
+按词、短语和布尔条件查询哪些转录稿提到了某个说法，并显示上下文片段：
+
+    python transcript_index.py query 明財位
+    python transcript_index.py query '"左青龍 右白虎" OR 明財位 -廣告'
+
+中文、日文、韩文按相邻两个字（bigram）切分，每个连续片段的最后一个字另外作为单字词，
+其他文字按单词切分，所有词都记录位置，短语查询要求各个词的位置前后相连。
+全角字符先按NFKC规范化，英文不区分大小写。
+
+索引由若干只追加不修改的段文件组成，每段包含排好序的词表和倒排列表
+（文档号、出现次数、出现位置三个uint32数组），查询时通过mmap直接读取，
+词表用二分查找定位。新加入的转录稿写成一个新段，末尾凑满 MERGE_FACTOR 个同级的段
+时合并成一个更大的段，因此加入一篇转录稿不需要重建索引，段的数量也保持在对数级别。
+文档登记和段列表保存在SQLite中，写入方通过SQLite的写锁互斥，查询不受写入影响。
+
+同一文件重新写入时旧文档标记为已删除，查询时过滤；rebuild 命令重新生成紧凑的索引。
+"""
+
+import os
+import re
+import sys
+import mmap
+import time
+import glob
+import struct
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from heapq import merge as heap_merge
+from itertools import accumulate
+
+# 索引目录和默认的转录稿目录
+TRANSCRIPT_INDEX_DIR = os.path.join(".cache", "transcript_index")
+OUTPUT_DIR = "output"
+
+# 末尾凑满多少个同级的段时合并，段的级别为 floor(log10(文档数))
+MERGE_FACTOR = 10
+
+# 批量收录时每个新段包含的文档数
+BATCH_DOCS = 200
+
+# 片段中匹配位置前后保留的字符数
+SNIPPET_CONTEXT = 40
+
+# 段文件格式：文件头、倒排列表、词表记录、词文本
+_MAGIC = b'TIX1'
+_HEADER = struct.Struct('<4sIQQQ')   # magic, 词数, 词表偏移, 词文本偏移, 保留
+_RECORD = struct.Struct('<QIIQI')    # 词文本偏移, 词长度, 文档数, 倒排列表偏移, 位置数
+
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_TOKEN_RE = re.compile(rf'([{_CJK}]+)|((?:(?![{_CJK}])[^\W_])+)')
+_QUERY_RE = re.compile(r'(-?)"([^"]*)"|(\S+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    title TEXT,
+    mtime REAL,
+    size INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS docs_path ON docs (path, deleted);
+CREATE TABLE IF NOT EXISTS segments (
+    seg_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_doc INTEGER NOT NULL,
+    last_doc INTEGER NOT NULL,
+    doc_count INTEGER NOT NULL,
+    level INTEGER NOT NULL
+);
+"""
+
+assert array('I').itemsize == 4
+
+class _FoldTable(dict):
+    """str.translate 使用的逐字符规范化表：NFKC加小写，只接受一对一的结果以保持文本长度不变"""
+
+    def __missing__(self, code):
+        char = chr(code)
+        folded = unicodedata.normalize('NFKC', char).lower()
+        if len(folded) != 1:
+            folded = char.lower() if len(char.lower()) == 1 else char
+        self[code] = folded
+        return folded
+
+_FOLD = _FoldTable()
+
+def fold(text):
+    """规范化文本：全角转半角、兼容字符转标准字符、转小写，长度与原文相同"""
+    return text.translate(_FOLD)
+
+def tokenize(text):
+    """
+    把文本切分为带位置的词
+
+    每个字占一个位置：中日韩连续片段产生相邻两字的bigram，片段最后一个字作为单字词；
+    其他文字每个单词占一个位置。
+
+    Returns:
+        词到位置列表的字典
+    """
+    terms = {}
+    position = 0
+    for match in _TOKEN_RE.finditer(fold(text)):
+        run, word = match.groups()
+        if word:
+            terms.setdefault(word, []).append(position)
+            position += 1
+            continue
+        for i in range(len(run) - 1):
+            terms.setdefault(run[i:i + 2], []).append(position + i)
+        terms.setdefault(run[-1], []).append(position + len(run) - 1)
+        position += len(run)
+    return terms
+
+def _query_tokens(text):
+    """
+    把查询中的一个短语切分为 (是否前缀匹配, 词, 相对位置) 列表
+
+    只有一个字的中日韩片段按前缀匹配，可以命中以该字开头的所有bigram和单字词。
+    """
+    tokens = []
+    position = 0
+    for match in _TOKEN_RE.finditer(fold(text)):
+        run, word = match.groups()
+        if word:
+            tokens.append((False, word, position))
+            position += 1
+        elif len(run) == 1:
+            tokens.append((True, run, position))
+            position += 1
+        else:
+            tokens.extend((False, run[i:i + 2], position + i) for i in range(len(run) - 1))
+            position += len(run)
+    return tokens
+
+_Clause = namedtuple('_Clause', ['text', 'negated', 'tokens'])
+
+def parse_query(query):
+    """
+    解析查询语句
+
+    空格分隔的条件需要同时满足，OR（或 |）分隔的条件组满足其一即可，
+    前面加 - 或 NOT 的条件表示排除，引号中的内容按短语匹配，连续的中文本身就按短语匹配。
+
+    Returns:
+        条件组列表，每组是 _Clause 列表
+
+    Raises:
+        ValueError: 查询为空或某一组只有排除条件
+    """
+    groups = [[]]
+    negate_next = False
+    for match in _QUERY_RE.finditer(query):
+        quoted_negated, quoted, word = match.groups()
+        if word is not None:
+            if word in ('OR', '|'):
+                groups.append([])
+                continue
+            if word == 'NOT':
+                negate_next = True
+                continue
+            negated = negate_next or (word.startswith('-') and len(word) > 1)
+            text = word[1:] if word.startswith('-') and len(word) > 1 else word
+        else:
+            negated = negate_next or quoted_negated == '-'
+            text = quoted
+        negate_next = False
+        tokens = _query_tokens(text)
+        if tokens:
+            groups[-1].append(_Clause(text, negated, tokens))
+    groups = [group for group in groups if group]
+    if not groups:
+        raise ValueError("查询中没有可以检索的词")
+    for group in groups:
+        if all(clause.negated for clause in group):
+            raise ValueError("每组条件中至少需要一个不带 - 的词")
+    return groups
+
+def _write_segment(path, entries):
+    """
+    写出段文件
+
+    Args:
+        path: 段文件路径，先写入临时文件再改名
+        entries: 按词的UTF-8字节排序的 (词字节, 文档号块列表, 次数块列表, 位置块列表, 文档数, 位置数)
+    """
+    tmp_path = f"{path}.tmp"
+    records = []
+    blob = bytearray()
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * _HEADER.size)
+        offset = _HEADER.size
+        for term, doc_chunks, count_chunks, position_chunks, doc_count, position_count in entries:
+            records.append(_RECORD.pack(len(blob), len(term), doc_count, offset, position_count))
+            blob += term
+            for chunk in (*doc_chunks, *count_chunks, *position_chunks):
+                f.write(chunk)
+            offset += (doc_count * 2 + position_count) * 4
+        table_offset = offset
+        f.write(b''.join(records))
+        f.write(blob)
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, len(records), table_offset, table_offset + len(records) * _RECORD.size, 0))
+    os.replace(tmp_path, path)
+
+class _TermPostings:
+    """一个词在一个段中的倒排列表"""
+
+    def __init__(self, docs, counts, positions):
+        self.docs = docs
+        self.counts = counts
+        self.positions = positions
+        self._offsets = None
+
+    def find(self, doc_id):
+        """文档在倒排列表中的下标，不存在时返回None"""
+        j = bisect_left(self.docs, doc_id)
+        return j if j < len(self.docs) and self.docs[j] == doc_id else None
+
+    def positions_at(self, j):
+        """第 j 个文档中的出现位置"""
+        if self._offsets is None:
+            self._offsets = list(accumulate(self.counts, initial=0))
+        return self.positions[self._offsets[j]:self._offsets[j + 1]]
+
+class _Segment:
+    """通过mmap只读访问的段文件"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        magic, self.term_count, self._table_offset, self._blob_offset, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"不是有效的索引段文件: {path}")
+
+    def close(self):
+        try:
+            self._view.release()
+            self._mm.close()
+        except BufferError:
+            # 仍有倒排列表的视图在使用，交给垃圾回收关闭
+            pass
+
+    def _record(self, i):
+        return _RECORD.unpack_from(self._mm, self._table_offset + i * _RECORD.size)
+
+    def _term(self, i):
+        term_offset, term_length = self._record(i)[:2]
+        start = self._blob_offset + term_offset
+        return self._mm[start:start + term_length]
+
+    def _lower_bound(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _postings(self, i):
+        _, _, doc_count, offset, position_count = self._record(i)
+        view = self._view[offset:offset + (doc_count * 2 + position_count) * 4].cast('I')
+        return _TermPostings(view[:doc_count], view[doc_count:doc_count * 2], view[doc_count * 2:])
+
+    def lookup(self, prefix, term):
+        """
+        查找词的倒排列表
+
+        Args:
+            prefix: 为True时返回所有以 term 开头的词
+            term: 词
+
+        Returns:
+            _TermPostings 列表
+        """
+        key = term.encode('utf-8')
+        i = self._lower_bound(key)
+        found = []
+        while i < self.term_count:
+            current = self._term(i)
+            if current != key and not (prefix and current.startswith(key)):
+                break
+            found.append(self._postings(i))
+            i += 1
+        return found
+
+    def iter_entries(self):
+        """按词的顺序返回 (词字节, 原始倒排数据)，合并段时使用"""
+        for i in range(self.term_count):
+            term_offset, term_length, doc_count, offset, position_count = self._record(i)
+            start = self._blob_offset + term_offset
+            yield (self._mm[start:start + term_length], doc_count, position_count,
+                   self._mm[offset:offset + doc_count * 4],
+                   self._mm[offset + doc_count * 4:offset + doc_count * 8],
+                   self._mm[offset + doc_count * 8:offset + (doc_count * 2 + position_count) * 4])
+
+def _docs_in(parts):
+    docs = set()
+    for part in parts:
+        docs.update(part.docs)
+    return docs
+
+def _eval_phrase(segment, tokens, candidates=None):
+    """
+    在一个段中查找包含短语的文档
+
+    Args:
+        segment: _Segment
+        tokens: _query_tokens 的结果
+        candidates: 只在这些文档中查找，为None时不限制
+
+    Returns:
+        文档号到出现次数的字典
+    """
+    token_parts = [segment.lookup(prefix, term) for prefix, term, _ in tokens]
+    if not all(token_parts):
+        return {}
+    frequencies = [sum(len(part.docs) for part in parts) for parts in token_parts]
+    order = sorted(range(len(tokens)), key=frequencies.__getitem__)
+
+    if len(tokens) == 1 and candidates is None:
+        results = {}
+        for part in token_parts[0]:
+            for doc_id, count in zip(part.docs, part.counts):
+                results[doc_id] = results.get(doc_id, 0) + count
+        return results
+
+    if candidates is None:
+        docs = _docs_in(token_parts[order[0]])
+        order = order[1:]
+    else:
+        docs = set(candidates)
+    for i in order:
+        if not docs:
+            return {}
+        if len(docs) * 16 < frequencies[i]:
+            # 候选文档很少时逐个二分查找，避免展开很长的倒排列表
+            docs = {doc_id for doc_id in docs
+                    if any(part.find(doc_id) is not None for part in token_parts[i])}
+        else:
+            docs &= _docs_in(token_parts[i])
+
+    results = {}
+    if len(tokens) == 1:
+        for doc_id in docs:
+            results[doc_id] = sum(part.counts[j] for part in token_parts[0]
+                                  for j in [part.find(doc_id)] if j is not None)
+        return results
+
+    for doc_id in docs:
+        starts = None
+        for (_, _, offset), parts in zip(tokens, token_parts):
+            current = set()
+            for part in parts:
+                j = part.find(doc_id)
+                if j is not None:
+                    current.update(position - offset for position in part.positions_at(j))
+            starts = current if starts is None else starts & current
+            if not starts:
+                break
+        if starts:
+            results[doc_id] = len(starts)
+    return results
+
+def _eval_segment(segment, groups):
+    """在一个段中求查询结果，返回文档号到得分（各条件出现次数之和）的字典"""
+    scores = {}
+    for group in groups:
+        positives = [clause for clause in group if not clause.negated]
+        negatives = [clause for clause in group if clause.negated]
+        result = None
+        for clause in positives:
+            found = _eval_phrase(segment, clause.tokens, None if result is None else result.keys())
+            result = found if result is None else {doc_id: result[doc_id] + count
+                                                   for doc_id, count in found.items()}
+            if not result:
+                break
+        if not result:
+            continue
+        for clause in negatives:
+            for doc_id in _eval_phrase(segment, clause.tokens, result.keys()):
+                result.pop(doc_id, None)
+        for doc_id, score in result.items():
+            scores[doc_id] = scores.get(doc_id, 0) + score
+    return scores
+
+def _snippet_pattern(groups):
+    """用于在原文中定位片段的正则表达式，词之间允许有空白和标点"""
+    phrases = []
+    for group in groups:
+        for clause in group:
+            if not clause.negated:
+                units = [match.group(0) for match in _TOKEN_RE.finditer(fold(clause.text))]
+                phrases.append(r'[\W_]*'.join(map(re.escape, units)))
+    return re.compile('|'.join(phrases))
+
+def make_snippet(text, pattern, context=SNIPPET_CONTEXT):
+    """截取第一个匹配位置前后的文字，匹配内容用【】标出"""
+    match = pattern.search(fold(text))
+    if not match:
+        return text[:context * 2].replace('\n', ' ').strip()
+    start = max(0, match.start() - context)
+    end = min(len(text), match.end() + context)
+    snippet = (text[start:match.start()] + '【' + text[match.start():match.end()] + '】'
+               + text[match.end():end])
+    snippet = ' '.join(snippet.split())
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+
+def _title_of(text):
+    first_line = text.split('\n', 1)[0]
+    return first_line[2:].strip() if first_line.startswith('# ') else None
+
+class TranscriptIndex:
+    """
+    转录稿的增量全文索引，可以在多个线程之间共享，多个进程可以同时查询
+
+    Args:
+        index_dir: 索引目录
+    """
+
+    def __init__(self, index_dir=TRANSCRIPT_INDEX_DIR):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(index_dir, 'index.sqlite3'), timeout=60,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """关闭数据库连接和已打开的段文件"""
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+            self._conn.close()
+
+    def _segment_path(self, seg_id):
+        return os.path.join(self.index_dir, f"seg_{seg_id:08d}.tix")
+
+    def add_document(self, path, text, title=None):
+        """
+        收录一篇转录稿，同一路径之前收录的内容标记为已删除
+
+        Args:
+            path: Markdown文件路径
+            text: 文件内容
+            title: 标题，为None时取第一行的一级标题
+        """
+        self.add_documents([(path, text, title)])
+
+    def add_documents(self, documents):
+        """
+        批量收录转录稿，每 BATCH_DOCS 篇写成一个新段
+
+        Args:
+            documents: (路径, 内容, 标题) 的可迭代对象，标题可以为None
+        """
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= BATCH_DOCS:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, documents):
+        # 先在锁外切词，写入时只做登记和写文件
+        tokenized = []
+        for path, text, title in documents:
+            path = os.path.normpath(path)
+            try:
+                stat = os.stat(path)
+                mtime, size = stat.st_mtime, stat.st_size
+            except OSError:
+                mtime, size = None, None
+            tokenized.append((path, title or _title_of(text), mtime, size, tokenize(text)))
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                postings = {}
+                doc_ids = []
+                for path, title, mtime, size, terms in tokenized:
+                    self._conn.execute("UPDATE docs SET deleted = 1 WHERE path = ? AND deleted = 0", (path,))
+                    doc_id = self._conn.execute(
+                        "INSERT INTO docs (path, title, mtime, size) VALUES (?, ?, ?, ?)",
+                        (path, title, mtime, size)
+                    ).lastrowid
+                    doc_ids.append(doc_id)
+                    for term, positions in terms.items():
+                        arrays = postings.get(term)
+                        if arrays is None:
+                            arrays = postings[term] = (array('I'), array('I'), array('I'))
+                        arrays[0].append(doc_id)
+                        arrays[1].append(len(positions))
+                        arrays[2].extend(positions)
+
+                # 字符串按码位排序，与UTF-8字节顺序一致
+                entries = [(term.encode('utf-8'), [docs.tobytes()], [counts.tobytes()], [positions.tobytes()],
+                            len(docs), len(positions))
+                           for term, (docs, counts, positions) in sorted(postings.items())]
+                self._add_segment(entries, doc_ids[0], doc_ids[-1], len(doc_ids))
+                merged = self._merge_tail()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            # 提交后才删除被合并的段，正在查询的其他进程仍可以通过已有的mmap读取
+            for seg_id in merged:
+                os.remove(self._segment_path(seg_id))
+
+    def _add_segment(self, entries, first_doc, last_doc, doc_count):
+        level = len(str(doc_count)) - 1
+        seg_id = self._conn.execute(
+            "INSERT INTO segments (first_doc, last_doc, doc_count, level) VALUES (?, ?, ?, ?)",
+            (first_doc, last_doc, doc_count, level)
+        ).lastrowid
+        _write_segment(self._segment_path(seg_id), entries)
+        return seg_id
+
+    def _merge_tail(self):
+        """
+        末尾有 MERGE_FACTOR 个同级的段时合并为一个，合并后可能继续触发上一级的合并
+
+        Returns:
+            被合并的段号列表，事务提交后删除这些段文件
+        """
+        merged = []
+        while True:
+            rows = self._conn.execute(
+                "SELECT seg_id, first_doc, last_doc, doc_count, level FROM segments "
+                "ORDER BY first_doc DESC LIMIT ?", (MERGE_FACTOR,)
+            ).fetchall()
+            if len(rows) < MERGE_FACTOR or len({row[4] for row in rows}) != 1:
+                return merged
+            rows.reverse()
+            segments = [_Segment(self._segment_path(row[0])) for row in rows]
+            try:
+                self._add_segment(self._merged_entries(segments), rows[0][1], rows[-1][2],
+                                  sum(row[3] for row in rows))
+            finally:
+                for segment in segments:
+                    segment.close()
+            self._conn.executemany("DELETE FROM segments WHERE seg_id = ?", [(row[0],) for row in rows])
+            merged.extend(row[0] for row in rows)
+
+    @staticmethod
+    def _merged_entries(segments):
+        """按词归并多个段的倒排列表，各段文档号区间不重叠，按段的顺序拼接即保持有序"""
+        def stream(index, segment):
+            for entry in segment.iter_entries():
+                yield entry[0], index, entry
+
+        streams = [stream(index, segment) for index, segment in enumerate(segments)]
+        current = None
+        group = []
+        for term, _, entry in heap_merge(*streams):
+            if term != current and group:
+                yield TranscriptIndex._combine(current, group)
+                group = []
+            current = term
+            group.append(entry)
+        if group:
+            yield TranscriptIndex._combine(current, group)
+
+    @staticmethod
+    def _combine(term, entries):
+        return (term, [entry[3] for entry in entries], [entry[4] for entry in entries],
+                [entry[5] for entry in entries], sum(entry[1] for entry in entries),
+                sum(entry[2] for entry in entries))
+
+    def _open_segments(self):
+        """按段列表打开段文件，复用已经打开的段，关闭已被合并的段"""
+        for attempt in range(3):
+            seg_ids = [row[0] for row in self._conn.execute("SELECT seg_id FROM segments ORDER BY first_doc")]
+            try:
+                for seg_id in seg_ids:
+                    if seg_id not in self._segments:
+                        self._segments[seg_id] = _Segment(self._segment_path(seg_id))
+            except FileNotFoundError:
+                # 读取段列表之后其他进程刚好完成了一次合并
+                if attempt == 2:
+                    raise
+                continue
+            for seg_id in set(self._segments) - set(seg_ids):
+                self._segments.pop(seg_id).close()
+            return [self._segments[seg_id] for seg_id in seg_ids]
+
+    def search(self, query, limit=10, snippets=True):
+        """
+        查询转录稿
+
+        Args:
+            query: 查询语句，语法见 parse_query
+            limit: 最多返回的结果数
+            snippets: 是否读取原文生成上下文片段
+
+        Returns:
+            (匹配的文档总数, 结果列表)，结果按得分从高到低排列，
+            每项包含 path、title、score，以及 snippets 为True时的 snippet
+
+        Raises:
+            ValueError: 查询语句无效
+        """
+        groups = parse_query(query)
+        with self._lock:
+            scores = {}
+            for segment in self._open_segments():
+                scores.update(_eval_segment(segment, groups))
+            deleted = {row[0] for row in self._conn.execute("SELECT doc_id FROM docs WHERE deleted = 1")}
+            for doc_id in deleted & scores.keys():
+                del scores[doc_id]
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+            rows = {}
+            if ranked:
+                placeholders = ','.join('?' * len(ranked))
+                for doc_id, path, title in self._conn.execute(
+                        f"SELECT doc_id, path, title FROM docs WHERE doc_id IN ({placeholders})",
+                        [doc_id for doc_id, _ in ranked]):
+                    rows[doc_id] = (path, title)
+
+        pattern = _snippet_pattern(groups) if snippets else None
+        results = []
+        for doc_id, score in ranked:
+            path, title = rows[doc_id]
+            result = {'path': path, 'title': title, 'score': score}
+            if snippets:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        result['snippet'] = make_snippet(f.read(), pattern)
+                except OSError:
+                    result['snippet'] = ''
+            results.append(result)
+        return len(scores), results
+
+    def sync(self, output_dir=OUTPUT_DIR):
+        """
+        收录目录中新增或修改过的Markdown文件，已删除的文件从结果中去掉
+
+        Returns:
+            (新收录的文件数, 移除的文件数)
+        """
+        with self._lock:
+            indexed = {path: (mtime, size) for path, mtime, size in self._conn.execute(
+                "SELECT path, mtime, size FROM docs WHERE deleted = 0")}
+        changed = []
+        present = set()
+        for path in sorted(glob.glob(os.path.join(output_dir, '*.md'))):
+            path = os.path.normpath(path)
+            present.add(path)
+            stat = os.stat(path)
+            if indexed.get(path) != (stat.st_mtime, stat.st_size):
+                changed.append(path)
+        removed = [path for path in indexed if path not in present
+                   and os.path.dirname(path) == os.path.normpath(output_dir)]
+
+        def read_documents():
+            for path in changed:
+                with open(path, 'r', encoding='utf-8') as f:
+                    yield path, f.read(), None
+
+        self.add_documents(read_documents())
+        if removed:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany("UPDATE docs SET deleted = 1 WHERE path = ? AND deleted = 0",
+                                       [(path,) for path in removed])
+                self._conn.execute("COMMIT")
+        return len(changed), len(removed)
+
+    def stats(self):
+        """返回文档数、已删除文档数、段数和段文件总字节数"""
+        with self._lock:
+            documents, deleted = self._conn.execute(
+                "SELECT COUNT(*) - COALESCE(SUM(deleted), 0), COALESCE(SUM(deleted), 0) FROM docs").fetchone()
+            seg_ids = [row[0] for row in self._conn.execute("SELECT seg_id FROM segments")]
+        size = sum(os.path.getsize(self._segment_path(seg_id)) for seg_id in seg_ids)
+        return {'documents': documents, 'deleted': deleted, 'segments': len(seg_ids), 'bytes': size}
+
+def rebuild(index_dir=TRANSCRIPT_INDEX_DIR, output_dir=OUTPUT_DIR):
+    """删除已有索引，重新收录目录中的所有Markdown文件"""
+    for path in glob.glob(os.path.join(index_dir, 'seg_*.tix')) + glob.glob(os.path.join(index_dir, 'index.sqlite3*')):
+        os.remove(path)
+    with TranscriptIndex(index_dir) as index:
+        return index.sync(output_dir)[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查询转录稿全文索引')
+    parser.add_argument('--index-dir', default=TRANSCRIPT_INDEX_DIR, help=f'索引目录 (默认: {TRANSCRIPT_INDEX_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = subparsers.add_parser('query', help='查询转录稿')
+    query_parser.add_argument('query', nargs='+', help='查询语句，例如 明財位、"左青龍 右白虎" OR 明財位 -廣告')
+    query_parser.add_argument('--limit', type=int, default=10, help='最多显示的结果数 (默认: 10)')
+    query_parser.add_argument('--no-snippet', action='store_true', help='不显示上下文片段')
+
+    for name, help_text in (('index', '收录目录中新增或修改过的转录稿'), ('rebuild', '重建整个索引')):
+        command_parser = subparsers.add_parser(name, help=help_text)
+        command_parser.add_argument('--output-dir', default=OUTPUT_DIR, help=f'转录稿目录 (默认: {OUTPUT_DIR})')
+    subparsers.add_parser('stats', help='显示索引统计')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        started = time.monotonic()
+        count = rebuild(args.index_dir, args.output_dir)
+        print(f"已重建索引，收录 {count} 篇转录稿，用时 {time.monotonic() - started:.1f} 秒")
+        return 0
+
+    with TranscriptIndex(args.index_dir) as index:
+        if args.command == 'index':
+            added, removed = index.sync(args.output_dir)
+            print(f"新收录 {added} 篇转录稿，移除 {removed} 篇")
+        elif args.command == 'stats':
+            stats = index.stats()
+            print(f"文档 {stats['documents']} 篇（已删除 {stats['deleted']} 篇），"
+                  f"段 {stats['segments']} 个，共 {stats['bytes'] / 1024 / 1024:.1f} MB")
+        else:
+            if args.limit <= 0:
+                parser.error("--limit 必须是正整数")
+            started = time.monotonic()
+            try:
+                total, results = index.search(' '.join(args.query), limit=args.limit,
+                                              snippets=not args.no_snippet)
+            except ValueError as e:
+                parser.error(str(e))
+            elapsed = (time.monotonic() - started) * 1000
+            print(f"找到 {total} 篇转录稿，用时 {elapsed:.1f} 毫秒")
+            for i, result in enumerate(results, 1):
+                print(f"\n{i}. {result['title'] or os.path.basename(result['path'])} "
+                      f"(出现 {result['score']} 次)\n   {result['path']}")
+                if result.get('snippet'):
+                    print(f"   {result['snippet']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+语音识别后端
+
+下载和格式化阶段只通过 TranscriptionBackend 接口取得识别结果，不关心结果来自哪里：
+
+- assemblyai: AssemblyAI云服务，可选在单个后台事件循环中统一上传和轮询
+- local: 本机CPU上运行的Whisper模型（优先使用 faster-whisper，其次 openai-whisper），
+  在独立的工作进程池中识别，进程数和每个进程的线程数按可用CPU核数分配
+
+识别结果统一为AssemblyAI风格的字典：text 为全文，words 为带毫秒时间戳的词列表。
+其他后端（例如测试用的桩）通过 register_backend 注册后即可用 --backend 选择：
+
+    register_backend('stub', lambda options: FunctionBackend(lambda audio_file: '测试文本'))
+"""
+
+import os
+import abc
+import time
+import threading
+import multiprocessing
+import requests
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from assemblyai_client import (
+    ASSEMBLYAI_BASE_URL, DEFAULT_TRANSCRIPT_OPTIONS, TRANSCRIPT_STATUSES, AssemblyAIError,
+    BackgroundAssemblyAIClient, is_retryable_status, max_transcript_wait, next_poll_interval,
+    probe_audio_duration, record_asr_timing, stream_upload
+)
+from http_client import get_session
+import pipeline_metrics
+
+# 默认使用的后端，可通过环境变量 TRANSCRIPTION_BACKEND 修改
+DEFAULT_BACKEND = os.environ.get("TRANSCRIPTION_BACKEND", "assemblyai")
+
+# 本地识别默认使用的模型、语言，以及每个工作进程使用的CPU线程数
+LOCAL_MODEL = os.environ.get("LOCAL_WHISPER_MODEL", "small")
+LOCAL_LANGUAGE = "zh"
+LOCAL_THREADS_PER_WORKER = 4
+
+# 本地识别引擎，auto 表示按 faster-whisper、openai-whisper 的顺序选择已安装的
+LOCAL_ENGINES = ('auto', 'faster-whisper', 'whisper')
+
+class TranscriptionBackend(abc.ABC):
+    """
+    语音识别后端接口，子类必须实现 transcribe，否则无法创建实例
+
+    cache_tag 用于区分不同后端在转录缓存中的结果，为空字符串时直接使用音频哈希作为键
+    （AssemblyAI的结果沿用这种键，已有的缓存继续有效）。
+    """
+
+    name = None
+    cache_tag = ''
+
+    @abc.abstractmethod
+    def transcribe(self, audio_file, audio_duration=None, upload_url=None, on_upload=None):
+        """
+        识别一个音频文件，可以在多个线程中同时调用
+
+        Args:
+            audio_file: 音频文件路径
+            audio_duration: 音频时长（秒），未知时为None
+            upload_url: 之前已经上传得到的地址，只有需要上传的后端使用
+            on_upload: 上传完成后以上传地址为参数调用的回调函数，只有需要上传的后端使用
+
+        Returns:
+            包含 text 的识别结果字典，可以带有 words（text、start、end，时间单位为毫秒），失败时返回None
+        """
+
+    def close(self):
+        """释放后端占用的资源"""
+
+_BACKENDS = {}
+
+def register_backend(name, factory):
+    """
+    注册语音识别后端
+
+    Args:
+        name: 后端名称，即 --backend 的取值
+        factory: 以选项字典为参数、返回 TranscriptionBackend 实例的函数，
+            选项字典包含所有后端的参数，各后端只读取自己需要的
+    """
+    _BACKENDS[name] = factory
+
+def backend_names():
+    """已注册的后端名称"""
+    return sorted(_BACKENDS)
+
+def create_backend(name, **options):
+    """
+    创建语音识别后端
+
+    Raises:
+        ValueError: 后端名称未注册
+    """
+    factory = _BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"未知的语音识别后端: {name}，可用的后端: {', '.join(backend_names())}")
+    return factory(options)
+
+class FunctionBackend(TranscriptionBackend):
+    """
+    用一个函数充当后端，便于测试
+
+    Args:
+        func: 以音频文件路径为参数的函数，返回识别文本或识别结果字典，失败时返回None
+        name: 后端名称，同时作为缓存标签
+    """
+
+    def __init__(self, func, name='function'):
+        self.func = func
+        self.name = name
+        self.cache_tag = name
+
+    def transcribe(self, audio_file, audio_duration=None, upload_url=None, on_upload=None):
+        result = self.func(audio_file)
+        if isinstance(result, str):
+            return {'text': result}
+        return result
+
+class AssemblyAIBackend(TranscriptionBackend):
+    """
+    AssemblyAI云服务
+
+    Args:
+        api_key: AssemblyAI API密钥
+        base_url: 服务地址
+        async_client: 为True时使用 BackgroundAssemblyAIClient，在单个事件循环中统一上传和轮询
+    """
+
+    name = 'assemblyai'
+
+    def __init__(self, api_key, base_url=ASSEMBLYAI_BASE_URL, async_client=False):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self._client = BackgroundAssemblyAIClient(api_key, base_url=self.base_url) if async_client else None
+
+    def transcribe(self, audio_file, audio_duration=None, upload_url=None, on_upload=None):
+        if not self.api_key:
+            print("错误: 请设置你的AssemblyAI API密钥")
+            return None
+        if self._client is not None:
+            return self._client.transcribe_result(audio_file, audio_duration,
+                                                  upload_url=upload_url, on_upload=on_upload)
+        return self._transcribe_with_requests(audio_file, upload_url, on_upload, audio_duration)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _upload(self, audio_file):
+        """分块流式上传音频文件到AssemblyAI，返回 upload_url，失败时返回None"""
+        print("正在上传音频文件到AssemblyAI...")
+        try:
+            return stream_upload(audio_file, self.api_key, self.base_url)
+        except AssemblyAIError as e:
+            print(e)
+            return None
+
+    def _transcribe_with_requests(self, audio_file, upload_url=None, on_upload=None, audio_duration=None):
+        """上传音频并轮询转录结果，返回完整的转录结果JSON，失败时返回None"""
+        headers = {
+            "authorization": self.api_key,
+            "content-type": "application/json"
+        }
+
+        try:
+            resumed = upload_url is not None
+            while True:
+                if upload_url is None:
+                    upload_url = self._upload(audio_file)
+                    if upload_url is None:
+                        return None
+                    if on_upload:
+                        on_upload(upload_url)
+
+                # 开始转录
+                print("开始转录...")
+                response = get_session().post(
+                    f"{self.base_url}/v2/transcript",
+                    headers=headers,
+                    json=dict(DEFAULT_TRANSCRIPT_OPTIONS, audio_url=upload_url)
+                )
+                pipeline_metrics.status(response.status_code)
+                if "id" in response.json():
+                    break
+
+                # 之前上传的音频可能已经失效，本地音频还在时重新上传一次
+                if resumed and audio_file and os.path.exists(audio_file):
+                    print(f"之前上传的音频无法使用，重新上传: {response.text}")
+                    upload_url = None
+                    resumed = False
+                    continue
+                print(f"提交转录任务失败: {response.text}")
+                return None
+
+            transcript_id = response.json()["id"]
+            polling_endpoint = f"{self.base_url}/v2/transcript/{transcript_id}"
+
+            # 等待转录完成，轮询间隔根据音频时长和状态历史自适应调整
+            if audio_duration is None and audio_file:
+                audio_duration = probe_audio_duration(audio_file)
+            last_status = status = 'queued'
+            status_since = submitted = time.monotonic()
+            deadline = submitted + max_transcript_wait(audio_duration)
+            processing_since = None
+            polls_in_status = 0
+            while True:
+                try:
+                    response = get_session().get(polling_endpoint, headers=headers)
+                    pipeline_metrics.add(polls=1)
+                    pipeline_metrics.status(response.status_code)
+                    if is_retryable_status(response.status_code):
+                        raise requests.exceptions.HTTPError(f"HTTP {response.status_code}")
+                    if response.status_code != 200:
+                        print(f"查询转录任务失败 (HTTP {response.status_code}): {response.text}")
+                        record_asr_timing(submitted, processing_since, ok=False)
+                        return None
+                    status = response.json().get("status")
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    # 网络错误和服务端暂时不可用不结束任务，按当前状态稍后重试
+                    print(f"轮询转录任务出错: {e}")
+                if status not in TRANSCRIPT_STATUSES:
+                    print(f"查询转录任务返回了未知的状态: {response.text}")
+                    record_asr_timing(submitted, processing_since, ok=False)
+                    return None
+                if status == "processing" and processing_since is None:
+                    processing_since = time.monotonic()
+
+                if status == "completed":
+                    print("转录完成!")
+                    record_asr_timing(submitted, processing_since)
+                    return response.json()
+                elif status == "error":
+                    print(f"转录出错: {response.json()['error']}")
+                    record_asr_timing(submitted, processing_since, ok=False)
+                    return None
+                else:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        print(f"等待转录结果超时 ({now - submitted:.0f} 秒)，放弃任务 {transcript_id}")
+                        record_asr_timing(submitted, processing_since, ok=False)
+                        return None
+                    if status != last_status:
+                        last_status = status
+                        status_since = now
+                        polls_in_status = 0
+                    else:
+                        polls_in_status += 1
+                    interval = min(deadline - now,
+                                   next_poll_interval(audio_duration, status, now - status_since, polls_in_status))
+                    print(f"转录进行中... 状态: {status}，{interval:.1f}秒后再次检查")
+                    time.sleep(interval)
+
+        except Exception as e:
+            print(f"转录过程中出错: {e}")
+            return None
+
+def available_cpus():
+    """当前进程可以使用的CPU核数"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def resolve_local_engine(engine='auto'):
+    """
+    选择本地识别引擎
+
+    Returns:
+        'faster-whisper' 或 'whisper'
+
+    Raises:
+        RuntimeError: 指定的或所有可选的引擎都没有安装
+    """
+    candidates = ('faster-whisper', 'whisper') if engine == 'auto' else (engine,)
+    for candidate in candidates:
+        try:
+            if candidate == 'faster-whisper':
+                import faster_whisper  # noqa: F401
+            else:
+                import whisper  # noqa: F401
+        except ImportError:
+            continue
+        return candidate
+    raise RuntimeError("本地识别需要安装 faster-whisper 或 openai-whisper: "
+                       "pip install faster-whisper  或  pip install openai-whisper")
+
+# 工作进程中加载的模型，每个进程只加载一次
+_worker_model = None
+_worker_engine = None
+
+def _init_local_worker(engine, model_name, threads):
+    global _worker_model, _worker_engine
+    _worker_engine = engine
+    if engine == 'faster-whisper':
+        from faster_whisper import WhisperModel
+        _worker_model = WhisperModel(model_name, device='cpu', compute_type='int8',
+                                     cpu_threads=threads, num_workers=1)
+    else:
+        import torch
+        import whisper
+        torch.set_num_threads(threads)
+        _worker_model = whisper.load_model(model_name, device='cpu')
+
+def _word(text, start, end, confidence):
+    return {
+        'text': text.strip(),
+        'start': int(round(start * 1000)),
+        'end': int(round(end * 1000)),
+        'confidence': confidence,
+    }
+
+def _transcribe_in_worker(audio_file, language):
+    """在工作进程中识别音频，返回与AssemblyAI结果格式一致的字典"""
+    started = time.monotonic()
+    words = []
+    if _worker_engine == 'faster-whisper':
+        segments, info = _worker_model.transcribe(audio_file, language=language, word_timestamps=True)
+        texts = []
+        for segment in segments:
+            texts.append(segment.text)
+            for word in segment.words or []:
+                words.append(_word(word.word, word.start, word.end, word.probability))
+        text = ''.join(texts).strip()
+        duration = info.duration
+    else:
+        result = _worker_model.transcribe(audio_file, language=language, word_timestamps=True, fp16=False)
+        for segment in result.get('segments', []):
+            for word in segment.get('words', []):
+                words.append(_word(word['word'], word['start'], word['end'], word.get('probability')))
+        text = result['text'].strip()
+        duration = result['segments'][-1]['end'] if result.get('segments') else None
+    return {
+        'text': text,
+        'words': [word for word in words if word['text']],
+        'audio_duration': duration,
+        'processing_seconds': time.monotonic() - started,
+    }
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    在本机CPU上运行Whisper模型
+
+    模型在每个工作进程启动时加载一次。工作进程使用spawn方式启动，
+    避免在已经有下载、格式化线程的进程中fork。
+
+    Args:
+        model: 模型名称或本地模型路径，例如 tiny、base、small、medium
+        workers: 工作进程数，默认为 可用核数 // threads
+        threads: 每个工作进程使用的CPU线程数
+        engine: 'auto'、'faster-whisper' 或 'whisper'
+        language: 识别语言
+    """
+
+    name = 'local'
+
+    def __init__(self, model=LOCAL_MODEL, workers=None, threads=LOCAL_THREADS_PER_WORKER, engine='auto',
+                 language=LOCAL_LANGUAGE):
+        self.engine = resolve_local_engine(engine)
+        self.model = model
+        self.language = language
+        cpus = available_cpus()
+        self.threads = max(1, min(threads, cpus))
+        self.workers = workers or max(1, cpus // self.threads)
+        self.cache_tag = f"{self.engine}:{model}"
+        self._lock = threading.Lock()
+        self._pool = None
+        print(f"本地识别: {self.engine} 模型 {model}，{self.workers} 个工作进程 × {self.threads} 个线程 "
+              f"(可用CPU {cpus} 核)")
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_local_worker,
+                    initargs=(self.engine, self.model, self.threads),
+                )
+            return self._pool
+
+    def transcribe(self, audio_file, audio_duration=None, upload_url=None, on_upload=None):
+        print(f"本地识别: {os.path.basename(audio_file)}")
+        pool = self._get_pool()
+        try:
+            result = pool.submit(_transcribe_in_worker, audio_file, self.language).result()
+        except BrokenProcessPool as e:
+            # 工作进程异常退出（例如内存不足）后进程池不能再用，下次调用时重新创建
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            print(f"本地识别工作进程异常退出: {e}")
+            return None
+        except Exception as e:
+            print(f"本地识别出错: {type(e).__name__}: {e}")
+            return None
+        duration = result.get('audio_duration') or audio_duration
+        report = f"本地识别完成，用时 {result['processing_seconds']:.1f} 秒"
+        if duration:
+            report += f"，实时率 {result['processing_seconds'] / duration:.2f}"
+        print(report)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+register_backend('assemblyai', lambda options: AssemblyAIBackend(
+    options.get('api_key'),
+    base_url=options.get('base_url') or ASSEMBLYAI_BASE_URL,
+    async_client=options.get('async_client', False),
+))
+register_backend('local', lambda options: LocalWhisperBackend(
+    model=options.get('model') or LOCAL_MODEL,
+    workers=options.get('workers'),
+    threads=options.get('threads') or LOCAL_THREADS_PER_WORKER,
+    engine=options.get('engine') or 'auto',
+    language=options.get('language') or LOCAL_LANGUAGE,
+))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+视频链接规范化工具
+
+将同一个视频的不同链接形式（youtu.be短链接、带时间参数的watch链接、
+shorts链接、抖音分享链接等）统一成 (平台, 视频ID) 的规范形式。
+"""
+
+import re
+from urllib.parse import urlparse, parse_qs
+
+_YOUTUBE_ID = r'[A-Za-z0-9_-]{11}'
+_YOUTUBE_PATH_PATTERNS = [
+    re.compile(rf'^/(?:shorts|embed|live|v)/({_YOUTUBE_ID})'),
+]
+_DOUYIN_PATH_PATTERNS = [
+    re.compile(r'/(?:video|note)/(\d+)'),
+    re.compile(r'/share/video/(\d+)'),
+]
+
+def canonical_video_id(link):
+    """
+    解析链接对应的规范视频标识
+
+    Args:
+        link: 视频链接
+
+    Returns:
+        (platform, video_id) 元组，无法识别时返回None
+    """
+    link = link.strip()
+    if not link:
+        return None
+    if '://' not in link:
+        link = 'https://' + link
+    parsed = urlparse(link)
+    host = (parsed.hostname or '').lower()
+    query = parse_qs(parsed.query)
+
+    if host == 'youtu.be':
+        match = re.match(rf'^/({_YOUTUBE_ID})', parsed.path)
+        return ('youtube', match.group(1)) if match else None
+
+    if host.endswith('youtube.com') or host.endswith('youtube-nocookie.com'):
+        video_ids = query.get('v')
+        if video_ids and re.fullmatch(_YOUTUBE_ID, video_ids[0]):
+            return ('youtube', video_ids[0])
+        for pattern in _YOUTUBE_PATH_PATTERNS:
+            match = pattern.match(parsed.path)
+            if match:
+                return ('youtube', match.group(1))
+        return None
+
+    if host.endswith('douyin.com') or host.endswith('iesdouyin.com') or host.endswith('tiktok.com'):
+        platform = 'tiktok' if host.endswith('tiktok.com') else 'douyin'
+        modal_ids = query.get('modal_id')
+        if modal_ids and modal_ids[0].isdigit():
+            return (platform, modal_ids[0])
+        for pattern in _DOUYIN_PATH_PATTERNS:
+            match = pattern.search(parsed.path)
+            if match:
+                return (platform, match.group(1))
+        # v.douyin.com 等短链接在不访问网络的情况下无法解析，使用短链接路径作为标识
+        short_code = parsed.path.strip('/')
+        return (platform, f"{host}/{short_code}") if short_code else None
+
+    return None
+
+def video_key(link):
+    """
+    返回链接的规范键，形如 'youtube:SJLWfJBR4Y4'，无法识别时返回None
+    """
+    canonical = canonical_video_id(link)
+    if canonical is None:
+        return None
+    return f"{canonical[0]}:{canonical[1]}"
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+YouTube搜索客户端
+
+读取搜索结果页中内嵌的 ytInitialData JSON 提取视频，
+再用页面里的 continuation token 调用 youtubei/v1/search 接口继续翻页。
+结果以生成器的形式逐个返回，调用方需要多少结果就只请求多少页，
+不需要启动浏览器滚动页面。
+
+服务地址可通过环境变量 YOUTUBE_BASE_URL 指向本地服务，用保存的页面进行测试。
+"""
+
+import os
+import re
+import json
+import requests
+import pipeline_metrics
+from http_client import get_session
+
+YOUTUBE_BASE_URL = os.environ.get("YOUTUBE_BASE_URL", "https://www.youtube.com")
+
+# 默认最多请求的结果页数（包括第一页）
+MAX_SEARCH_PAGES = 10
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+}
+
+# 页面中没有 INNERTUBE_CONTEXT 时使用的客户端信息
+DEFAULT_CLIENT_VERSION = "2.20240101.00.00"
+
+_INITIAL_DATA_MARKERS = ('var ytInitialData = ', 'window["ytInitialData"] = ', "ytInitialData = ")
+_API_KEY_RE = re.compile(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"')
+_CLIENT_VERSION_RE = re.compile(r'"INNERTUBE_CLIENT_VERSION"\s*:\s*"([^"]+)"')
+_CONTEXT_MARKER_RE = re.compile(r'"INNERTUBE_CONTEXT"\s*:\s*')
+_WATCH_ID_RE = re.compile(r"watch\?v=([A-Za-z0-9_-]{11})")
+
+def _decode_json_at(text, start):
+    """从 text 的 start 位置解析一个JSON值，失败时返回None"""
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text, start)
+    except ValueError:
+        return None
+    return value
+
+def extract_initial_data(html):
+    """
+    从搜索结果页中提取 ytInitialData
+
+    Returns:
+        ytInitialData 字典，页面中没有时返回None
+    """
+    for marker in _INITIAL_DATA_MARKERS:
+        index = html.find(marker)
+        if index != -1:
+            data = _decode_json_at(html, index + len(marker))
+            if isinstance(data, dict):
+                return data
+    return None
+
+def extract_innertube_config(html):
+    """
+    从页面中提取调用 youtubei 接口所需的API密钥和请求上下文
+
+    Returns:
+        (api_key, context) 元组，缺少API密钥时 api_key 为None
+    """
+    match = _API_KEY_RE.search(html)
+    api_key = match.group(1) if match else None
+
+    context = None
+    match = _CONTEXT_MARKER_RE.search(html)
+    if match:
+        context = _decode_json_at(html, match.end())
+    if not isinstance(context, dict):
+        match = _CLIENT_VERSION_RE.search(html)
+        context = {
+            "client": {
+                "clientName": "WEB",
+                "clientVersion": match.group(1) if match else DEFAULT_CLIENT_VERSION,
+                "hl": "zh-CN",
+            }
+        }
+    return api_key, context
+
+def _text(node):
+    """把 {'runs': [...]} 或 {'simpleText': ...} 形式的文本拼接为字符串"""
+    if not isinstance(node, dict):
+        return ''
+    if 'simpleText' in node:
+        return node['simpleText']
+    return ''.join(run.get('text', '') for run in node.get('runs', []))
+
+def _video_from_renderer(renderer):
+    """把 videoRenderer 转换为搜索结果字典"""
+    video_id = renderer.get('videoId')
+    if not video_id:
+        return None
+    snippets = [_text(snippet.get('snippetText'))
+                for snippet in renderer.get('detailedMetadataSnippets', [])]
+    if not snippets and 'descriptionSnippet' in renderer:
+        snippets = [_text(renderer['descriptionSnippet'])]
+    return {
+        'video_id': video_id,
+        'url': f"https://www.youtube.com/watch?v={video_id}",
+        'title': _text(renderer.get('title')),
+        'description': ' '.join(snippets),
+        'channel': _text(renderer.get('ownerText')),
+    }
+
+def parse_search_page(data):
+    """
+    从 ytInitialData 或翻页接口的返回中提取视频和下一页的 continuation token
+
+    Returns:
+        (视频结果列表, continuation token)，没有下一页时token为None
+    """
+    videos = []
+    token = None
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            if 'videoRenderer' in node:
+                video = _video_from_renderer(node['videoRenderer'])
+                if video:
+                    videos.append(video)
+                continue
+            command = node.get('continuationCommand')
+            if isinstance(command, dict) and command.get('token'):
+                token = command['token']
+                continue
+            stack.extend(reversed(list(node.values())))
+    return videos, token
+
+def iter_search_results(query, max_pages=MAX_SEARCH_PAGES, headers=None, base_url=None, http_cache=None):
+    """
+    按搜索结果顺序逐个返回视频，需要更多结果时才请求下一页
+
+    第一页请求失败时抛出 requests.exceptions.RequestException；
+    后续翻页失败时停止翻页，已经返回的结果不受影响。
+
+    Args:
+        query: 搜索词
+        max_pages: 最多请求的结果页数（包括第一页）
+        headers: 请求头，默认使用 DEFAULT_HEADERS
+        base_url: 服务地址，默认使用 YOUTUBE_BASE_URL
+        http_cache: HttpCache实例，为None时不使用缓存
+
+    Yields:
+        包含 video_id、url、title、description、channel 的字典，同一视频只返回一次
+    """
+    base_url = (base_url or YOUTUBE_BASE_URL).rstrip('/')
+    headers = headers or DEFAULT_HEADERS
+    session = get_session()
+
+    with pipeline_metrics.span('search_page'):
+        if http_cache is not None:
+            response = http_cache.get_page(f"{base_url}/results", params={'search_query': query}, headers=headers)
+        else:
+            response = session.get(f"{base_url}/results", params={'search_query': query}, headers=headers)
+        pipeline_metrics.record_response(response)
+        response.raise_for_status()
+    html = response.text
+
+    seen = set()
+    data = extract_initial_data(html)
+    if data is None:
+        # 页面结构变化时退回到直接扫描视频链接
+        print("搜索结果页中没有找到 ytInitialData，只扫描第一页中的视频链接")
+        for video_id in _WATCH_ID_RE.findall(html):
+            if video_id not in seen:
+                seen.add(video_id)
+                yield {'video_id': video_id, 'url': f"https://www.youtube.com/watch?v={video_id}",
+                       'title': '', 'description': '', 'channel': ''}
+        return
+
+    api_key, context = extract_innertube_config(html)
+    pages = 1
+    while True:
+        videos, token = parse_search_page(data)
+        for video in videos:
+            if video['video_id'] not in seen:
+                seen.add(video['video_id'])
+                yield video
+        if not token or pages >= max_pages:
+            return
+
+        params = {'prettyPrint': 'false'}
+        if api_key:
+            params['key'] = api_key
+        try:
+            body = {'context': context, 'continuation': token}
+            with pipeline_metrics.span('search_page'):
+                if http_cache is not None:
+                    response = http_cache.post_json(f"{base_url}/youtubei/v1/search", body,
+                                                    params=params, headers=headers)
+                else:
+                    response = session.post(f"{base_url}/youtubei/v1/search", params=params, headers=headers,
+                                            json=body)
+                pipeline_metrics.record_response(response)
+                response.raise_for_status()
+                data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"获取第 {pages + 1} 页搜索结果时出错: {e}")
+            return
+        pages += 1
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 import os
 import re
-import time
-import requests
 import subprocess
 import json
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from transcription_backends import (
+    DEFAULT_BACKEND, LOCAL_ENGINES, LOCAL_MODEL, LOCAL_THREADS_PER_WORKER, AssemblyAIBackend,
+    backend_names, create_backend, resolve_local_engine
+)
+from http_client import get_session, configure as configure_http, print_connection_stats
+from disk_cache import FormatCache, TranscriptCache, sha256_file
+from video_links import video_key as get_video_key
+from metadata_store import MetadataStore, extract_metadata
+from run_manifest import RunManifest, stage_reached
+from link_index import LinkIndex
+from transcript_index import TRANSCRIPT_INDEX_DIR, TranscriptIndex
+from audio_vad import KEEP_SILENCE, MIN_SILENCE, SilenceTrimmer
+from audio_segmenter import SEGMENT_SECONDS, SEGMENT_WORKERS, AudioSegmenter
+from punctuation import MIN_SCORE as PUNCTUATION_MIN_SCORE, clean_text, normalize_punctuation, punctuation_score
+import pipeline_metrics
+from pipeline_metrics import METRICS_DIR
 
 # 你需要在这里设置你的AssemblyAI API密钥
 # 注册地址：https://www.assemblyai.com/ (有免费额度)
@@ -13,15 +31,53 @@ ASSEMBLYAI_API_KEY = "a86179f5b73045fb878609759958081e"  # 替换为你的API密
 # DeepSeek API密钥
 DEEPSEEK_API_KEY = "sk-b4d8ce9a5fe6429da61e1aba29219edd"
 
+# DeepSeek服务地址、模型和系统提示词
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+DEEPSEEK_MODEL = "deepseek-chat"
+DEEPSEEK_SYSTEM_PROMPT = "你是一位精通中文的专家，负责为文本添加适当的标点符号，使文本更易阅读。保持原始内容不变，只添加必要的标点符号。"
+
+# 长文本格式化时每块的token预算、并发请求数，以及作为上文附带的字符数
+FORMAT_CHUNK_TOKENS = 2000
+FORMAT_CONCURRENCY = 4
+FORMAT_CONTEXT_CHARS = 60
+
+# DeepSeek请求超时：(连接超时, 读取超时) 秒，长文本块生成较慢
+DEEPSEEK_TIMEOUT = (10, 300)
+
 # 输出目录
 OUTPUT_DIR = "output"
 
-def get_video_links():
-    """从videos.txt文件中读取视频链接"""
-    with open('videos.txt', 'r') as file:
-        # 移除行尾空白和空行
-        links = [line.strip() for line in file.readlines() if line.strip()]
-    return links
+# 转录缓存目录和默认容量上限
+TRANSCRIPT_CACHE_DIR = os.path.join(".cache", "transcripts")
+TRANSCRIPT_CACHE_MAX_MB = 1024
+
+# 格式化结果缓存目录和默认容量上限
+FORMAT_CACHE_DIR = os.path.join(".cache", "formatted")
+FORMAT_CACHE_MAX_MB = 256
+
+# ASR模式下的音频格式选择：优先opus，其次m4a，都没有时取最佳音频
+ASR_FORMAT_SELECTOR = 'ba[acodec=opus]/ba[ext=m4a]/ba/b'
+
+# 可以直接上传给语音识别服务的压缩音频格式，wav、flac等无损格式比转码后的文件大得多，仍然转码
+ASR_NATIVE_EXTS = ('opus', 'webm', 'm4a', 'ogg', 'aac', 'mp3')
+
+# 需要转码时使用的采样率和码率，语音识别只需要16kHz单声道
+ASR_SAMPLE_RATE = 16000
+ASR_BITRATE = '32k'
+
+# 旧的最高质量MP3的大致码率(kbps)，用于估算节省的字节数
+LEGACY_MP3_KBPS = 245
+
+# 视频元数据存储目录
+METADATA_DIR = os.path.join(".cache", "metadata")
+
+# 运行清单数据库路径
+MANIFEST_PATH = os.path.join(".cache", "run_manifest.sqlite3")
+
+def get_video_links(path='videos.txt'):
+    """从videos.txt文件中读取当前的视频链接，同一视频的不同链接形式只返回第一次出现的"""
+    with LinkIndex(path) as index:
+        return index.file_links()
 
 def clean_filename(title):
     """清理文件名，替换不合法字符"""
@@ -36,10 +92,68 @@ def identify_platform(link):
     else:
         return 'unknown'
 
-def download_audio(link, output_dir):
-    """下载视频的音频部分，支持YouTube和抖音"""
+def _run_measured(cmd, capture_stdout=False):
+    """
+    运行外部命令并统计其CPU时间（包括它等待过的子进程，例如yt-dlp调用的ffmpeg）
+    
+    Args:
+        cmd: 命令列表
+        capture_stdout: 是否捕获标准输出
+        
+    Returns:
+        (标准输出文本, CPU时间秒数) 元组，命令失败时抛出 subprocess.CalledProcessError
+    """
+    if not hasattr(os, 'wait4'):
+        result = subprocess.run(cmd, check=True, text=True,
+                                stdout=subprocess.PIPE if capture_stdout else None)
+        return result.stdout or '', None
+    
+    proc = subprocess.Popen(cmd, text=True, stdout=subprocess.PIPE if capture_stdout else None)
+    stdout = proc.stdout.read() if capture_stdout else ''
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.stdout:
+        proc.stdout.close()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=stdout)
+    return stdout, rusage.ru_utime + rusage.ru_stime
+
+def _transcode_for_asr(audio_file):
+    """
+    将音频转码为语音识别所需的16kHz单声道低码率MP3
+    
+    Returns:
+        (转码后的文件路径, CPU时间秒数) 元组
+    """
+    output_file = os.path.splitext(audio_file)[0] + '.asr.mp3'
+    _, cpu_time = _run_measured([
+        'ffmpeg', '-y', '-loglevel', 'error', '-i', audio_file,
+        '-vn', '-ac', '1', '-ar', str(ASR_SAMPLE_RATE), '-b:a', ASR_BITRATE,
+        output_file,
+    ])
+    os.remove(audio_file)
+    return output_file, cpu_time
+
+@pipeline_metrics.timed('download', check=lambda result: result[0] is not None)
+def download_audio(link, output_dir, audio_mode='asr', metadata_store=None):
+    """
+    下载视频的音频部分，支持YouTube和抖音
+    
+    只调用一次yt-dlp：同时写出视频的info JSON并下载音频，
+    标题、时长等元数据从info JSON中读取，并保存到元数据存储中供之后使用。
+    
+    Args:
+        link: 视频链接
+        output_dir: 音频文件保存目录
+        audio_mode: 'asr' 优先保留原始音频流(opus/m4a)，否则转码为16kHz单声道低码率；
+                    'mp3' 沿用旧的最高质量MP3转码
+        metadata_store: MetadataStore实例，提供时保存视频元数据
+        
+    Returns:
+        (音频文件路径, 标题) 元组，失败时返回 (None, None)
+    """
     try:
-        print(f"正在获取视频信息: {link}")
+        print(f"正在下载视频音频: {link}")
         
         # 识别视频平台
         platform = identify_platform(link)
@@ -50,30 +164,21 @@ def download_audio(link, output_dir):
         
         print(f"识别为{platform}视频链接")
         
-        # 获取视频标题
-        result = subprocess.run(
-            ['yt-dlp', '--print', 'title', '--no-playlist', link],
-            capture_output=True, text=True, check=True
-        )
-        title = result.stdout.strip()
-        title = clean_filename(title)
-        print(f"视频标题: {title}")
-        
-        # 设置输出文件名
-        output_file = os.path.join(output_dir, f"{title}.mp3")
-        
-        # 使用yt-dlp下载仅音频并转换为mp3
-        print(f"正在下载音频...")
-        
-        # 对于抖音，可能需要添加额外的选项以处理重定向
+        # 临时音频文件以视频ID命名，避免同名视频互相覆盖
         cmd = [
             'yt-dlp',
             '-x',  # 提取音频
-            '--audio-format', 'mp3',  # 转换为mp3
-            '--audio-quality', '0',  # 最佳质量
-            '-o', output_file,
+            '-o', os.path.join(output_dir, '%(id)s.%(ext)s'),
+            '--write-info-json',  # 写出视频元数据，不再单独获取标题
+            '--print', 'after_move:filepath',
             '--no-playlist',  # 不下载播放列表中的其他视频
         ]
+        if audio_mode == 'mp3':
+            # 转换为最高质量mp3
+            cmd.extend(['--audio-format', 'mp3', '--audio-quality', '0'])
+        else:
+            # 优先选择opus/m4a音频流，只提取不转码
+            cmd.extend(['-f', ASR_FORMAT_SELECTOR])
         
         # 针对抖音添加特殊处理参数
         if platform == 'douyin':
@@ -81,9 +186,41 @@ def download_audio(link, output_dir):
         
         cmd.append(link)  # 添加链接
         
-        subprocess.run(cmd, check=True)
+        stdout, cpu_time = _run_measured(cmd, capture_stdout=True)
+        output_file = stdout.strip().splitlines()[-1]
+        
+        # 读取yt-dlp写出的info JSON
+        info_json = os.path.splitext(output_file)[0] + '.info.json'
+        with open(info_json, 'r', encoding='utf-8') as f:
+            metadata = extract_metadata(json.load(f))
+        os.remove(info_json)
+        if metadata_store is not None:
+            metadata_store.put(get_video_key(link) or f"{platform}:{metadata.get('id')}", metadata)
+        title = clean_filename(metadata.get('title') or os.path.basename(output_file))
+        duration = metadata.get('duration')
+        print(f"视频标题: {title}")
         
-        print(f"音频下载完成: {output_file}")
+        if audio_mode == 'mp3':
+            pipeline_metrics.add(bytes=os.path.getsize(output_file))
+            print(f"音频下载完成: {output_file}")
+            return output_file, title
+        
+        ext = os.path.splitext(output_file)[1].lstrip('.').lower()
+        if ext not in ASR_NATIVE_EXTS:
+            print(f"原始音频格式 {ext} 不适合直接上传，转码为16kHz单声道...")
+            output_file, transcode_cpu = _transcode_for_asr(output_file)
+            if cpu_time is not None and transcode_cpu is not None:
+                cpu_time += transcode_cpu
+        
+        size = os.path.getsize(output_file)
+        pipeline_metrics.add(bytes=size, cpu_seconds=cpu_time or 0)
+        report = f"音频下载完成: {output_file} ({size / 1024 / 1024:.1f} MB"
+        if duration:
+            legacy_size = duration * LEGACY_MP3_KBPS * 1000 / 8
+            report += f"，比最高质量MP3约节省 {max(0, legacy_size - size) / 1024 / 1024:.1f} MB"
+        if cpu_time is not None:
+            report += f"，音频处理CPU时间 {cpu_time:.1f} 秒"
+        print(report + ")")
         return output_file, title
     except subprocess.CalledProcessError as e:
         print(f"下载视频音频时出错 (命令执行失败): {e}")
@@ -93,120 +230,318 @@ def download_audio(link, output_dir):
         print(f"下载视频音频时出错: {e}")
         return None, None
 
-def transcribe_with_assemblyai(audio_file):
-    """使用AssemblyAI转录音频文件"""
-    if not ASSEMBLYAI_API_KEY:
-        print("错误: 请设置你的AssemblyAI API密钥")
+def transcript_cache_tag(backend, trimmer=None):
+    """
+    转录缓存中区分语音识别后端和静音裁剪设置的标识
+    
+    Returns:
+        形如 'faster-whisper:small:vad' 的字符串，默认设置下为空字符串
+    """
+    tags = [tag for tag in (backend.cache_tag if backend else '', trimmer.cache_tag if trimmer else '') if tag]
+    return ':'.join(tags)
+
+def lookup_cached_transcript(link, cache, backend=None, trimmer=None):
+    """
+    在下载之前根据规范视频ID查询转录缓存
+    
+    Args:
+        link: 视频链接
+        cache: TranscriptCache实例，为None时不查询
+        backend: 本次使用的语音识别后端，只读取同一后端的结果
+        trimmer: 本次使用的SilenceTrimmer，是否裁剪静音的结果分开读取
+        
+    Returns:
+        命中时返回 (title, transcript)，否则返回None
+    """
+    if cache is None:
+        return None
+    key = get_video_key(link)
+    if key is None:
+        return None
+    cached = cache.get_by_video(key, transcript_cache_tag(backend, trimmer))
+    if cached is None:
         return None
+    print(f"命中转录缓存，跳过下载和转录: {cached['title']}")
+    return cached['title'], cached['result']['text']
+
+@pipeline_metrics.timed('transcribe', check=lambda text: text is not None)
+def transcribe_audio(audio_file, backend, cache=None, video_key=None, title=None,
+                     upload_url=None, on_upload=None, audio_duration=None, trimmer=None, segmenter=None):
+    """
+    使用语音识别后端转录音频文件
     
-    headers = {
-        "authorization": ASSEMBLYAI_API_KEY,
-        "content-type": "application/json"
-    }
+    Args:
+        audio_file: 音频文件路径
+        backend: TranscriptionBackend实例
+        cache: TranscriptCache实例，提供时先按音频内容哈希查询缓存，转录完成后写入缓存
+        video_key: 规范视频ID，用于在缓存中记录视频到音频的映射
+        title: 视频标题
+        upload_url: 之前已经上传得到的 upload_url，提供时跳过上传
+        on_upload: 上传完成后以 upload_url 为参数调用的回调函数
+        audio_duration: 音频时长（秒），用于计算轮询间隔，未提供时使用ffprobe获取
+        trimmer: SilenceTrimmer实例，提供时上传前压缩音频中较长的静音，
+            识别结果中的时间戳换算回原始音频的时间
+        segmenter: AudioSegmenter实例，提供时把长音频切成片段同时转录后再拼接
+        
+    Returns:
+        转录文本，失败时返回None
+    """
+    has_audio = bool(audio_file) and os.path.exists(audio_file)
+    audio_key = None
+    if cache is not None and has_audio:
+        # 不同后端、是否裁剪静音的识别结果分开缓存
+        cache_tag = transcript_cache_tag(backend, trimmer)
+        audio_key = sha256_file(audio_file)
+        if cache_tag:
+            audio_key = f"{cache_tag}:{audio_key}"
+        cached = cache.get_by_audio(audio_key)
+        if cached is not None:
+            print("命中转录缓存，跳过上传和转录")
+            pipeline_metrics.tag(cache_hit=True)
+            if video_key:
+                cache.link_video(video_key, audio_key, title, cache_tag)
+            return cached["text"]
+    
+    upload_file, time_map = audio_file, None
+    if trimmer is not None and has_audio:
+        with pipeline_metrics.span('vad'):
+            try:
+                if upload_url:
+                    # 已经上传过，只需重新计算上传的音频对应的时间映射
+                    time_map = trimmer.plan(audio_file)
+                    if not trimmer.should_trim(time_map):
+                        time_map = None
+                else:
+                    trimmed_file, time_map = trimmer.trim(audio_file)
+                    upload_file = trimmed_file or audio_file
+            except Exception as e:
+                print(f"静音检测失败，上传原始音频: {e}")
+                pipeline_metrics.fail(str(e))
+                upload_file, time_map = audio_file, None
+        if time_map is not None:
+            audio_duration = time_map.output_duration
+    
+    spans = None
+    if segmenter is not None and has_audio and not upload_url:
+        try:
+            spans = segmenter.plan(upload_file, audio_duration)
+        except Exception as e:
+            print(f"音频分段失败，整段转录: {e}")
     
     try:
-        print(f"正在上传音频文件到AssemblyAI...")
-        
-        # 上传音频文件
-        with open(audio_file, "rb") as f:
-            response = requests.post(
-                "https://api.assemblyai.com/v2/upload",
-                headers=headers,
-                data=f
-            )
+        if spans and len(spans) > 1:
+            result = segmenter.transcribe(upload_file, spans, backend)
+        else:
+            result = backend.transcribe(upload_file, audio_duration=audio_duration,
+                                        upload_url=upload_url, on_upload=on_upload)
+    finally:
+        if upload_file != audio_file and os.path.exists(upload_file):
+            os.remove(upload_file)
+    if result is None:
+        return None
+    if time_map is not None:
+        result = time_map.apply(result)
+    
+    if audio_key is not None:
+        cache.put(audio_key, result, video_key, title, cache_tag)
+    return result["text"]
+
+# 句子或停顿边界：句末标点、分句标点、换行和空白
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)')
+_PAUSE_BOUNDARY = re.compile(r'(?<=[，,、：:])|(?<=\s)')
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：每个中日韩字符约1个token，其他字符约4个一个token"""
+    cjk = len(re.findall(r'[぀-ヿ㐀-鿿豈-﫿]', text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _split_units(text, pattern, max_tokens):
+    """按边界切分文本，切分后仍然超过预算的片段按字符数硬切"""
+    units = []
+    for piece in pattern.split(text):
+        if not piece:
+            continue
+        if estimate_tokens(piece) <= max_tokens:
+            units.append(piece)
+        elif pattern is _SENTENCE_BOUNDARY:
+            units.extend(_split_units(piece, _PAUSE_BOUNDARY, max_tokens))
+        else:
+            step = max(1, max_tokens)
+            units.extend(piece[i:i + step] for i in range(0, len(piece), step))
+    return units
+
+def split_text_into_chunks(text, max_tokens=FORMAT_CHUNK_TOKENS):
+    """
+    在句子或停顿边界处把文本切分成不超过token预算的块
+    
+    Args:
+        text: 要切分的文本
+        max_tokens: 每块的token预算
         
-        if response.status_code != 200:
-            print(f"上传失败: {response.text}")
-            return None
-            
-        upload_url = response.json()["upload_url"]
+    Returns:
+        文本块列表，按顺序拼接后与原文完全相同
+    """
+    chunks = []
+    current = ''
+    current_tokens = 0
+    for unit in _split_units(text, _SENTENCE_BOUNDARY, max_tokens):
+        unit_tokens = estimate_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append(current)
+            current = ''
+            current_tokens = 0
+        current += unit
+        current_tokens += unit_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+@pipeline_metrics.timed('llm')
+def _format_chunk(chunk, context, headers, cache=None):
+    """
+    格式化一个文本块
+    
+    Args:
+        chunk: 要格式化的文本块
+        context: 上一块的结尾，只作为上文参考，帮助模型在衔接处正确断句
+        headers: 请求头
+        cache: FormatCache实例，提供时先查询缓存，成功的结果写入缓存
         
-        # 开始转录
-        print("开始转录...")
-        response = requests.post(
-            "https://api.assemblyai.com/v2/transcript",
+    Returns:
+        格式化后的文本，失败时返回原文本块
+    """
+    user_content = f"请为以下文本添加适当的标点符号，使其更易阅读。请保持原始内容不变，只添加必要的标点符号：\n\n{chunk}"
+    if context:
+        user_content = (f"【上文】仅用于理解语境，不要输出上文：\n{context}\n\n" + user_content)
+    
+    payload = {
+        "model": DEEPSEEK_MODEL,
+        "messages": [
+            {"role": "system", "content": DEEPSEEK_SYSTEM_PROMPT},
+            {"role": "user", "content": user_content}
+        ],
+        "temperature": 0.1,
+        "top_p": 0.8,
+        "max_tokens": min(8000, estimate_tokens(chunk) * 2 + 200)
+    }
+    
+    if cache is not None:
+        cached = cache.get_completion(payload)
+        if cached is not None:
+            pipeline_metrics.tag(cache_hit=True)
+            return cached
+    
+    try:
+        response = get_session().post(
+            f"{DEEPSEEK_BASE_URL}/v1/chat/completions",
             headers=headers,
-            json={
-                "audio_url": upload_url,
-                "language_code": "zh",  # 指定中文语言
-                "punctuate": True,      # 添加标点符号
-                "format_text": True     # 格式化文本
-            }
+            json=payload,
+            timeout=DEEPSEEK_TIMEOUT
         )
-        
-        transcript_id = response.json()["id"]
-        polling_endpoint = f"https://api.assemblyai.com/v2/transcript/{transcript_id}"
-        
-        # 等待转录完成
-        while True:
-            response = requests.get(polling_endpoint, headers=headers)
-            status = response.json()["status"]
-            
-            if status == "completed":
-                print("转录完成!")
-                return response.json()["text"]
-            elif status == "error":
-                print(f"转录出错: {response.json()['error']}")
-                return None
-            else:
-                print(f"转录进行中... 状态: {status}")
-                time.sleep(10)  # 等待10秒后再次检查
-                
+        pipeline_metrics.status(response.status_code)
+        pipeline_metrics.add(bytes=len(response.content))
+        if response.status_code == 200:
+            content = response.json()["choices"][0]["message"]["content"]
+            if cache is not None:
+                cache.put_completion(payload, content)
+            return content
+        print(f"DeepSeek API请求失败: {response.text}")
+        pipeline_metrics.fail(f"HTTP {response.status_code}")
     except Exception as e:
-        print(f"转录过程中出错: {e}")
-        return None
+        print(f"使用DeepSeek格式化文本时出错: {e}")
+        pipeline_metrics.fail(str(e))
+    return chunk
 
-def format_text_with_deepseek(text):
-    """使用DeepSeek API对文本进行格式化，添加标点符号"""
+@pipeline_metrics.timed('format')
+def format_text_with_deepseek(text, concurrency=FORMAT_CONCURRENCY, max_chunk_tokens=FORMAT_CHUNK_TOKENS,
+                              cache=None):
+    """
+    使用DeepSeek API对文本进行格式化，添加标点符号
+    
+    长文本在句子或停顿边界处切分成不超过token预算的块，并发格式化后按顺序拼接。
+    每块都会附带上一块结尾的一小段作为上文，保证衔接处的标点正确。
+    某一块失败时该块保留原文，不影响其他块。
+    
+    Args:
+        text: 要格式化的文本
+        concurrency: 同时进行的请求数
+        max_chunk_tokens: 每块的token预算
+        cache: FormatCache实例，为None时不使用格式化缓存
+        
+    Returns:
+        格式化后的文本
+    """
     if not DEEPSEEK_API_KEY:
         print("警告: 未设置DeepSeek API密钥，跳过文本格式化")
         return text
     
-    print("使用DeepSeek添加标点符号和格式化文本...")
-    
+    chunks = split_text_into_chunks(text, max_chunk_tokens)
+    contexts = [''] + [chunk[-FORMAT_CONTEXT_CHARS:] for chunk in chunks[:-1]]
+    print(f"使用DeepSeek添加标点符号和格式化文本... (共 {len(chunks)} 块)")
+    pipeline_metrics.add(chunks=len(chunks), llm_chunks=len(chunks))
+    formatted_chunks = _format_chunks(chunks, contexts, concurrency, cache)
+    print("文本格式化完成")
+    return ''.join(formatted_chunks)
+
+def _format_chunks(chunks, contexts, concurrency, cache=None):
+    """并发格式化多个文本块，按输入顺序返回结果"""
     headers = {
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
         "Content-Type": "application/json"
     }
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+        return list(executor.map(pipeline_metrics.bind(lambda args: _format_chunk(*args, headers, cache)),
+                                 zip(chunks, contexts)))
+
+@pipeline_metrics.timed('format')
+def format_transcript(text, concurrency=FORMAT_CONCURRENCY, max_chunk_tokens=FORMAT_CHUNK_TOKENS,
+                      cache=None, min_score=PUNCTUATION_MIN_SCORE):
+    """
+    先在本地规整标点，只把标点不足的块交给DeepSeek
     
-    try:
-        payload = {
-            "model": "deepseek-chat", 
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": "你是一位精通中文的专家，负责为文本添加适当的标点符号，使文本更易阅读。保持原始内容不变，只添加必要的标点符号。"
-                },
-                {
-                    "role": "user", 
-                    "content": f"请为以下文本添加适当的标点符号，使其更易阅读。请保持原始内容不变，只添加必要的标点符号：\n\n{text}"
-                }
-            ],
-            "temperature": 0.1,
-            "top_p": 0.8,
-            "max_tokens": 8000
-        }
-        
-        response = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
+    文本先经过 punctuation.clean_text 规整，再按与 format_text_with_deepseek 相同的方式分块，
+    标点评分低于 min_score 的块才请求DeepSeek，其余的块直接使用本地规整的结果。
+    
+    Args:
+        text: 要格式化的文本
+        concurrency: 同时进行的请求数
+        max_chunk_tokens: 每块的token预算
+        cache: FormatCache实例，为None时不使用格式化缓存
+        min_score: 标点评分达到该值的块不再请求DeepSeek
         
-        if response.status_code == 200:
-            formatted_text = response.json()["choices"][0]["message"]["content"]
-            print("文本格式化完成")
-            return formatted_text
-        else:
-            print(f"DeepSeek API请求失败: {response.text}")
-            return text
+    Returns:
+        (格式化后的文本, 处理方式) 元组，处理方式为 'local'（只在本地规整）、
+        'llm'（所有块都交给DeepSeek）或 'mixed'（部分块交给DeepSeek）
+    """
+    text = clean_text(text)
+    chunks = split_text_into_chunks(text, max_chunk_tokens)
+    pending = [i for i, chunk in enumerate(chunks) if punctuation_score(chunk) < min_score]
+    pipeline_metrics.add(chunks=len(chunks), llm_chunks=len(pending))
+    if not pending:
+        print(f"本地标点规整完成，{len(chunks)} 块的标点均已充分，不需要DeepSeek")
+        return text, 'local'
+    if not DEEPSEEK_API_KEY:
+        print("警告: 未设置DeepSeek API密钥，只使用本地标点规整的结果")
+        return text, 'local'
     
-    except Exception as e:
-        print(f"使用DeepSeek格式化文本时出错: {e}")
-        return text
+    print(f"本地标点规整完成，{len(pending)}/{len(chunks)} 块标点不足，使用DeepSeek格式化这些块")
+    contexts = [chunks[i - 1][-FORMAT_CONTEXT_CHARS:] if i else '' for i in pending]
+    formatted_chunks = _format_chunks([chunks[i] for i in pending], contexts, concurrency, cache)
+    for i, chunk in zip(pending, formatted_chunks):
+        chunks[i] = normalize_punctuation(chunk)
+    print("文本格式化完成")
+    return ''.join(chunks), 'llm' if len(pending) == len(chunks) else 'mixed'
 
-def save_to_markdown(transcript, title):
-    """将转录内容保存为Markdown文件"""
+@pipeline_metrics.timed('save')
+def save_to_markdown(transcript, title, transcript_index=None):
+    """
+    将转录内容保存为Markdown文件
+    
+    Args:
+        transcript: 转录文本
+        title: 视频标题
+        transcript_index: TranscriptIndex实例，提供时把新文件加入全文索引
+    """
     if not transcript:
         return None
         
@@ -223,73 +558,644 @@ def save_to_markdown(transcript, title):
         f.write(f"# {title}\n\n")
         f.write(transcript)
     
+    pipeline_metrics.add(bytes=os.path.getsize(md_file))
     print(f"已创建Markdown文件: {md_file}")
+    if transcript_index is not None:
+        try:
+            transcript_index.add_document(md_file, f"# {title}\n\n{transcript}", title)
+        except Exception as e:
+            # 索引出错不影响已经保存的文件，之后可以用 transcript_index.py index 补录
+            print(f"加入全文索引失败: {e}")
     return md_file
 
-def main():
-    # 如果未设置API密钥，提示用户
-    if not ASSEMBLYAI_API_KEY:
-        print("警告: 未设置AssemblyAI API密钥。请编辑脚本设置你的API密钥。")
-        print("注册地址: https://www.assemblyai.com/ (有免费额度)")
+def _new_job(index, total, link, temp_dir, cache=None, backend=None, manifest=None,
+             audio_mode='asr', metadata_store=None, format_concurrency=FORMAT_CONCURRENCY,
+             format_cache=None, transcript_index=None, trimmer=None, segmenter=None,
+             punctuation_min_score=PUNCTUATION_MIN_SCORE):
+    """
+    创建一个任务字典
+    
+    提供运行清单时，从该链接在清单中最后完成的阶段继续
+    """
+    job = {
+        'index': index,
+        'total': total,
+        'link': link,
+        'video_key': get_video_key(link),
+        'temp_dir': temp_dir,
+        'audio_mode': audio_mode,
+        'metadata_store': metadata_store,
+        'format_concurrency': format_concurrency,
+        'format_cache': format_cache,
+        'punctuation_min_score': punctuation_min_score,
+        'transcript_index': transcript_index,
+        'cache': cache,
+        'backend': backend,
+        'trimmer': trimmer,
+        'segmenter': segmenter,
+        'manifest': manifest,
+        'stage': None,
+        'audio_file': None,
+        'upload_url': None,
+        'title': None,
+        'transcript': None,
+        'format_path': None,
+        'md_file': None,
+        'error': None,
+    }
+    if manifest is not None:
+        _resume_job(job, manifest.ensure(_manifest_key(job), link))
+    return job
+
+def _manifest_key(job):
+    """任务在运行清单中的键，无法解析视频ID时使用原始链接"""
+    return job['video_key'] or job['link']
+
+def _resume_job(job, row):
+    """根据运行清单中的记录恢复任务进度"""
+    stage = row['stage']
+    if stage is None:
         return
+    job['title'] = row['title']
+    if stage == 'saved' and row['md_file'] and os.path.exists(row['md_file']):
+        job['stage'] = 'saved'
+        job['md_file'] = row['md_file']
+    elif stage_reached(stage, 'formatted'):
+        job['stage'] = 'formatted'
+        job['transcript'] = row['formatted']
+    elif stage == 'transcribed':
+        job['stage'] = 'transcribed'
+        job['transcript'] = row['transcript']
+    elif stage == 'uploaded':
+        # 已上传的音频可以直接提交转录，不依赖本地音频文件
+        job['stage'] = 'uploaded'
+        job['upload_url'] = row['upload_url']
+        if row['audio_file'] and os.path.exists(row['audio_file']):
+            job['audio_file'] = row['audio_file']
+    elif stage == 'downloaded' and row['audio_file'] and os.path.exists(row['audio_file']):
+        job['stage'] = 'downloaded'
+        job['audio_file'] = row['audio_file']
     
-    # 创建临时目录存放音频文件
-    temp_dir = "temp_audio"
-    os.makedirs(temp_dir, exist_ok=True)
+    if job['stage'] is not None:
+        print(f"[{job['index']}/{job['total']}] 从已完成的阶段 {job['stage']} 继续: {job['link']}")
+
+def _advance(job, stage, **fields):
+    """记录任务完成了某个阶段，有运行清单时同步写入清单"""
+    job['stage'] = stage
+    if job['manifest'] is not None:
+        job['manifest'].mark(_manifest_key(job), stage, **fields)
+
+def _download_stage(job):
+    """下载阶段，命中转录缓存时直接进入已转录状态"""
+    if job['stage'] is not None:
+        return
+    cached = lookup_cached_transcript(job['link'], job['cache'], job['backend'], job['trimmer'])
+    if cached:
+        job['title'], job['transcript'] = cached
+        _advance(job, 'transcribed', title=job['title'], transcript=job['transcript'])
+        return
+    print(f"\n[{job['index']}/{job['total']}] 下载: {job['link']}")
+    audio_file, title = download_audio(job['link'], job['temp_dir'], audio_mode=job['audio_mode'],
+                                       metadata_store=job['metadata_store'])
+    if not audio_file or not title:
+        job['error'] = "无法下载"
+        return
+    job['audio_file'] = audio_file
+    job['title'] = title
+    _advance(job, 'downloaded', title=title, audio_file=audio_file)
+
+def _transcribe_stage(job):
+    """转录阶段，使用任务中的语音识别后端"""
+    if stage_reached(job['stage'], 'transcribed'):
+        return
+    print(f"\n[{job['index']}/{job['total']}] 转录: {job['title']}")
     
-    # 确保输出目录存在
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    def on_upload(upload_url):
+        job['upload_url'] = upload_url
+        _advance(job, 'uploaded', upload_url=upload_url)
     
-    links = get_video_links()
-    print(f"找到 {len(links)} 个视频链接")
+    audio_duration = None
+    if job['metadata_store'] is not None and job['video_key']:
+        audio_duration = (job['metadata_store'].get(job['video_key']) or {}).get('duration')
     
-    # 按平台分类链接
-    youtube_links = []
-    douyin_links = []
-    unknown_links = []
+    transcript = transcribe_audio(job['audio_file'], job['backend'], cache=job['cache'],
+                                  video_key=job['video_key'], title=job['title'],
+                                  upload_url=job['upload_url'], on_upload=on_upload,
+                                  audio_duration=audio_duration, trimmer=job['trimmer'],
+                                  segmenter=job['segmenter'])
+    if not transcript:
+        job['error'] = "转录失败"
+        return
+    job['transcript'] = transcript
+    _advance(job, 'transcribed', transcript=transcript)
+
+def _format_stage(job):
+    """格式化阶段，未关闭本地标点规整时只把标点不足的部分交给DeepSeek"""
+    if stage_reached(job['stage'], 'formatted'):
+        return
+    print(f"\n[{job['index']}/{job['total']}] 格式化: {job['title']}")
+    if job['punctuation_min_score'] is None:
+        job['transcript'] = format_text_with_deepseek(job['transcript'],
+                                                      concurrency=job['format_concurrency'],
+                                                      cache=job['format_cache'])
+        job['format_path'] = 'llm'
+    else:
+        job['transcript'], job['format_path'] = format_transcript(job['transcript'],
+                                                                  concurrency=job['format_concurrency'],
+                                                                  cache=job['format_cache'],
+                                                                  min_score=job['punctuation_min_score'])
+    print(f"[{job['index']}/{job['total']}] 格式化方式: {_FORMAT_PATH_NAMES[job['format_path']]}")
+    _advance(job, 'formatted', formatted=job['transcript'])
+
+def _save_stage(job):
+    """保存阶段，保存完成后清理音频文件"""
+    if job['stage'] == 'saved':
+        print(f"[{job['index']}/{job['total']}] 已完成，跳过: {job['md_file']}")
+        return
+    job['md_file'] = save_to_markdown(job['transcript'], job['title'], job['transcript_index'])
+    _advance(job, 'saved', md_file=job['md_file'])
+    audio_file = job['audio_file']
+    if audio_file and os.path.exists(audio_file):
+        os.remove(audio_file)
+        print(f"已删除临时音频文件: {audio_file}")
+
+def _run_stage(handler, job):
+    """执行任务的一个阶段，出错只记录在该任务上，不影响其他链接"""
+    if job['error'] is not None:
+        return
+    try:
+        with pipeline_metrics.video(_manifest_key(job)):
+            handler(job)
+    except Exception as e:
+        job['error'] = f"{type(e).__name__}: {e}"
+    if job['error'] is not None and job['manifest'] is not None:
+        job['manifest'].record_error(_manifest_key(job), job['error'])
+
+# 按顺序排列的处理阶段
+_STAGE_HANDLERS = (_download_stage, _transcribe_stage, _format_stage, _save_stage)
+
+# 格式化方式的说明，见 format_transcript
+_FORMAT_PATH_NAMES = {'local': '本地标点规整', 'llm': 'DeepSeek', 'mixed': '本地标点规整 + DeepSeek'}
+
+def _print_summary(jobs):
+    """按输入顺序打印处理结果汇总"""
+    failed = [job for job in jobs if job['error']]
+    print(f"\n处理完成: 成功 {len(jobs) - len(failed)} 个，失败 {len(failed)} 个")
+    paths = [job['format_path'] for job in jobs if job['format_path']]
+    if paths:
+        print("格式化方式: " + "，".join(f"{name} {paths.count(path)} 个"
+                                      for path, name in _FORMAT_PATH_NAMES.items() if path in paths))
+    for job in failed:
+        print(f"  失败 {job['index']}/{job['total']}: {job['link']} ({job['error']})")
+
+def _link_count(links):
+    """链接总数，链接逐个产生、总数未知时返回 ?"""
+    return len(links) if hasattr(links, '__len__') else '?'
+
+def process_links_serially(valid_links, temp_dir, cache=None, manifest=None, audio_mode='asr',
+                           metadata_store=None, format_concurrency=FORMAT_CONCURRENCY,
+                           format_cache=None, transcript_index=None, backend=None, trimmer=None,
+                           segmenter=None, punctuation_min_score=PUNCTUATION_MIN_SCORE):
+    """
+    逐个处理视频链接：下载、转录、格式化、保存
     
-    for link in links:
-        platform = identify_platform(link)
-        if platform == 'youtube':
-            youtube_links.append(link)
-        elif platform == 'douyin':
-            douyin_links.append(link)
-        else:
-            unknown_links.append(link)
+    valid_links 可以是搜索过程中逐个产生链接的可迭代对象，此时总数显示为 ?。
+    backend 为None时使用AssemblyAI。
     
-    print(f"YouTube链接: {len(youtube_links)}个")
-    print(f"抖音链接: {len(douyin_links)}个")
-    if unknown_links:
-        print(f"未知平台链接: {len(unknown_links)}个 (这些链接将被跳过)")
+    Returns:
+        按输入顺序排列的任务字典列表，失败的任务包含 error 字段
+    """
+    owns_backend = backend is None
+    if owns_backend:
+        backend = AssemblyAIBackend(ASSEMBLYAI_API_KEY)
+    jobs = []
+    total = _link_count(valid_links)
+    for i, link in enumerate(valid_links, 1):
+        job = _new_job(i, total, link, temp_dir, cache=cache, backend=backend, manifest=manifest,
+                       audio_mode=audio_mode, metadata_store=metadata_store,
+                       format_concurrency=format_concurrency, format_cache=format_cache,
+                       transcript_index=transcript_index, trimmer=trimmer, segmenter=segmenter,
+                       punctuation_min_score=punctuation_min_score)
+        for handler in _STAGE_HANDLERS:
+            _run_stage(handler, job)
+        jobs.append(job)
+    if owns_backend:
+        backend.close()
+    _print_summary(jobs)
+    return jobs
+
+# 流水线中用于通知工作线程退出的哨兵对象
+_STOP = object()
+
+def _stage_loop(handler, in_queue, out_queue):
+    """流水线阶段的工作线程主循环：从上游队列取任务，处理后交给下游队列"""
+    while True:
+        job = in_queue.get()
+        if job is _STOP:
+            return
+        # 已失败的任务直接透传，保证每个失败只归属于它自己的链接
+        _run_stage(handler, job)
+        out_queue.put(job)
+
+def _start_stage(name, handler, in_queue, out_queue, workers, downstream_workers):
+    """
+    启动一个流水线阶段的工作线程池
     
-    # 处理所有有效链接
-    valid_links = youtube_links + douyin_links
+    Args:
+        name: 阶段名称，用于线程命名
+        handler: 处理单个任务的函数，直接修改任务字典
+        in_queue: 上游队列
+        out_queue: 下游队列
+        workers: 本阶段的工作线程数
+        downstream_workers: 下游阶段的工作线程数，决定结束时发送的哨兵数量
+        
+    Returns:
+        本阶段的收尾线程，它结束即表示本阶段全部完成
+    """
+    threads = [
+        threading.Thread(target=_stage_loop, args=(handler, in_queue, out_queue),
+                         name=f"{name}-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
     
-    for i, link in enumerate(valid_links, 1):
-        print(f"\n处理视频 {i}/{len(valid_links)}: {link}")
+    def close():
+        for thread in threads:
+            thread.join()
+        for _ in range(downstream_workers):
+            out_queue.put(_STOP)
+    
+    closer = threading.Thread(target=close, name=f"{name}-closer", daemon=True)
+    closer.start()
+    return closer
+
+def run_pipeline(links, temp_dir, download_workers=2, transcribe_workers=4,
+                 format_workers=2, queue_size=4, async_asr=False, cache=None, manifest=None,
+                 audio_mode='asr', metadata_store=None, format_concurrency=FORMAT_CONCURRENCY,
+                 format_cache=None, transcript_index=None, backend=None, trimmer=None, segmenter=None,
+                 punctuation_min_score=PUNCTUATION_MIN_SCORE):
+    """
+    以分阶段流水线的方式并发处理视频链接
+    
+    下载、转录、格式化、保存四个阶段各自拥有独立的工作线程池，
+    阶段之间通过有界队列连接，因此网络下载、语音识别服务和大模型可以同时工作。
+    每个阶段调用的函数与串行模式完全相同，输出文件也与串行模式一致。
+    
+    Args:
+        links: 要处理的视频链接列表，也可以是搜索过程中逐个产生链接的可迭代对象，
+            链接一产生就进入下载队列
+        temp_dir: 存放临时音频文件的目录
+        download_workers: 下载阶段的工作线程数
+        transcribe_workers: 转录阶段的工作线程数
+        format_workers: 格式化阶段的工作线程数
+        queue_size: 阶段之间队列的容量
+        async_asr: 未提供 backend 时，是否使用AssemblyAI异步客户端在单个事件循环中统一轮询所有转录任务
+        cache: TranscriptCache实例，为None时不使用转录缓存
+        manifest: RunManifest实例，为None时不记录处理进度
+        audio_mode: 音频下载模式，见 download_audio
+        metadata_store: MetadataStore实例，为None时不保存视频元数据
+        format_concurrency: 每个视频格式化时同时进行的请求数
+        format_cache: FormatCache实例，为None时不使用格式化缓存
+        transcript_index: TranscriptIndex实例，为None时不更新全文索引
+        backend: TranscriptionBackend实例，为None时使用AssemblyAI
+        trimmer: SilenceTrimmer实例，为None时上传完整的音频
+        segmenter: AudioSegmenter实例，为None时长音频也整段转录
+        punctuation_min_score: 标点评分达到该值的文本块不再交给DeepSeek，为None时全部交给DeepSeek
         
-        # 下载音频
-        audio_file, title = download_audio(link, temp_dir)
-        if not audio_file or not title:
-            print(f"跳过转录，无法下载: {link}")
-            continue
+    Returns:
+        按输入顺序排列的任务字典列表，失败的任务包含 error 字段
+    """
+    total = _link_count(links)
+    download_queue = queue.Queue(maxsize=queue_size)
+    transcribe_queue = queue.Queue(maxsize=queue_size)
+    format_queue = queue.Queue(maxsize=queue_size)
+    save_queue = queue.Queue(maxsize=queue_size)
+    done_queue = queue.Queue()
+    owns_backend = backend is None
+    if owns_backend:
+        backend = AssemblyAIBackend(ASSEMBLYAI_API_KEY, async_client=async_asr)
+    
+    # 保存阶段只使用一个线程，避免同名文件并发写入
+    closers = [
+        _start_stage('download', _download_stage, download_queue, transcribe_queue,
+                     download_workers, transcribe_workers),
+        _start_stage('transcribe', _transcribe_stage, transcribe_queue, format_queue,
+                     transcribe_workers, format_workers),
+        _start_stage('format', _format_stage, format_queue, save_queue,
+                     format_workers, 1),
+        _start_stage('save', _save_stage, save_queue, done_queue, 1, 1),
+    ]
+    
+    for i, link in enumerate(links, 1):
+        download_queue.put(_new_job(i, total, link, temp_dir, cache=cache,
+                                    backend=backend, manifest=manifest,
+                                    audio_mode=audio_mode, metadata_store=metadata_store,
+                                    format_concurrency=format_concurrency,
+                                    format_cache=format_cache,
+                                    transcript_index=transcript_index,
+                                    trimmer=trimmer, segmenter=segmenter,
+                                    punctuation_min_score=punctuation_min_score))
+    for _ in range(download_workers):
+        download_queue.put(_STOP)
+    
+    for closer in closers:
+        closer.join()
+    if owns_backend:
+        backend.close()
+    
+    jobs = []
+    while True:
+        job = done_queue.get()
+        if job is _STOP:
+            break
+        jobs.append(job)
+    jobs.sort(key=lambda job: job['index'])
+    
+    _print_summary(jobs)
+    return jobs
+
+def add_transcription_arguments(parser):
+    """向命令行解析器添加转录相关的参数，auto_search_and_transcribe.py 也使用这些参数"""
+    parser.add_argument('--pipeline', action='store_true',
+                        help='启用分阶段并发流水线模式（下载/转录/格式化/保存并行进行）')
+    parser.add_argument('--download-workers', type=int, default=2, help='流水线下载阶段的工作线程数 (默认: 2)')
+    parser.add_argument('--transcribe-workers', type=int, default=4, help='流水线转录阶段的工作线程数 (默认: 4)')
+    parser.add_argument('--format-workers', type=int, default=2, help='流水线格式化阶段的工作线程数 (默认: 2)')
+    parser.add_argument('--format-concurrency', type=int, default=FORMAT_CONCURRENCY,
+                        help=f'长文本分块格式化时每个视频同时进行的请求数 (默认: {FORMAT_CONCURRENCY})')
+    parser.add_argument('--punctuation-min-score', type=float, default=PUNCTUATION_MIN_SCORE,
+                        help=f'本地标点规整后评分（0到1）低于该值的文本块才交给DeepSeek (默认: {PUNCTUATION_MIN_SCORE})')
+    parser.add_argument('--no-local-punctuation', action='store_true',
+                        help='不使用本地标点规整，所有文本都交给DeepSeek格式化')
+    parser.add_argument('--queue-size', type=int, default=4, help='流水线阶段之间队列的容量 (默认: 4)')
+    parser.add_argument('--async-asr', action='store_true',
+                        help='流水线模式下使用AssemblyAI异步客户端，在单个事件循环中统一轮询所有转录任务')
+    parser.add_argument('--backend', choices=backend_names(), default=DEFAULT_BACKEND,
+                        help=f'语音识别后端：assemblyai 使用云服务，local 在本机CPU上运行Whisper模型 (默认: {DEFAULT_BACKEND})')
+    parser.add_argument('--local-model', default=LOCAL_MODEL, help=f'本地识别使用的Whisper模型 (默认: {LOCAL_MODEL})')
+    parser.add_argument('--local-engine', choices=LOCAL_ENGINES, default='auto',
+                        help='本地识别引擎，auto 优先使用 faster-whisper (默认: auto)')
+    parser.add_argument('--local-workers', type=int,
+                        help='本地识别的工作进程数 (默认: 可用CPU核数 / 每个进程的线程数)，'
+                             '流水线模式下 --transcribe-workers 不应小于该值')
+    parser.add_argument('--local-threads', type=int, default=LOCAL_THREADS_PER_WORKER,
+                        help=f'本地识别每个工作进程使用的CPU线程数 (默认: {LOCAL_THREADS_PER_WORKER})')
+    parser.add_argument('--no-vad', action='store_true', help='不检测静音，上传完整的音频')
+    parser.add_argument('--vad-min-silence', type=float, default=MIN_SILENCE,
+                        help=f'持续超过该秒数的静音在上传前被压缩 (默认: {MIN_SILENCE})')
+    parser.add_argument('--vad-keep-silence', type=float, default=KEEP_SILENCE,
+                        help=f'每段被压缩的静音保留的秒数 (默认: {KEEP_SILENCE})')
+    parser.add_argument('--no-segment', action='store_true', help='长音频也整段转录，不切分')
+    parser.add_argument('--segment-minutes', type=float, default=SEGMENT_SECONDS / 60,
+                        help=f'长音频在静音处切成约该分钟数的片段同时转录 (默认: {SEGMENT_SECONDS / 60:g})')
+    parser.add_argument('--segment-workers', type=int, default=SEGMENT_WORKERS,
+                        help=f'每个视频同时转录的片段数 (默认: {SEGMENT_WORKERS})')
+    parser.add_argument('--no-cache', action='store_true', help='不读取也不写入转录缓存和格式化缓存')
+    parser.add_argument('--refresh', action='store_true', help='忽略已有的转录缓存和格式化缓存重新处理，并用新结果更新缓存')
+    parser.add_argument('--cache-dir', default=TRANSCRIPT_CACHE_DIR, help=f'转录缓存目录 (默认: {TRANSCRIPT_CACHE_DIR})')
+    parser.add_argument('--cache-max-mb', type=int, default=TRANSCRIPT_CACHE_MAX_MB,
+                        help=f'转录缓存容量上限，超出后按最近最少使用淘汰 (默认: {TRANSCRIPT_CACHE_MAX_MB} MB)')
+    parser.add_argument('--format-cache-dir', default=FORMAT_CACHE_DIR, help=f'格式化结果缓存目录 (默认: {FORMAT_CACHE_DIR})')
+    parser.add_argument('--format-cache-max-mb', type=int, default=FORMAT_CACHE_MAX_MB,
+                        help=f'格式化结果缓存容量上限 (默认: {FORMAT_CACHE_MAX_MB} MB)')
+    parser.add_argument('--audio-mode', choices=['asr', 'mp3'], default='asr',
+                        help='音频下载模式：asr 优先保留原始音频流，必要时转码为16kHz单声道低码率；'
+                             'mp3 使用旧的最高质量MP3转码 (默认: asr)')
+    parser.add_argument('--metadata-dir', default=METADATA_DIR, help=f'视频元数据存储目录 (默认: {METADATA_DIR})')
+    parser.add_argument('--transcript-index-dir', default=TRANSCRIPT_INDEX_DIR,
+                        help=f'转录稿全文索引目录 (默认: {TRANSCRIPT_INDEX_DIR})')
+    parser.add_argument('--no-transcript-index', action='store_true', help='保存转录稿时不更新全文索引')
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help=f'运行清单数据库路径 (默认: {MANIFEST_PATH})')
+    parser.add_argument('--no-manifest', action='store_true', help='不记录处理进度，每次都从头处理')
+    parser.add_argument('--http-pool-size', type=int,
+                        help='每个主机的HTTP连接池大小 (默认: 根据并发数自动计算，至少为 32)')
+    parser.add_argument('--http-timeout', type=float, default=60, help='HTTP请求的默认读取超时秒数 (默认: 60)')
+    parser.add_argument('--metrics-dir', default=METRICS_DIR,
+                        help=f'运行指标目录，写入 events.jsonl 事件日志和Prometheus格式的 .prom 文件 (默认: {METRICS_DIR})')
+    parser.add_argument('--no-metrics', action='store_true', help='不记录运行指标，结束时也不打印各阶段耗时')
+
+def validate_transcription_arguments(parser, args):
+    """检查转录相关的参数，并按参数配置共享HTTP连接池"""
+    for name in ('download_workers', 'transcribe_workers', 'format_workers', 'format_concurrency',
+                 'queue_size', 'cache_max_mb', 'format_cache_max_mb', 'http_timeout',
+                 'segment_minutes', 'segment_workers'):
+        if getattr(args, name) <= 0:
+            parser.error(f"--{name.replace('_', '-')} 必须是正整数")
+    if args.http_pool_size is not None and args.http_pool_size <= 0:
+        parser.error("--http-pool-size 必须是正整数")
+    if (args.local_workers is not None and args.local_workers <= 0) or args.local_threads <= 0:
+        parser.error("--local-workers 和 --local-threads 必须是正整数")
+    if not 0 <= args.punctuation_min_score <= 1:
+        parser.error("--punctuation-min-score 必须在0到1之间")
+    if args.vad_min_silence <= 0 or not 0 <= args.vad_keep_silence < args.vad_min_silence:
+        parser.error("--vad-min-silence 必须是正数，--vad-keep-silence 必须小于 --vad-min-silence")
+    if args.backend == 'local':
+        try:
+            resolve_local_engine(args.local_engine)
+        except RuntimeError as e:
+            parser.error(str(e))
+    if args.no_manifest and (getattr(args, 'list_failures', False) or getattr(args, 'retry_failures', False)):
+        parser.error("--list-failures 和 --retry-failures 需要运行清单，不能与 --no-manifest 同时使用")
+    
+    # 连接池要能容纳同时访问同一主机的所有线程，否则多出的连接用完就被丢弃
+    pool_size = args.http_pool_size
+    if pool_size is None:
+        transcribe_requests = args.transcribe_workers * (1 if args.no_segment else args.segment_workers)
+        pool_size = max(32, transcribe_requests + args.format_workers * args.format_concurrency)
+    configure_http(pool_maxsize=pool_size, timeout=(10, args.http_timeout))
+
+def open_transcription_context(args):
+    """
+    按参数打开运行清单、元数据存储、转录缓存、格式化缓存、全文索引、静音裁剪、音频分段和语音识别后端，
+    并开始记录运行指标（调用方已经开始记录时沿用，由调用方负责结束）
+    
+    Returns:
+        包含 manifest、metadata_store、cache、format_cache、transcript_index、trimmer、segmenter、
+        backend、metrics 的字典，用完后调用 close_transcription_context
+    """
+    metrics = None
+    if not args.no_metrics and pipeline_metrics.active() is None:
+        metrics = pipeline_metrics.start_run(args.metrics_dir)
+    
+    manifest = None
+    if not args.no_manifest:
+        manifest_dir = os.path.dirname(args.manifest)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        manifest = RunManifest(args.manifest)
+    
+    metadata_store = MetadataStore(args.metadata_dir)
+    
+    cache = None
+    format_cache = None
+    if not args.no_cache:
+        cache = TranscriptCache(args.cache_dir, args.cache_max_mb * 1024 * 1024, refresh=args.refresh)
+        format_cache = FormatCache(args.format_cache_dir, args.format_cache_max_mb * 1024 * 1024,
+                                   refresh=args.refresh)
+    
+    transcript_index = None
+    if not args.no_transcript_index:
+        transcript_index = TranscriptIndex(args.transcript_index_dir)
+    
+    trimmer = None
+    if not args.no_vad:
+        trimmer = SilenceTrimmer(min_silence=args.vad_min_silence, keep_silence=args.vad_keep_silence)
+    
+    segmenter = None
+    if not args.no_segment:
+        segmenter = AudioSegmenter(segment_seconds=args.segment_minutes * 60, workers=args.segment_workers)
+    
+    backend = create_backend(args.backend,
+                             api_key=ASSEMBLYAI_API_KEY,
+                             async_client=args.pipeline and args.async_asr,
+                             model=args.local_model,
+                             engine=args.local_engine,
+                             workers=args.local_workers,
+                             threads=args.local_threads)
+    
+    return {
+        'manifest': manifest,
+        'metadata_store': metadata_store,
+        'cache': cache,
+        'format_cache': format_cache,
+        'transcript_index': transcript_index,
+        'trimmer': trimmer,
+        'segmenter': segmenter,
+        'backend': backend,
+        'metrics': metrics,
+    }
+
+def transcribe_links(links, args, context, temp_dir):
+    """
+    按参数以流水线或串行方式处理视频链接
+    
+    Args:
+        links: 视频链接，可以是搜索过程中逐个产生链接的可迭代对象
+        args: 命令行参数
+        context: open_transcription_context 返回的字典
+        temp_dir: 存放临时音频文件的目录
         
-        # 转录音频
-        transcript = transcribe_with_assemblyai(audio_file)
-        if not transcript:
-            print(f"转录失败: {audio_file}")
-            continue
+    Returns:
+        任务字典列表
+    """
+    punctuation_min_score = None if args.no_local_punctuation else args.punctuation_min_score
+    if args.pipeline:
+        return run_pipeline(links, temp_dir,
+                            download_workers=args.download_workers,
+                            transcribe_workers=args.transcribe_workers,
+                            format_workers=args.format_workers,
+                            queue_size=args.queue_size,
+                            cache=context['cache'],
+                            manifest=context['manifest'],
+                            audio_mode=args.audio_mode,
+                            metadata_store=context['metadata_store'],
+                            format_concurrency=args.format_concurrency,
+                            format_cache=context['format_cache'],
+                            transcript_index=context['transcript_index'],
+                            backend=context['backend'],
+                            trimmer=context['trimmer'],
+                            segmenter=context['segmenter'],
+                            punctuation_min_score=punctuation_min_score)
+    return process_links_serially(links, temp_dir, cache=context['cache'], manifest=context['manifest'],
+                                  audio_mode=args.audio_mode, metadata_store=context['metadata_store'],
+                                  format_concurrency=args.format_concurrency,
+                                  format_cache=context['format_cache'],
+                                  transcript_index=context['transcript_index'],
+                                  backend=context['backend'],
+                                  trimmer=context['trimmer'],
+                                  segmenter=context['segmenter'],
+                                  punctuation_min_score=punctuation_min_score)
+
+def close_transcription_context(context):
+    """关闭运行清单、全文索引和语音识别后端，打印缓存、静音裁剪和连接复用统计，写出运行指标"""
+    context['backend'].close()
+    if context['manifest'] is not None:
+        context['manifest'].close()
+    if context['transcript_index'] is not None:
+        context['transcript_index'].close()
+    
+    if context['cache'] is not None:
+        stats = context['cache'].stats()
+        print(f"转录缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+    if context['format_cache'] is not None:
+        stats = context['format_cache'].stats()
+        print(f"格式化缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+              f"命中率 {stats['hit_rate']:.0%}")
+    if context['trimmer'] is not None and context['trimmer'].stats()['files']:
+        stats = context['trimmer'].stats()
+        print(f"静音裁剪: 裁剪 {stats['trimmed']}/{stats['files']} 个音频，共移除 {stats['removed_seconds'] / 60:.1f} 分钟 "
+              f"(占 {stats['removed_share']:.1%})，节省上传 {stats['saved_bytes'] / 1024 / 1024:.1f} MB")
+    print_connection_stats()
+    if context['metrics'] is not None:
+        pipeline_metrics.finish_run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='下载并转录videos.txt中的视频')
+    add_transcription_arguments(parser)
+    parser.add_argument('--list-failures', action='store_true', help='列出运行清单中处理失败的链接后退出')
+    parser.add_argument('--retry-failures', action='store_true', help='只重试运行清单中处理失败的链接')
+    
+    args = parser.parse_args(argv)
+    validate_transcription_arguments(parser, args)
+    
+    # 使用AssemblyAI但未设置API密钥时，提示用户
+    if not args.list_failures and args.backend == 'assemblyai' and not ASSEMBLYAI_API_KEY:
+        print("警告: 未设置AssemblyAI API密钥。请编辑脚本设置你的API密钥。")
+        print("注册地址: https://www.assemblyai.com/ (有免费额度)")
+        return
+    
+    # 创建临时目录存放音频文件
+    temp_dir = "temp_audio"
+    
+    context = open_transcription_context(args)
+    try:
+        manifest = context['manifest']
+        
+        if args.list_failures:
+            failures = manifest.failures()
+            print(f"共有 {len(failures)} 个处理失败的链接")
+            for row in failures:
+                print(f"{row['link']}\t阶段: {row['stage'] or '未开始'}\t出错次数: {row['error_count']}\t{row['last_error']}")
+            return
+        
+        os.makedirs(temp_dir, exist_ok=True)
+        
+        # 确保输出目录存在
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        
+        if args.retry_failures:
+            links = [row['link'] for row in manifest.failures()]
+            print(f"重试 {len(links)} 个处理失败的链接")
+        else:
+            links = get_video_links()
+            print(f"找到 {len(links)} 个视频链接")
+        
+        # 按平台分类链接
+        youtube_links = []
+        douyin_links = []
+        unknown_links = []
+        
+        for link in links:
+            platform = identify_platform(link)
+            if platform == 'youtube':
+                youtube_links.append(link)
+            elif platform == 'douyin':
+                douyin_links.append(link)
+            else:
+                unknown_links.append(link)
         
-        # 使用DeepSeek添加标点符号
-        formatted_transcript = format_text_with_deepseek(transcript)
+        print(f"YouTube链接: {len(youtube_links)}个")
+        print(f"抖音链接: {len(douyin_links)}个")
+        if unknown_links:
+            print(f"未知平台链接: {len(unknown_links)}个 (这些链接将被跳过)")
         
-        # 保存为Markdown
-        md_file = save_to_markdown(formatted_transcript, title)
+        # 处理所有有效链接
+        valid_links = youtube_links + douyin_links
         
-        # 清理音频文件节省空间
-        if os.path.exists(audio_file):
-            os.remove(audio_file)
-            print(f"已删除临时音频文件: {audio_file}")
+        transcribe_links(valid_links, args, context, temp_dir)
+    finally:
+        close_transcription_context(context)
     
     # 清理临时目录
     if os.path.exists(temp_dir) and not os.listdir(temp_dir):